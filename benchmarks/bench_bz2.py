@@ -0,0 +1,89 @@
+"""Compare the sequential and the parallel decompression of a bz2 export
+
+Usage: python benchmarks/bench_bz2.py [--size MB] [--workers N] [--file PATH]
+
+Without '--file', a synthetic 'sentences_detailed'-like TSV is generated and
+compressed in memory.
+"""
+import argparse
+import bz2
+import random
+import time
+
+from tatoebatools.parallel_bz2 import iter_decompressed
+from tatoebatools.utils import CHUNK_SIZE, ChunkStream
+
+
+def make_export(size_mb, seed=0):
+    """Generate a tab-separated export of roughly this size"""
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(1, 9)))
+        for _ in range(20000)
+    ]
+    lines = []
+    size = 0
+    i = 0
+    while size < size_mb * 1024 * 1024:
+        i += 1
+        text = " ".join(rng.choices(words, k=rng.randint(3, 15)))
+        line = f"{i}\teng\t{text}\tuser{i % 997}\t2020-05-22 11:51:00\t\\N\n"
+        lines.append(line)
+        size += len(line)
+
+    return "".join(lines).encode("utf-8")
+
+
+def iter_chunks(data):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i : i + CHUNK_SIZE]
+
+
+def read_all(stream):
+    size = 0
+    while True:
+        data = stream.read(CHUNK_SIZE)
+        if not data:
+            return size
+        size += len(data)
+
+
+def bench(name, func, compressed):
+    start = time.perf_counter()
+    size = func(compressed)
+    elapsed = time.perf_counter() - start
+    speed = size / elapsed / 1024 / 1024
+    print(f"{name:<12} {elapsed:7.2f} s {speed:8.1f} MB/s")
+
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--file", default=None)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            compressed = f.read()
+    else:
+        compressed = bz2.compress(make_export(args.size))
+    print(f"compressed size: {len(compressed) / 1024 / 1024:.1f} MB")
+
+    def sequential(data):
+        stream = ChunkStream(iter_chunks(data), bz2.BZ2Decompressor)
+        return read_all(stream)
+
+    def parallel(data):
+        chunks = iter_decompressed(iter_chunks(data), workers=args.workers)
+        return read_all(ChunkStream(chunks))
+
+    size_seq = bench("sequential", sequential, compressed)
+    size_par = bench("parallel", parallel, compressed)
+    assert size_seq == size_par
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Compare the csv row path and the block parser of the data files
+
+Usage: python benchmarks/bench_parser.py [--size MB] [--file PATH]
+
+Without '--file', a synthetic 'sentences_detailed'-like TSV is generated.
+The row path is the csv reader and multiline row merger that the row
+iterator of the data files used before the block parser.
+"""
+import argparse
+import csv
+import random
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from tatoebatools.datafile import DataFile
+
+# the 'sentences_detailed' tables have no text column
+NB_COLS = 6
+TEXT_COL = None
+
+
+def make_export(size_mb, seed=0):
+    """Generate a tab-separated export of roughly this size"""
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(1, 9)))
+        for _ in range(20000)
+    ]
+    lines = []
+    size = 0
+    i = 0
+    while size < size_mb * 1024 * 1024:
+        i += 1
+        text = " ".join(rng.choices(words, k=rng.randint(3, 15)))
+        line = f"{i}\teng\t{text}\tuser{i % 997}\t2020-05-22 11:51:00\t\\N\n"
+        lines.append(line)
+        size += len(line)
+
+    return "".join(lines)
+
+
+class CsvRows:
+    """The former row iterator of the data files: a csv reader followed by
+    the merger of the rows split over several lines
+    """
+
+    def __init__(self, f, nb_cols, text_col):
+        self._rd = csv.reader(
+            f, delimiter="\t", escapechar="\\", quoting=csv.QUOTE_NONE
+        )
+        self._nc = nb_cols
+        self._tc = text_col
+        self._wr = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        next_row = self._wr
+        try:
+            if not next_row:
+                next_row = next(self._rd)
+            row_cnt = 1
+            while True:
+                self._wr = next(self._rd)
+                if len(next_row) - row_cnt + len(self._wr) <= self._nc:
+                    next_row.extend(self._wr)
+                    row_cnt += 1
+                else:
+                    break
+        except StopIteration:
+            self._wr = None
+            raise StopIteration
+        finally:
+            if next_row:
+                nb_extra_cols = len(next_row) - self._nc
+                if nb_extra_cols > 0 and self._tc is not None:
+                    j = self._tc + nb_extra_cols + 1
+                    next_row[self._tc] = " ".join(next_row[self._tc : j])
+                    del next_row[self._tc + 1 : j]
+                if len(next_row) == self._nc:
+                    return next_row
+
+
+def bench(name, func, size):
+    start = time.perf_counter()
+    nb_rows = func()
+    elapsed = time.perf_counter() - start
+    speed = size / elapsed / 1024 / 1024
+    print(f"{name:<12} {elapsed:7.2f} s {speed:8.1f} MB/s {nb_rows} rows")
+
+    return nb_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--file", default=None)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp_dir:
+        if args.file:
+            fp = Path(args.file)
+        else:
+            fp = Path(tmp_dir, "eng_sentences_detailed.tsv")
+            fp.write_text(make_export(args.size), encoding="utf-8")
+        size = fp.stat().st_size
+        print(f"data size: {size / 1024 / 1024:.1f} MB")
+
+        def csv_rows():
+            with open(fp, encoding="utf-8") as f:
+                return sum(1 for _ in CsvRows(f, NB_COLS, TEXT_COL))
+
+        def block_rows():
+            dfile = DataFile(fp, nb_cols=NB_COLS, text_col=TEXT_COL)
+            return sum(1 for _ in dfile)
+
+        def block_batches():
+            dfile = DataFile(fp, nb_cols=NB_COLS, text_col=TEXT_COL)
+            return sum(len(cols[0]) for cols in dfile.iter_batches())
+
+        nb_csv = bench("csv rows", csv_rows, size)
+        nb_rows = bench("block rows", block_rows, size)
+        nb_batches = bench("batches", block_batches, size)
+        assert nb_csv == nb_rows == nb_batches
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,7 @@ setuptools.setup(
     install_requires=[
         "beautifulsoup4>=4.12.2",
         "importlib-resources>=6.1.1;python_version<'3.9'",
+        "numpy>=1.20.3",
         "pandas>=2.0.3",
         "requests>=2.31.0",
         "SQLAlchemy>=2.0.23",
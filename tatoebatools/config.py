@@ -22,6 +22,28 @@ from .utils import list_attributes
 
 DATA_DIR = files(__package__).joinpath("data")
 
+# maximum number of files downloaded concurrently during an update
+DOWNLOAD_WORKERS = 4
+# maximum number of concurrent downloads from a same host
+DOWNLOAD_WORKERS_PER_HOST = 2
+# maximum number of concurrent requests when checking for updates
+CHECK_WORKERS = 8
+# maximum number of processes splitting a large data file during an update
+SPLIT_WORKERS = 1
+# whether the changes of the updated data files are found during an update
+PRECOMPUTE_DIFFS = False
+# maximum number of processes finding the changes of data files at once
+DIFF_WORKERS = 1
+# whether the rows of the updated data files are indexed by id during an
+# update, rather than when they are first read by id
+PRECOMPUTE_INDEXES = False
+# time in seconds after which a cached export listing is requested again
+LISTING_TTL = 5 * 60
+# time in seconds during which a datafile is not checked again for updates
+UPDATE_MAX_AGE = 60 * 60
+# time in seconds between two Tatoeba exports
+EXPORT_INTERVAL = 7 * 24 * 60 * 60
+
 SUPPORTED_TABLES = (
     "sentences_base",
     "sentences_detailed",
@@ -51,6 +73,20 @@ DIFFERENCE_TABLES = (
     "user_languages",
 )
 
+# the tables whose rows start with an id by which they can be read
+INDEXED_TABLES = (
+    "sentences_base",
+    "sentences_detailed",
+    "sentences_CC0",
+    "transcriptions",
+    "links",
+    "tags",
+    "user_lists",
+    "sentences_in_lists",
+    "jpn_indices",
+    "sentences_with_audio",
+)
+
 TABLE_CLASSES = {
     "sentences_base": SentenceBase,
     "sentences_detailed": SentenceDetailed,
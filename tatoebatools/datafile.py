@@ -1,17 +1,53 @@
+import copy
 import csv
+import gzip
 import logging
+import mmap
 import re
+import shutil
+from collections import OrderedDict
+from contextlib import ExitStack
 from io import StringIO, TextIOBase
+from itertools import chain, compress, islice
 from pathlib import Path
+from tempfile import TemporaryDirectory
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from .utils import get_byte_size, get_extended_name
+from .delta import DeltaLog
+from .diff import UnsortedRows, iter_changes, sort_rows
+from .generation import get_logical_path, new_generation, resolve_path
+from .index import Index
+from .parser import (
+    BATCH_SIZE,
+    BLOCK_SIZE,
+    ChunkedStream,
+    CleanedStream,
+    clean_text,
+    find_row_start,
+    iter_batches,
+    iter_repaired_text,
+    iter_rows,
+)
+from .snapshot import (
+    Snapshot,
+    diff_fingerprints,
+    get_fingerprints,
+    select_rows,
+)
+from .utils import get_extended_name, new_process_pool
 from .version import version
 
 logger = logging.getLogger(__name__)
 
+# the maximum number of split files open at once
+SPLIT_MAX_OPEN_FILES = 64
+# the minimum and maximum byte sizes of the ranges split in parallel
+SPLIT_MIN_RANGE_SIZE = 1024 * 1024
+SPLIT_MAX_RANGE_SIZE = 64 * 1024 * 1024
+
 
 def reset_pos(func):
     """Decorator for reseting previous position in file-like object
@@ -100,6 +136,15 @@ class DataFile:
         self._na = na_values
         self._tc = text_col
         self._nc = nb_cols
+        self._ee = encoding_errors
+        # the filters applied to the rows while they are read
+        self._rfs = []
+        # the data file whose file object is read, if not this one
+        self._parent = None
+        # the dataframe of an in-memory data file, read without writing it
+        self._df = None
+        # the index of the rows by id, once read
+        self._index = None
 
         if isinstance(file_path_or_data, Path):
             try:
@@ -119,22 +164,14 @@ class DataFile:
                 self._fp = None
             else:
                 self._fp = Path(file_path_or_data)
-        elif isinstance(file_path_or_data, pd.DataFrame):
-            self._f = StringIO()
-            file_path_or_data.to_csv(
-                self._f,
-                sep=self._dm,
-                doublequote=self._dq,
-                escapechar=self._ec,
-                quoting=self._qt,
-                quotechar=self._qc,
-                lineterminator=self._lt,
-                na_rep=self._na[0] if self._na else "",
-                header=None,
-                index=False,
-            )
-            self._f.seek(0)
+        elif isinstance(file_path_or_data, pd.DataFrame):  # in-memory data
             self._fp = None
+            if self._nc and file_path_or_data.shape[1] != self._nc:
+                # the rows are repaired like those of a text file
+                self._f = self._get_frame_buffer(file_path_or_data)
+            else:
+                self._df = file_path_or_data
+                self._f = None
         elif isinstance(file_path_or_data, TextIOBase):  # file-like scenario
             self._f = file_path_or_data
             self._f.seek(0)
@@ -144,88 +181,47 @@ class DataFile:
             raise TypeError(f"{data_type} is not a valid 'file_path_or_data'")
 
         # clean file buffer from known problematic characters
-        if self._tc:
-            self._f = self._get_cleaned_file_buffer()
+        if self._tc and self._f:
+            self._f = CleanedStream(self._f, delimiter=self._dm)
 
-        # init 'raw row' iterator
-        self._rd = csv.reader(
-            self._f,
-            delimiter=self._dm,
-            doublequote=self._dq,
-            escapechar=self._ec,
-            quoting=self._qt,
-            quotechar=self._qc,
-            lineterminator=self._lt,
-        )
-        # init 'working row' value buffer
-        self._wr = []
+        # init row iterator
+        self._rows = iter_rows(self.iter_batches())
 
     def __del__(self):
-        if self._f:
+        if getattr(self, "_f", None) and self._parent is None:
             self._f.close()
 
     def __iter__(self):
-        self.pos = 0
+        self._rows = iter_rows(self.iter_batches())
 
         return self
 
     def __next__(self):
-        next_row = self._wr
-        try:
-            if not next_row:  # first line
-                next_row = next(self._rd)
-            row_cnt = 1
-            while True:
-                self._wr = next(self._rd)
-                if (
-                    self._nc
-                    and len(next_row) - row_cnt + len(self._wr) <= self._nc
-                ):  # cat multiline row
-                    next_row.extend(self._wr)
-                    row_cnt += 1
-                else:
-                    break
-        except StopIteration:
-            self._wr = None
-            raise StopIteration
-        finally:
-            if not next_row:  # reset pos at the end
-                self.pos = 0
-            else:
-                if not self._nc:
-                    return next_row
-                else:
-                    nb_extra_cols = len(next_row) - self._nc
-                    if nb_extra_cols > 0:  # field merger required
-                        try:
-                            i = self._tc
-                            j = i + nb_extra_cols + 1
-                        except TypeError:
-                            msg = f"{self._fp.name} needs a text column"
-                            logger.debug(msg)
-                        else:  # remove all delimiters from text field
-                            next_row[i] = " ".join(next_row[i:j])
-                            del next_row[i + 1 : j]
-
-                    if len(next_row) == self._nc:
-                        return next_row
-                    else:
-                        msg = f"bad row in {self.path.name}: {next_row}"
-                        logger.debug(msg)
+        return next(self._rows)
 
     @reset_pos
     def __str__(self):
+        if self._rfs:
+            fb = StringIO()
+            self._write_rows(fb)
+            return fb.getvalue()
+        elif self._df is not None:
+            fb = StringIO()
+            self._write_frame(fb)
+            return fb.getvalue()
+
         return self._f.read()
 
     @property
     def pos(self):
         """Get the current position in this datafile"""
-        return self._f.tell()
+        return self._f.tell() if self._f else 0
 
     @pos.setter
     def pos(self, new_pos):
         """Set the position in this datafile"""
-        self._f.seek(new_pos)
+        if self._f:
+            self._f.seek(new_pos)
 
     @reset_pos
     def as_dataframe(self, **parameters):
@@ -246,29 +242,84 @@ class DataFile:
         }
         params.update(**parameters)
 
-        if self._tc:  # fix file buffer when risk of multiline rows
-            self._f = self._get_fixed_file_buffer()
+        if self._df is not None:
+            dframe = self._read_frame(params)
+            if dframe is not None:
+                return dframe
+            self._load_frame_text()
+
+        if self._rfs:  # the rows are filtered like by the row iterator
+            f = ChunkedStream(self._iter_filtered_text())
+        elif self._tc:  # fix file buffer when risk of multiline rows
+            f = self._get_repaired_file()
+        else:
+            f = self._f
 
         try:
-            df = pd.read_csv(self._f, **params)
+            df = pd.read_csv(f, **params)
         except pd.errors.EmptyDataError:
             col_names = params.get("usecols", params["names"])
             return pd.DataFrame(columns=col_names)
         else:
             return df
 
+    def iter_batches(self, block_size=BLOCK_SIZE):
+        """Iterate over this data file by batches of columns, from its
+        beginning. Large blocks of rows are split into columns at once,
+        which is faster than parsing the rows one by one. The rows of an
+        in-memory data file are read from its dataframe by batches of
+        BATCH_SIZE rows.
+
+        Parameters
+        ----------
+        block_size : int, optional
+            the number of characters parsed at once, by default BLOCK_SIZE
+
+        Yields
+        ------
+        list
+            the columns of a batch of rows, each column being a list of
+            fields
+        """
+        if self._df is not None:
+            batches = self._iter_frame_batches()
+        else:
+            self.pos = 0
+            batches = self._parse_batches(self._f, block_size=block_size)
+        if self._rfs:
+            batches = filter(None, map(self._filter_columns, batches))
+
+        yield from batches
+
+    def iter_rows(self):
+        """Iterate over the rows of this data file from its beginning,
+        independently from the row iterator of the data file itself
+        """
+        return iter_rows(self.iter_batches())
+
     def exists(self):
         """Check if this data file exists locally"""
         return self._fp and self._fp.is_file()
 
     def save(self, to_path=None, version=None):
-        """Save this data file to local path and update the file
-        storing version datetimes
+        """Save this data file as a new generation of the file at this local
+        path and update the file storing version datetimes
         """
         if to_path:
             self._fp = to_path
-        with open(self._fp, "w", encoding="utf-8") as f:
-            f.write(self._f.getvalue())
+        logical_path = get_logical_path(self._fp)
+        with new_generation(
+            logical_path, tag=version, keep_old=False
+        ) as gen_path:
+            with open(gen_path, "w", encoding="utf-8") as f:
+                if self._rfs:
+                    self._write_rows(f)
+                elif self._df is not None:
+                    self._write_frame(f)
+                else:
+                    self.pos = 0
+                    shutil.copyfileobj(self._f, f)
+        self._fp = resolve_path(logical_path)
         if version:
             self.version = version
 
@@ -292,49 +343,23 @@ class DataFile:
             nb_cols=len(usecols),
         )
 
-    @reset_pos
     def extract_rows(self, row_filters):
         """Extract those rows from this data file
         A row filter is a dict containing:
         'col_index': the column for which the rows are filtered by value
         'ok_values': the allowed values in the filter column
         'converter' (optional): a converter applied to the filter column
+
+        The rows are filtered while they are read. The returned data file
+        reads the file object of this one.
         """
         if row_filters:
-            fb = StringIO()
-            wt = csv.writer(
-                fb,
-                delimiter=self._dm,
-                doublequote=self._dq,
-                escapechar=self._ec,
-                quoting=self._qt,
-                quotechar=self._qc,
-                lineterminator=self._lt,
-            )
-            for row in self:
-                try:
-                    for flt in row_filters:
-                        field = row[flt["col_index"]]
-                        if flt.get("converter"):
-                            field = flt["converter"](field)
-                        assert field in flt["ok_values"]
-                except AssertionError:
-                    continue
-                else:
-                    wt.writerow(row)
-            fb.seek(0)
+            dfile = copy.copy(self)
+            dfile._rfs = self._rfs + list(row_filters)
+            dfile._parent = self
+            dfile._rows = iter_rows(dfile.iter_batches())
 
-            return DataFile(
-                fb,
-                delimiter=self._dm,
-                doublequote=self._dq,
-                escapechar=self._ec,
-                quoting=self._qt,
-                quotechar=self._qc,
-                lineterminator=self._lt,
-                text_col=self._tc,
-                nb_cols=self._nc,
-            )
+            return dfile
 
         return self
 
@@ -366,99 +391,346 @@ class DataFile:
             nb_cols=self._nc,
         )
 
-    def find_changes(self, verbose=True, save=True):
+    def find_changes(
+        self, verbose=True, save=True, modified=False, since=None
+    ):
         """Find 'added' and 'removed' rows to this data file
         compared to its former local version (if any)
+
+        When the former version was replaced by its snapshot, the
+        fingerprints of the rows of both versions are compared first, then
+        only the changed rows are read again. Otherwise, both versions are
+        walked in the order of their leading id column and the rows of each
+        id are compared. Either way, the memory used does not depend on the
+        size of the files. Changes whose rows are not sorted by id are
+        sorted on disk first.
+
+        Parameters
+        ----------
+        verbose : bool, optional
+            whether the search is logged, by default True
+        save : bool, optional
+            whether the difference files are saved next to this data file
+            rather than kept in memory, by default True
+        modified : bool, optional
+            whether an id whose single row changed is found as a 'modified'
+            row rather than a 'removed' and an 'added' one, by default False
+        since : datetime, optional
+            the datetime of an older local version to compare this data
+            file to, whose changes were logged by the updates that followed
+            it. The differences are then kept in memory. By default None
+            (former local version)
+
+        Raises
+        ------
+        NotStoredVersion
+            when the changes since this datetime were not logged
         """
-        fname_old = get_extended_name(self.path, "old")
-        dfile_old = DataFile(
-            self.path.parent.joinpath(fname_old),
-            delimiter=self._dm,
-            doublequote=self._dq,
-            escapechar=self._ec,
-            quoting=self._qt,
-            quotechar=self._qc,
-            lineterminator=self._lt,
-            text_col=self._tc,
-            nb_cols=self._nc,
-        )
+        logical_path = get_logical_path(self.path)
+        fname_old = get_extended_name(logical_path, "old")
+        path_old = self._get_old_path()
+        snapshot_old = Snapshot(path_old)
         diffs = {}
-        if all(x.exists() for x in (self, dfile_old)):
-            if verbose:
-                msg = f"finding changes in {self.path.name}"
-                logger.info(msg)
+        if not self.exists():
+            return diffs
+        elif since is not None:
+            get_rows = self._get_logged_rows(since)
+            save = False
+        elif snapshot_old.exists():
+            get_rows = self._get_changed_rows(snapshot_old)
+        elif path_old.is_file():
+            dfile_old = DataFile(path_old, **self._get_params())
+
+            def get_rows():
+                return dfile_old.iter_rows(), self.iter_rows()
+
+        else:
+            return diffs
+        if verbose:
+            msg = f"finding changes in {self.path.name}"
+            logger.info(msg)
+
+        tags = ["added", "removed"] + (["modified"] if modified else [])
+        paths = {
+            tag: logical_path.with_name(get_extended_name(logical_path, tag))
+            for tag in tags
+        }
+        dfile_version = self.version if save else None
+        with ExitStack() as stack:
+            files = {}
+            for tag in tags:
+                if save:  # save difference files in the same directory
+                    gen_path = stack.enter_context(
+                        new_generation(
+                            paths[tag], tag=dfile_version, keep_old=False
+                        )
+                    )
+                    files[tag] = stack.enter_context(
+                        open(gen_path, "w", encoding="utf-8", newline="")
+                    )
+                else:
+                    files[tag] = StringIO()
+            writers = {tag: self._get_writer(f) for tag, f in files.items()}
             try:
-                merger = pd.merge(
-                    dfile_old.as_dataframe(),
-                    self.as_dataframe(),
-                    how="outer",
-                    indicator=True,
-                )
-            except pd.errors.MergeError:
-                msg = f"merger of {self._fp.name} with {fname_old} failed"
-                logger.warning(msg, exc_info=True)
-            else:
-                tags = {"added": "right_only", "removed": "left_only"}
-                for k, v in tags.items():
-                    mask = merger["_merge"] == v
-                    diff_df = merger.loc[mask].drop(columns="_merge")
-                    diffs[k] = DataFile(
-                        diff_df,
-                        delimiter=self._dm,
-                        doublequote=self._dq,
-                        escapechar=self._ec,
-                        quoting=self._qt,
-                        quotechar=self._qc,
-                        lineterminator=self._lt,
-                        text_col=self._tc,
-                        nb_cols=self._nc,
+                _write_changes(*get_rows(), writers, modified)
+            except UnsortedRows as e:
+                logger.debug(f"{e}, sorting the rows of {fname_old}")
+                for f in files.values():
+                    f.seek(0)
+                    f.truncate()
+                tmp_dir = Path(
+                    stack.enter_context(
+                        TemporaryDirectory(
+                            prefix=".sort-", dir=logical_path.parent
+                        )
                     )
-                if save:  # save difference files in the same directory
-                    for tag, dfile in diffs.items():
-                        fname = get_extended_name(self.path, tag)
-                        fpath = self.path.parent.joinpath(fname)
-                        dfile.save(to_path=fpath, version=self.version)
+                )
+                old_rows, new_rows = get_rows()
+                for name in ("old", "new"):
+                    tmp_dir.joinpath(name).mkdir()
+                _write_changes(
+                    sort_rows(old_rows, tmp_dir / "old"),
+                    sort_rows(new_rows, tmp_dir / "new"),
+                    writers,
+                    modified,
+                )
+        if dfile_version:
+            with version.transaction():
+                for fp in paths.values():
+                    version[fp.stem] = dfile_version
+
+        for tag, f in files.items():
+            diffs[tag] = DataFile(
+                resolve_path(paths[tag]) if save else f,
+                delimiter=self._dm,
+                doublequote=self._dq,
+                escapechar=self._ec,
+                quoting=self._qt,
+                quotechar=self._qc,
+                lineterminator=self._lt,
+                text_col=self._tc,
+                nb_cols=self._nc,
+            )
 
         return diffs
 
+    def take_snapshot(self):
+        """Take the snapshot of this data file, so that its future versions
+        can be compared to it once it is not kept anymore
+        """
+        fingerprints = get_fingerprints(self.iter_batches())
+        Snapshot(self._fp).write(fingerprints, self._fp)
+
+    def log_changes(self):
+        """Log the changes of this data file since the snapshot of its
+        former version, so that they can be found later since any logged
+        version. The log starts again from this version when there is no
+        snapshot to compare it to.
+        """
+        log = DeltaLog(get_logical_path(self._fp))
+        head = log.head
+        dfile_version = self.version
+        if not dfile_version or head == dfile_version:
+            return
+        snapshot_old = Snapshot(self._get_old_path())
+        snapshot = Snapshot(self._fp)
+        if (
+            head is None
+            or head > dfile_version
+            or not snapshot_old.exists()
+            or not snapshot.exists()
+        ):
+            log.reset(dfile_version)
+            return
+
+        removed, added = diff_fingerprints(
+            snapshot_old.fingerprints, snapshot.fingerprints
+        )
+        dfile_old = DataFile(
+            snapshot_old.open_rows(self._ee), **self._get_params()
+        )
+        with log.append(dfile_version, removed, added) as f:
+            writer = self._get_writer(f)
+            writer.writerows(select_rows(dfile_old.iter_batches(), removed))
+
+    def record_no_changes(self):
+        """Record that this data file has not changed since its former
+        version: its difference files are empty and an empty delta is
+        logged for its current version
+        """
+        logical_path = get_logical_path(self._fp)
+        dfile_version = self.version
+        if not dfile_version:
+            return
+        paths = [
+            logical_path.with_name(get_extended_name(logical_path, tag))
+            for tag in ("added", "removed")
+        ]
+        for fp in paths:
+            with new_generation(
+                fp, tag=dfile_version, keep_old=False
+            ) as gen_path:
+                gen_path.touch()
+        with version.transaction():
+            for fp in paths:
+                version[fp.stem] = dfile_version
+
+        log = DeltaLog(logical_path)
+        head = log.head
+        if head and head < dfile_version:
+            with log.append(dfile_version, {}, {}):
+                pass
+
+    def release_old(self):
+        """Remove the full copy of the former version of this data file if
+        it was replaced by its snapshot
+        """
+        path_old = self._get_old_path()
+        if Snapshot(path_old).exists():
+            path_old.unlink(missing_ok=True)
+
+    def build_index(self):
+        """Build the index of the rows of this data file by id, so that they
+        are read without parsing the whole file
+        """
+        Index(self._fp).build(delimiter=self._dm, escapechar=self._ec)
+        self._index = None
+
+    def get_rows(self, ids):
+        """Get the rows of these ids, found in their first column
+
+        The rows of a local data file are read at their byte offsets, found
+        in the index of the file, which is built first if it is missing. The
+        rows of other data files are searched through all their rows.
+
+        Parameters
+        ----------
+        ids : list
+            the ids of the rows
+
+        Returns
+        -------
+        list
+            the rows found, by id in the order of these ids
+        """
+        ids = list(dict.fromkeys(int(i) for i in ids))
+        if self._is_indexable():
+            return self._read_entries(self._get_index().find(ids))
+
+        wanted = set(ids)
+        rows_by_id = {}
+        for row in self.iter_rows():
+            row_id = _get_row_id(row)
+            if row_id in wanted:
+                rows_by_id.setdefault(row_id, []).append(row)
+
+        return [row for i in ids for row in rows_by_id.get(i, [])]
+
+    def slice_rows(self, offset, limit=None):
+        """Get the rows between these positions in the order of their ids
+
+        The rows of a local data file are read through its index. The rows
+        of other data files, or of a data file whose rows are filtered, are
+        read in their order in the file.
+
+        Parameters
+        ----------
+        offset : int
+            the position of the first row
+        limit : int, optional
+            the maximum number of rows, by default None (no limit)
+
+        Returns
+        -------
+        list
+            the rows between these positions
+        """
+        stop = None if limit is None else offset + limit
+        if self._is_indexable() and not self._rfs:
+            return self._read_entries(self._get_index().slice(offset, stop))
+
+        return list(islice(self.iter_rows(), offset, stop))
+
     @reset_pos
-    def split(self, columns=[], verbose=True, save=True):
-        """Split the file according to these columns' values"""
+    def split(self, columns=[], verbose=True, save=True, max_workers=1):
+        """Split the file according to these columns' values
+
+        The rows are appended to the split files batch by batch, through a
+        limited number of open files, so that the memory used does not
+        depend on the size of this data file.
+
+        With several workers, the file is cut into byte ranges of whole rows
+        that worker processes split at once. The parts of a split file are
+        then joined in the order of the ranges, so that the split files are
+        the same whatever the number of workers.
+
+        Parameters
+        ----------
+        columns : list, optional
+            the columns whose values name the split file of a row
+        verbose : bool, optional
+            whether the progress of the split is shown, by default True
+        save : bool, optional
+            whether the split files are saved next to this data file rather
+            than kept in memory, by default True
+        max_workers : int, optional
+            the maximum number of processes splitting this data file at
+            once, by default 1
+        """
         if verbose:
             logger.info(f"splitting {self._fp.name}")
             pbar = tqdm(total=self.size, unit="iB", unit_scale=True)
         else:
             pbar = None
 
-        buffer = {}
-        for row in self:
-            try:
-                fields = [row[col] for col in columns]
-            except IndexError:
-                logger.debug(f"missing column(s) {columns} in {row}")
+        # the parts of the split files are written next to this file
+        tmp_parent = get_logical_path(self._fp).parent if self._fp else None
+        with ExitStack() as stack:
+            tmp_dir = Path(
+                stack.enter_context(
+                    TemporaryDirectory(prefix=".split-", dir=tmp_parent)
+                )
+            )
+            ranges = self._get_split_ranges(max_workers)
+            if len(ranges) > 1:
+                parts = self._split_ranges(
+                    ranges, columns, tmp_dir, max_workers, pbar
+                )
             else:
-                if all(fields):
-                    # classify the rows
-                    fname = self._get_out_filename(fields)
-                    fb = buffer.setdefault(fname, StringIO())
-                    wt = csv.writer(
-                        fb,
-                        delimiter=self._dm,
-                        doublequote=self._dq,
-                        escapechar=self._ec,
-                        quoting=self._qt,
-                        quotechar=self._qc,
-                        lineterminator=self._lt,
+                fnames = self._split_rows(columns, tmp_dir, pbar=pbar)
+                parts = {fname: [tmp_dir.joinpath(fname)] for fname in fnames}
+
+            if save:  # new generations of the split files are written
+                logical_path = get_logical_path(self._fp)
+                tag = self.version
+                splits = []
+                for fname, part_paths in parts.items():
+                    fp = logical_path.with_name(fname)
+                    gen_path = stack.enter_context(
+                        new_generation(fp, tag=tag, keep_old=False)
+                    )
+                    _join_files(part_paths, gen_path)
+                    splits.append(fp)
+            else:  # the split files are kept in memory
+                splits = [
+                    StringIO(
+                        "".join(fp.read_text(encoding="utf-8") for fp in fps)
                     )
-                    wt.writerow(row)
+                    for fps in parts.values()
+                ]
+        if save:  # the generations of the split files are published
+            if tag:
+                with version.transaction():
+                    for fp in splits:
+                        version[fp.stem] = tag
+            splits = [resolve_path(fp) for fp in splits]
 
-            if pbar:  # imcrement progress bar by the byte size of the row
-                pbar.update(get_byte_size(row, self._dm, self._lt))
+        if pbar:
+            pbar.close()
 
-        splits = []
-        for fname, fb in buffer.items():
-            split = DataFile(
-                fb,
+        return [
+            DataFile(
+                fp,
                 delimiter=self._dm,
                 doublequote=self._dq,
                 escapechar=self._ec,
@@ -468,41 +740,283 @@ class DataFile:
                 text_col=self._tc,
                 nb_cols=self._nc,
             )
-            if save:  # save split files in the same parent directory
-                try:
-                    split.save(
-                        to_path=self._fp.parent.joinpath(fname),
-                        version=self.version,
+            for fp in splits
+        ]
+
+    def _get_changed_rows(self, snapshot_old):
+        """Compare the fingerprints of the rows of this data file to those
+        of the snapshot of its former version
+
+        Returns
+        -------
+        function
+            the function getting iterators over the 'removed' rows of the
+            former version and over the 'added' rows of this data file
+        """
+        snapshot = Snapshot(self._fp)
+        if snapshot.exists():  # taken when this data file was updated
+            fingerprints = snapshot.fingerprints
+        else:
+            fingerprints = get_fingerprints(self.iter_batches())
+        removed, added = diff_fingerprints(
+            snapshot_old.fingerprints, fingerprints
+        )
+        dfile_old = DataFile(
+            snapshot_old.open_rows(self._ee), **self._get_params()
+        )
+
+        def get_rows():
+            return (
+                select_rows(dfile_old.iter_batches(), removed),
+                select_rows(self.iter_batches(), added),
+            )
+
+        return get_rows
+
+    def _get_logged_rows(self, since):
+        """Sum the changes logged since this datetime
+
+        Returns
+        -------
+        function
+            the function getting iterators over the 'removed' rows of the
+            logged version and over the 'added' rows of this data file
+        """
+        removed, added, rows_paths = DeltaLog(
+            get_logical_path(self._fp)
+        ).get_changes(since)
+        params = self._get_params()
+
+        def get_rows():
+            batches = chain.from_iterable(
+                DataFile(
+                    gzip.open(fp, "rt", encoding="utf-8", errors=self._ee),
+                    **params,
+                ).iter_batches()
+                for fp in rows_paths
+            )
+            return (
+                select_rows(batches, removed),
+                select_rows(self.iter_batches(), added),
+            )
+
+        return get_rows
+
+    def _get_old_path(self):
+        """Get the path of the former version of this data file"""
+        logical_path = get_logical_path(self._fp)
+        fname_old = get_extended_name(logical_path, "old")
+
+        return resolve_path(logical_path.with_name(fname_old))
+
+    def _is_indexable(self):
+        """Check if the rows of this data file can be read through an index
+        of their byte offsets
+        """
+        return (
+            self.exists()
+            and self._df is None
+            and self._qt == csv.QUOTE_NONE
+            and self._lt == "\n"
+        )
+
+    def _get_index(self):
+        """Get the index of the rows of this data file by id, built first if
+        it is missing or older than the file. The index is kept once read.
+        """
+        if self._index is None:
+            index = Index(self._fp)
+            if not index.exists():
+                self.build_index()
+            self._index = index
+
+        return self._index
+
+    def _read_entries(self, entries):
+        """Read the rows at the byte offsets and sizes of these entries of
+        the index of this data file, with the row filters of this data file
+        """
+        if not entries.shape[1]:
+            return []
+        with open(self._fp, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                blocks = [
+                    mm[offset : offset + size]
+                    for offset, size in zip(
+                        entries[1].tolist(), entries[2].tolist()
                     )
-                except FileNotFoundError:
-                    logger.debug("split saving failed", exc_info=True)
-                    continue
-            splits.append(split)
+                ]
+        # the last row of the file may lack its line terminator
+        data = b"".join(
+            block if block.endswith(b"\n") else block + b"\n"
+            for block in blocks
+        )
+        text = data.decode("utf-8", errors=self._ee or "strict")
+        if self._tc:  # cleaned like the stream of the file
+            text = clean_text(text, delimiter=self._dm)
+        batches = self._parse_batches(StringIO(text))
+        if self._rfs:
+            batches = filter(None, map(self._filter_columns, batches))
+        # the lines that do not start a row are read with the row before
+        wanted = set(entries[0].tolist())
 
-        if pbar:
-            pbar.close()
+        return [
+            row for row in iter_rows(batches) if _get_row_id(row) in wanted
+        ]
 
-        return splits
-
-    def _get_cleaned_file_buffer(self):
-        """Clean known problematic characters from the file objext"""
-        file_content = self._f.read()
-        # multiline 'details' fields in 'user_languages' table have escaped
-        # new lines that can be removed
-        file_content = re.sub(r"\n\\\n", "  ", file_content)
-        # the 'list_name' field of the 'user_lists' table may have escaped
-        # tab delimiter that can be removed
-        file_content = re.sub(r"\\" + self._dm + r"+", " ", file_content)
-        fb = StringIO()
-        fb.write(file_content)
-        fb.seek(0)
-        return fb
+    def _parse_batches(self, f, block_size=BLOCK_SIZE):
+        """Parse this text file object by batches of columns, with the
+        dialect of this data file
+        """
+        return iter_batches(
+            f,
+            delimiter=self._dm,
+            escapechar=self._ec,
+            quoting=self._qt,
+            nb_cols=self._nc,
+            text_col=self._tc,
+            block_size=block_size,
+            doublequote=self._dq,
+            quotechar=self._qc,
+            lineterminator=self._lt,
+        )
 
-    def _get_fixed_file_buffer(self):
-        """Try to fix multiline rows found into the file objext"""
-        fb = StringIO()
-        wt = csv.writer(
-            fb,
+    def _split_rows(self, columns, out_dir, stem=None, pbar=None):
+        """Append the rows of this data file to the split files of this
+        directory
+
+        Returns
+        -------
+        list
+            the names of the split files, in their order of appearance
+        """
+        fnames = {}
+        split_files = _SplitFiles()
+        try:
+            read_size = 0
+            for batch in self.iter_batches():
+                for fname, text in self._split_batch(batch, columns, stem):
+                    fnames[fname] = None
+                    split_files.write(out_dir.joinpath(fname), text)
+
+                if pbar:  # increment progress bar by the bytes read
+                    new_read_size = self._get_read_size()
+                    pbar.update(new_read_size - read_size)
+                    read_size = new_read_size
+        finally:
+            split_files.close()
+
+        return list(fnames)
+
+    def _get_split_ranges(self, max_workers):
+        """Get the byte ranges of whole rows of this data file that can be
+        split in parallel. A single range is returned when the file is too
+        small or when its rows cannot be told apart without parsing it.
+        """
+        size = self.size
+        nb_ranges = min(
+            size // SPLIT_MIN_RANGE_SIZE,
+            max(max_workers or 1, -(-size // SPLIT_MAX_RANGE_SIZE)),
+        )
+        if (
+            nb_ranges < 2
+            or (max_workers or 1) < 2
+            or self._rfs
+            or self._df is not None
+            or self._qt != csv.QUOTE_NONE
+            or self._lt != "\n"
+            or not self._nc
+            or self._nc < 2
+        ):
+            return [(0, size)]
+
+        starts = [0]
+        with open(self._fp, "rb") as f:
+            for k in range(1, nb_ranges):
+                offset = max(size * k // nb_ranges, starts[-1] + 1)
+                start = find_row_start(
+                    f,
+                    offset,
+                    delimiter=self._dm,
+                    escapechar=self._ec,
+                    nb_cols=self._nc,
+                )
+                if start is None:
+                    break
+                starts.append(start)
+
+        return list(zip(starts, starts[1:] + [size]))
+
+    def _split_ranges(self, ranges, columns, out_dir, max_workers, pbar):
+        """Split these byte ranges of this data file in worker processes
+
+        Returns
+        -------
+        dict
+            the paths of the parts of each split file, in the order of the
+            ranges
+        """
+        params = self._get_params()
+        with new_process_pool(max_workers) as executor:
+            futures = [
+                executor.submit(
+                    _split_range,
+                    self._fp,
+                    start,
+                    end,
+                    columns,
+                    out_dir.joinpath(str(i)),
+                    params,
+                )
+                for i, (start, end) in enumerate(ranges)
+            ]
+            range_fnames = []
+            for future, (start, end) in zip(futures, ranges):
+                range_fnames.append(future.result())
+                if pbar:
+                    pbar.update(end - start)
+
+        parts = {}
+        for i, fnames in enumerate(range_fnames):
+            for fname in fnames:
+                part_path = out_dir.joinpath(str(i), fname)
+                parts.setdefault(fname, []).append(part_path)
+
+        return parts
+
+    def _split_batch(self, batch, columns, stem=None):
+        """Group the rows of this batch of columns by the values of the split
+        columns
+
+        Yields
+        ------
+        tuple
+            the name of a split file and the text of its rows
+        """
+        groups = {}
+        for row in iter_rows([batch]):
+            try:
+                fields = tuple(row[col] for col in columns)
+            except IndexError:
+                logger.debug(f"missing column(s) {columns} in {row}")
+            else:
+                if all(fields):
+                    groups.setdefault(fields, []).append(row)
+
+        for fields, rows in groups.items():
+            fb = StringIO()
+            self._get_writer(fb).writerows(rows)
+            text = fb.getvalue()
+            if self._tc:  # cleaned like the text of a split data file
+                text = clean_text(text, delimiter=self._dm)
+            yield self._get_out_filename(fields, stem), text
+
+    def _get_writer(self, f):
+        """Get a csv writer of this file object with the dialect of this
+        data file
+        """
+        return csv.writer(
+            f,
             delimiter=self._dm,
             doublequote=self._dq,
             escapechar=self._ec,
@@ -510,17 +1024,285 @@ class DataFile:
             quotechar=self._qc,
             lineterminator=self._lt,
         )
-        wt.writerows(iter(self))
+
+    def _get_read_size(self):
+        """Get the number of bytes read from the file of this data file"""
+        f = self._f.source if isinstance(self._f, CleanedStream) else self._f
+        try:
+            return f.buffer.tell()
+        except (AttributeError, OSError, ValueError):
+            return 0
+
+    def _filter_columns(self, columns):
+        """Keep the rows of this batch of columns that pass the row filters,
+        None if there is none
+        """
+        for flt in self._rfs:
+            fields = columns[flt["col_index"]]
+            if flt.get("converter"):
+                fields = map(flt["converter"], fields)
+            mask = list(map(flt["ok_values"].__contains__, fields))
+            if not any(mask):
+                return None
+            if not all(mask):
+                columns = [list(compress(col, mask)) for col in columns]
+
+        return columns
+
+    def _iter_filtered_text(self):
+        """Iterate over the text of the rows that pass the row filters,
+        batch by batch, so that the text of all of them is never held in
+        memory
+        """
+        fb = StringIO()
+        writer = self._get_writer(fb)
+        for columns in self.iter_batches():
+            writer.writerows(iter_rows([columns]))
+            yield fb.getvalue()
+            fb.seek(0)
+            fb.truncate()
+
+    def _write_rows(self, f):
+        """Write the rows of this data file into this file object"""
+        self._get_writer(f).writerows(iter(self))
+
+    def _write_frame(self, f):
+        """Write the dataframe of this data file into this file object"""
+        if self._tc:  # the rows are cleaned like those of a text file
+            self._write_rows(f)
+        else:
+            self._frame_to_csv(self._df, f)
+
+    def _frame_to_csv(self, dframe, f):
+        """Write a dataframe into this file object with the dialect of this
+        data file
+        """
+        dframe.to_csv(
+            f,
+            sep=self._dm,
+            doublequote=self._dq,
+            escapechar=self._ec,
+            quoting=self._qt,
+            quotechar=self._qc,
+            lineterminator=self._lt,
+            na_rep=self._na[0] if self._na else "",
+            header=None,
+            index=False,
+        )
+
+    def _get_frame_buffer(self, dframe):
+        """Get a file buffer of the text of a dataframe"""
+        fb = StringIO()
+        self._frame_to_csv(dframe, fb)
+        fb.seek(0)
+
+        return fb
+
+    def _load_frame_text(self):
+        """Replace the dataframe of this data file by its text"""
+        self._f = self._get_frame_buffer(self._df)
+        if self._tc:
+            self._f = CleanedStream(self._f, delimiter=self._dm)
+        self._df = None
+
+    def _iter_frame_batches(self):
+        """Iterate over the dataframe of this data file by batches of columns
+        of the fields that its text would have
+        """
+        for start in range(0, len(self._df), BATCH_SIZE):
+            chunk = self._df.iloc[start : start + BATCH_SIZE]
+            yield [
+                self._get_text_fields(col).tolist() for _, col in chunk.items()
+            ]
+
+    def _get_text_fields(self, col):
+        """Get the fields that the text of this column of the dataframe of
+        this data file would have
+        """
+        na_rep = self._na[0] if self._na else ""
+        fields = col.astype(str).where(col.notna(), na_rep)
+        if self._tc:  # delimiters are removed from the text fields
+            fields = fields.str.replace(self._dm, " ", regex=False)
+
+        return fields
+
+    def _parse_text_fields(self, fields, na_values):
+        """Read these columns of text fields with 'pandas.read_csv', so that
+        their missing values and dtypes are inferred like from the text of
+        the data file. None is returned when a field would not be read back
+        as it is, e.g. when it has a delimiter or a line terminator.
+        """
+        specials = [self._dm, "\n", "\r"]
+        if self._ec:
+            specials.append(self._ec)
+        if self._qt != csv.QUOTE_NONE and self._qc:
+            specials.append(self._qc)
+        pattern = "|".join(re.escape(c) for c in specials)
+        if any(col.str.contains(pattern).any() for col in fields):
+            return None
+        lines = fields[0]
+        for col in fields[1:]:
+            lines = lines + self._dm + col
+
+        return pd.read_csv(
+            StringIO("\n".join(lines) + "\n"),
+            sep=self._dm,
+            header=None,
+            quoting=csv.QUOTE_NONE,
+            na_values=na_values,
+            skip_blank_lines=False,
+        )
+
+    def _read_frame(self, params):
+        """Get the dataframe that 'pandas.read_csv' would read from the text
+        of the dataframe of this data file. None is returned when the text
+        has to be read, e.g. for parameters that are not supported here.
+        """
+        params = dict(params)
+        dialect = {
+            "sep": self._dm,
+            "doublequote": self._dq,
+            "escapechar": self._ec,
+            "quoting": self._qt,
+            "quotechar": self._qc,
+            "lineterminator": self._lt,
+        }
+        for key, value in dialect.items():
+            if params.pop(key, value) != value:
+                return None
+        header = params.pop("header", None)
+        names = params.pop("names", None)
+        index_col = params.pop("index_col", None)
+        usecols = params.pop("usecols", None)
+        na_values = params.pop("na_values", None)
+        parse_dates = params.pop("parse_dates", None)
+        date_format = params.pop("date_format", None)
+        chunksize = params.pop("chunksize", None)
+        if params or header is not None:
+            return None
+        # the rows are filtered on their text, like by the row iterator
+        dframe = self._df
+        for flt in self._rfs:
+            fields = self._get_text_fields(dframe.iloc[:, flt["col_index"]])
+            if flt.get("converter"):
+                fields = fields.map(flt["converter"])
+            dframe = dframe[fields.isin(flt["ok_values"])]
+        if not len(dframe):
+            return None
+        if isinstance(na_values, dict):
+            return None
+
+        # the numbers without missing values are read back as they are, the
+        # other columns are parsed from their text by pandas
+        columns = {}
+        texts = {}
+        for i, (_, col) in enumerate(dframe.items()):
+            if _is_numpy_numeric(col.dtype) and not col.hasnans:
+                columns[i] = col.reset_index(drop=True)
+            elif _is_numpy_numeric(col.dtype) or _is_plain_text(col.dtype):
+                texts[i] = self._get_text_fields(col)
+            else:  # e.g. nullable numbers, datetimes, categories
+                return None
+        if texts:
+            parsed = self._parse_text_fields(list(texts.values()), na_values)
+            if parsed is None:
+                return None
+            columns.update(zip(texts, (c for _, c in parsed.items())))
+        dframe = pd.DataFrame({i: columns[i] for i in sorted(columns)})
+
+        if names is not None:
+            if len(names) != dframe.shape[1]:
+                return None
+            dframe.columns = list(names)
+        if callable(usecols):
+            dframe = dframe[[c for c in dframe.columns if usecols(c)]]
+        elif usecols is not None:
+            usecols = set(usecols)
+            if all(isinstance(c, int) for c in usecols):
+                used = [i in usecols for i in range(dframe.shape[1])]
+            else:
+                used = [c in usecols for c in dframe.columns]
+            if sum(used) != len(usecols):
+                return None
+            dframe = dframe.loc[:, used]
+        if parse_dates:
+            if not isinstance(parse_dates, (list, tuple)):
+                return None
+            for col in parse_dates:
+                if col not in dframe.columns or dframe[col].dtype.kind != "O":
+                    return None
+                try:
+                    dframe[col] = pd.to_datetime(
+                        dframe[col], format=date_format
+                    )
+                except (ValueError, TypeError):  # the column stays textual
+                    return None
+
+        if chunksize:
+            return (
+                _set_index_col(dframe.iloc[i : i + chunksize], index_col)
+                for i in range(0, len(dframe), chunksize)
+            )
+
+        return _set_index_col(dframe, index_col)
+
+    def _get_repaired_file(self):
+        """Get a file object of the text of this data file whose multiline
+        rows are repaired. Only the malformed line ranges are parsed and
+        rewritten, while the file is read, when its dialect allows it.
+        """
+        if (
+            self._qt == csv.QUOTE_NONE
+            and self._lt == "\n"
+            and self._ec
+            and self._nc
+            and self._nc > 1
+        ):
+            self.pos = 0
+            return ChunkedStream(
+                iter_repaired_text(
+                    self._f,
+                    delimiter=self._dm,
+                    escapechar=self._ec,
+                    nb_cols=self._nc,
+                    text_col=self._tc,
+                    doublequote=self._dq,
+                    quotechar=self._qc,
+                )
+            )
+
+        return self._get_fixed_file_buffer()
+
+    def _get_fixed_file_buffer(self):
+        """Try to fix multiline rows found into the file objext"""
+        fb = StringIO()
+        self._get_writer(fb).writerows(iter(self))
         fb.seek(0)
 
         return fb
 
-    def _get_out_filename(self, fields):
+    def _get_out_filename(self, fields, stem=None):
         """Get the name of the file that corespond to this mapped fields"""
         fields_string = "-".join(fields)
         ext = "tsv" if self._dm == "\t" else "csv"
+        stem = stem or self._fp.stem
 
-        return f"{fields_string}_{self._fp.stem}.{ext}"
+        return f"{fields_string}_{stem}.{ext}"
+
+    def _get_params(self):
+        """Get the parameters this data file was built with"""
+        return {
+            "delimiter": self._dm,
+            "doublequote": self._dq,
+            "escapechar": self._ec,
+            "quoting": self._qt,
+            "quotechar": self._qc,
+            "lineterminator": self._lt,
+            "na_values": self._na,
+            "text_col": self._tc,
+            "nb_cols": self._nc,
+            "encoding_errors": self._ee,
+        }
 
     @property
     def path(self):
@@ -578,3 +1360,104 @@ class DataFile:
     def version(self, new_version):
         """Set the version of this datafile"""
         version[self._fp.stem] = new_version
+
+
+class _SplitFiles:
+    """The files a data file is split into. Text is appended to them through
+    a limited number of open files, the least recently used of which is
+    closed when another one is opened.
+    """
+
+    def __init__(self, max_open=None):
+        self._max_open = max_open or SPLIT_MAX_OPEN_FILES
+        self._files = OrderedDict()
+
+    def write(self, path, text):
+        """Append this text to the file at this path"""
+        f = self._files.pop(path, None)
+        if f is None:
+            if len(self._files) >= self._max_open:
+                self._files.popitem(last=False)[1].close()
+            f = open(path, "a", encoding="utf-8", newline="")
+        self._files[path] = f
+        f.write(text)
+
+    def close(self):
+        """Close the files still open"""
+        while self._files:
+            self._files.popitem()[1].close()
+
+
+def _write_changes(old_rows, new_rows, writers, modified):
+    """Write the changes between these sorted rows with the writers of
+    their tags
+    """
+    for tag, row in iter_changes(old_rows, new_rows, modified=modified):
+        writers[tag].writerow(row)
+
+
+def _get_row_id(row):
+    """Get the id in the first column of this row, None if there is none"""
+    return int(row[0]) if row and row[0].isdecimal() else None
+
+
+def _split_range(fp, start, end, columns, out_dir, params):
+    """Split the rows of a byte range of a data file into the files of this
+    directory, in a worker process
+
+    Returns
+    -------
+    list
+        the names of the split files, in their order of appearance
+    """
+    with open(fp, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    text = data.decode("utf-8", errors=params["encoding_errors"] or "strict")
+    out_dir.mkdir()
+    dfile = DataFile(StringIO(text), **params)
+
+    return dfile._split_rows(columns, out_dir, stem=Path(fp).stem)
+
+
+def _join_files(paths, out_path):
+    """Join the files at these paths into a file at this path"""
+    if len(paths) == 1:
+        shutil.move(paths[0], out_path)
+    else:
+        with open(out_path, "wb") as out_f:
+            for path in paths:
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, out_f)
+
+
+def _set_index_col(dframe, index_col):
+    """Set the index column(s) of a dataframe like 'pandas.read_csv' does"""
+    if index_col is None or index_col is False:
+        return dframe
+    is_list = isinstance(index_col, (list, tuple))
+    cols = index_col if is_list else [index_col]
+    keys = [dframe.columns[c] if isinstance(c, int) else c for c in cols]
+
+    return dframe.set_index(keys if is_list else keys[0])
+
+
+def _is_numpy_numeric(dtype):
+    """Check if this dtype is a numpy boolean or number dtype, whose values
+    'pandas.read_csv' reads back with the same dtype
+    """
+    return isinstance(dtype, np.dtype) and dtype.kind in "biuf"
+
+
+def _is_plain_text(dtype):
+    """Check if this dtype is the object or the default string dtype, whose
+    fields are parsed from their text
+    """
+    if isinstance(dtype, np.dtype):
+        return dtype.kind == "O"
+    # the default string dtype of pandas 3, missing values being NaN
+    return (
+        isinstance(dtype, pd.StringDtype)
+        and dtype.name == "str"
+        and dtype.na_value is np.nan
+    )
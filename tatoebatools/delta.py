@@ -0,0 +1,315 @@
+import gzip
+import json
+import logging
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from .exceptions import NotStoredVersion
+from .lock import FileLock
+from .utils import open_atomically
+from .version import DATETIME_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# the directory of a table directory where the deltas of its files are logged
+DELTAS_DIR = "deltas"
+# the file of a delta log directory that lists its deltas
+INDEX_NAME = "index.json"
+# the maximum number of deltas logged per data file, beyond which the oldest
+# ones are merged together
+DELTA_MAX_COUNT = 26
+# the age in seconds after which a delta is not logged anymore
+DELTA_MAX_AGE = 2 * 365 * 24 * 60 * 60
+# the extensions of the files of a delta
+COUNTS_EXT = ".npz"
+ROWS_EXT = ".rows.gz"
+
+
+class DeltaLog:
+    """The log of the changes between the successive versions of a data file
+
+    A delta stores the signed numbers of the rows added to and removed from
+    a data file by an update, by fingerprint, and the compressed rows that
+    were removed. The changes since any logged version are found by summing
+    the deltas that followed it, without keeping the former versions.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : pathlib.Path
+            the logical path of the data file
+        """
+        path = Path(path)
+        self._dir = path.parent.joinpath(DELTAS_DIR, path.name)
+
+    @property
+    def head(self):
+        """Get the latest version of the data file logged, None if there is
+        none
+        """
+        return _parse_datetime(self._load_index().get("head"))
+
+    @property
+    def versions(self):
+        """Get the versions of the data file since which the changes can be
+        found, from the oldest one
+        """
+        index = self._load_index()
+        bases = [delta["base"] for delta in index.get("deltas", [])]
+        if index.get("head"):
+            bases.append(index["head"])
+
+        return [_parse_datetime(vs) for vs in bases]
+
+    def reset(self, head):
+        """Start a new log from this version of the data file"""
+        with self._lock():
+            index = self._load_index()
+            for delta in index.get("deltas", []):
+                self._remove_delta(delta)
+            self._save_index({"head": _format_datetime(head), "deltas": []})
+
+    @contextmanager
+    def append(self, new_version, removed, added):
+        """Log the changes from the head of this log to this new version of
+        the data file, then merge or drop the oldest deltas beyond the
+        retention limits
+
+        Parameters
+        ----------
+        new_version : datetime
+            the version of the data file after the changes
+        removed : dict
+            the numbers of the rows removed, by fingerprint
+        added : dict
+            the numbers of the rows added, by fingerprint
+
+        Yields
+        ------
+        file object
+            the text file where the rows removed must be written
+        """
+        self._dir.mkdir(parents=True, exist_ok=True)
+        name = uuid.uuid4().hex
+        rows_path = self._dir.joinpath(name + ROWS_EXT)
+        try:
+            with gzip.open(
+                rows_path, "wt", encoding="utf-8", newline=""
+            ) as f:
+                yield f
+            _save_counts(
+                self._dir.joinpath(name + COUNTS_EXT),
+                *_to_arrays(removed, added),
+            )
+        except BaseException:
+            self._remove_delta({"name": name})
+            raise
+
+        with self._lock():
+            index = self._load_index()
+            delta = {
+                "base": index["head"],
+                "version": _format_datetime(new_version),
+                "name": name,
+            }
+            index["deltas"].append(delta)
+            index["head"] = delta["version"]
+            self._compact(index)
+            self._save_index(index)
+
+    def get_changes(self, since):
+        """Get the changes to the data file since its latest version logged
+        at this datetime
+
+        Parameters
+        ----------
+        since : datetime
+            the datetime at which the former version was the local one
+
+        Returns
+        -------
+        tuple
+            the numbers of the rows removed and of the rows added by
+            fingerprint, and the paths of the compressed rows among which
+            the rows removed are found
+
+        Raises
+        ------
+        NotStoredVersion
+            when no version of the data file was logged at this datetime
+        """
+        index = self._load_index()
+        if not index.get("head"):
+            raise NotStoredVersion(since)
+        if since >= _parse_datetime(index["head"]):
+            return {}, {}, []
+        # the deltas following the latest version logged at this datetime
+        deltas = index["deltas"]
+        starts = [
+            i
+            for i, delta in enumerate(deltas)
+            if _parse_datetime(delta["base"]) <= since
+        ]
+        if not starts:
+            raise NotStoredVersion(since)
+        deltas = deltas[starts[-1] :]
+
+        fingerprints, counts = _sum_counts(
+            [_load_counts(self._get_counts_path(d)) for d in deltas]
+        )
+        removed = counts < 0
+        added = counts > 0
+
+        return (
+            _to_dict(fingerprints[removed], -counts[removed]),
+            _to_dict(fingerprints[added], counts[added]),
+            [self._get_rows_path(d) for d in deltas],
+        )
+
+    def _compact(self, index):
+        """Drop the deltas older than the maximum age, then merge the oldest
+        deltas beyond the maximum number of deltas
+        """
+        deltas = index["deltas"]
+        min_version = datetime.now(timezone.utc).replace(
+            tzinfo=None
+        ) - timedelta(seconds=DELTA_MAX_AGE)
+        while deltas and _parse_datetime(deltas[0]["version"]) < min_version:
+            self._remove_delta(deltas.pop(0))
+        while len(deltas) > DELTA_MAX_COUNT:
+            first, second = deltas.pop(0), deltas.pop(0)
+            deltas.insert(0, self._merge_deltas(first, second))
+
+    def _merge_deltas(self, first, second):
+        """Merge two successive deltas into a single one
+
+        The rows removed are concatenated as gzip members. Rows that are
+        removed then added back are kept, but their numbers cancel out.
+        """
+        name = uuid.uuid4().hex
+        _save_counts(
+            self._dir.joinpath(name + COUNTS_EXT),
+            *_sum_counts(
+                [
+                    _load_counts(self._get_counts_path(first)),
+                    _load_counts(self._get_counts_path(second)),
+                ]
+            ),
+        )
+        with open(self._dir.joinpath(name + ROWS_EXT), "wb") as out_f:
+            for delta in (first, second):
+                with open(self._get_rows_path(delta), "rb") as in_f:
+                    shutil.copyfileobj(in_f, out_f)
+        for delta in (first, second):
+            self._remove_delta(delta)
+        logger.debug(
+            f"deltas of {self._dir.name} merged "
+            f"from {first['base']} to {second['version']}"
+        )
+
+        return {
+            "base": first["base"],
+            "version": second["version"],
+            "name": name,
+        }
+
+    def _remove_delta(self, delta):
+        """Remove the files of a delta"""
+        self._get_counts_path(delta).unlink(missing_ok=True)
+        self._get_rows_path(delta).unlink(missing_ok=True)
+
+    def _get_counts_path(self, delta):
+        """Get the path of the numbers of rows of a delta"""
+        return self._dir.joinpath(delta["name"] + COUNTS_EXT)
+
+    def _get_rows_path(self, delta):
+        """Get the path of the compressed rows removed by a delta"""
+        return self._dir.joinpath(delta["name"] + ROWS_EXT)
+
+    def _lock(self):
+        """Get the lock of this log, shared by all the processes"""
+        self._dir.mkdir(parents=True, exist_ok=True)
+
+        return FileLock(self._dir.joinpath(f"{INDEX_NAME}.lock"))
+
+    def _load_index(self):
+        """Load the index of the deltas of this log"""
+        try:
+            with open(self._dir.joinpath(INDEX_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"invalid delta index in {self._dir}")
+            return {}
+
+    def _save_index(self, index):
+        """Save the index of the deltas of this log. The index is written
+        to a temporary file that atomically replaces the previous one.
+        """
+        with open_atomically(self._dir.joinpath(INDEX_NAME)) as f:
+            json.dump(index, f)
+
+
+def _to_arrays(removed, added):
+    """Get the fingerprints of these changes and their signed numbers of
+    rows, negative when removed
+    """
+    fingerprints = np.fromiter(
+        [*removed, *added], dtype=np.uint64, count=len(removed) + len(added)
+    )
+    counts = np.fromiter(
+        [*(-c for c in removed.values()), *added.values()],
+        dtype=np.int64,
+        count=len(fingerprints),
+    )
+
+    return fingerprints, counts
+
+
+def _to_dict(fingerprints, counts):
+    """Get the numbers of rows of these fingerprints as a dict"""
+    return dict(zip(fingerprints.tolist(), counts.tolist()))
+
+
+def _sum_counts(arrays):
+    """Sum the signed numbers of rows of several deltas by fingerprint"""
+    if not arrays:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    fingerprints = np.concatenate([fps for fps, _ in arrays])
+    counts = np.concatenate([cs for _, cs in arrays])
+    values, inverse = np.unique(fingerprints, return_inverse=True)
+    sums = np.zeros(len(values), dtype=np.int64)
+    np.add.at(sums, inverse, counts)
+    changed = sums != 0
+
+    return values[changed], sums[changed]
+
+
+def _save_counts(path, fingerprints, counts):
+    """Save the signed numbers of rows of a delta by fingerprint"""
+    with open(path, "wb") as f:
+        np.savez(f, fingerprints=fingerprints, counts=counts)
+
+
+def _load_counts(path):
+    """Load the signed numbers of rows of a delta by fingerprint"""
+    with np.load(path) as data:
+        return data["fingerprints"], data["counts"]
+
+
+def _parse_datetime(string):
+    """Parse a version string of the log, None if there is none"""
+    return datetime.strptime(string, DATETIME_FORMAT) if string else None
+
+
+def _format_datetime(dt):
+    """Format a version of the log"""
+    return dt.strftime(DATETIME_FORMAT)
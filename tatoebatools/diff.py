@@ -0,0 +1,174 @@
+import heapq
+import logging
+import pickle
+from collections import Counter
+from itertools import groupby, islice
+
+logger = logging.getLogger(__name__)
+
+# the number of rows sorted in memory at once when the rows are not sorted
+SORT_CHUNK_SIZE = 500000
+# the number of rows pickled at once into a sorted run
+_RUN_BATCH_SIZE = 1000
+
+
+class UnsortedRows(Exception):
+    """Raised when the rows of a data file are not sorted by their key"""
+
+    def __init__(self, key):
+        super().__init__(f"rows are not sorted by key at key {key!r}")
+
+        self.key = key
+
+
+def get_sort_key(field):
+    """Get the sort key of a key field. Ids are sorted as numbers, before
+    the other fields.
+    """
+    return (0, int(field), "") if field.isdigit() else (1, 0, field)
+
+
+def iter_changes(old_rows, new_rows, key_col=0, modified=False):
+    """Iterate over the changes between two versions of the rows of a data
+    file, both sorted by this key column
+
+    The rows of a same key are compared as a multiset, so that the memory
+    used only depends on the number of rows per key.
+
+    Parameters
+    ----------
+    old_rows : iterable
+        the rows of the former version, sorted by key
+    new_rows : iterable
+        the rows of the new version, sorted by key
+    key_col : int, optional
+        the column sorting the rows, by default 0
+    modified : bool, optional
+        whether the single row of a key that changed into another single row
+        is a 'modified' row rather than a 'removed' and an 'added' one, by
+        default False
+
+    Yields
+    ------
+    tuple
+        the tag of a change ('added', 'removed' or 'modified') and a row
+
+    Raises
+    ------
+    UnsortedRows
+        when some rows are not sorted by key
+    """
+    old_groups = _iter_key_groups(old_rows, key_col)
+    new_groups = _iter_key_groups(new_rows, key_col)
+    old_key, old_group = next(old_groups, (None, None))
+    new_key, new_group = next(new_groups, (None, None))
+    while old_group is not None or new_group is not None:
+        if new_group is None or (
+            old_group is not None and old_key < new_key
+        ):
+            for row in old_group:
+                yield "removed", row
+            old_key, old_group = next(old_groups, (None, None))
+        elif old_group is None or new_key < old_key:
+            for row in new_group:
+                yield "added", row
+            new_key, new_group = next(new_groups, (None, None))
+        else:
+            if old_group != new_group:
+                yield from _compare_groups(old_group, new_group, modified)
+            old_key, old_group = next(old_groups, (None, None))
+            new_key, new_group = next(new_groups, (None, None))
+
+
+def sort_rows(rows, tmp_dir, key_col=0, chunk_size=None):
+    """Sort rows by key without holding them all in memory
+
+    The rows are sorted chunk by chunk into runs written to this directory,
+    then the runs are merged while they are read.
+
+    Parameters
+    ----------
+    rows : iterable
+        the rows to sort
+    tmp_dir : pathlib.Path
+        the existing directory where the sorted runs are written
+    key_col : int, optional
+        the column sorting the rows, by default 0
+    chunk_size : int, optional
+        the number of rows sorted in memory at once,
+        by default SORT_CHUNK_SIZE
+
+    Returns
+    -------
+    iterator
+        the rows sorted by key
+    """
+    chunk_size = chunk_size or SORT_CHUNK_SIZE
+
+    def sort_key(row):
+        return get_sort_key(row[key_col])
+
+    rows = iter(rows)
+    run_paths = []
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        chunk.sort(key=sort_key)
+        run_path = tmp_dir.joinpath(f"run-{len(run_paths)}")
+        with open(run_path, "wb") as f:
+            for i in range(0, len(chunk), _RUN_BATCH_SIZE):
+                pickle.dump(chunk[i : i + _RUN_BATCH_SIZE], f)
+        run_paths.append(run_path)
+    logger.debug(f"{len(run_paths)} sorted runs written into {tmp_dir}")
+
+    return heapq.merge(*map(_iter_run, run_paths), key=sort_key)
+
+
+def _iter_run(run_path):
+    """Iterate over the rows of a sorted run"""
+    with open(run_path, "rb") as f:
+        while True:
+            try:
+                rows = pickle.load(f)
+            except EOFError:
+                return
+            yield from rows
+
+
+def _iter_key_groups(rows, key_col):
+    """Iterate over the groups of rows of a same key, checking that the keys
+    are sorted
+    """
+    previous_key = None
+    for field, group in groupby(rows, key=lambda row: row[key_col]):
+        key = get_sort_key(field)
+        if previous_key is not None and key <= previous_key:
+            raise UnsortedRows(field)
+        previous_key = key
+        yield key, list(group)
+
+
+def _compare_groups(old_group, new_group, modified):
+    """Compare the rows of a same key as multisets"""
+    left = Counter(map(tuple, new_group))
+    removed = []
+    for row in old_group:
+        t = tuple(row)
+        if left[t]:
+            left[t] -= 1
+        else:
+            removed.append(row)
+    left = Counter(map(tuple, old_group))
+    added = []
+    for row in new_group:
+        t = tuple(row)
+        if left[t]:
+            left[t] -= 1
+        else:
+            added.append(row)
+
+    if modified and len(removed) == 1 and len(added) == 1:
+        yield "modified", added[0]
+    else:
+        for row in removed:
+            yield "removed", row
+        for row in added:
+            yield "added", row
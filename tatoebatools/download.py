@@ -1,14 +1,19 @@
+import logging
 from pathlib import Path
 
 from .config import DATA_DIR
-from .utils import fetch, get_filestem
+from .generation import resolve_path
+from .lock import FileLock
+from .utils import Digest, fetch, get_filestem, utcnow
 from .version import version
 
+logger = logging.getLogger(__name__)
+
 
 class Download:
     """A file download"""
 
-    def __init__(self, url, version, data_dir=None):
+    def __init__(self, url, version, data_dir=None, session=None):
         """
         Parameters
         ----------
@@ -18,21 +23,97 @@ class Download:
             the version of the file
         data_dir :  str, optional
             the parent directory where files are downloaded, by default None
+        session : requests.Session, optional
+            the HTTP session through which the file is downloaded,
+            by default None (default pooled session)
         """
         self._url = url
         self._vs = version
         self._data_dir = Path(data_dir) if data_dir else DATA_DIR
+        self._session = session
+        # the files that were not written again since the download was the
+        # same as the previous one
+        self._unchanged = []
 
-    def fetch(self, verbose=True):
+    def fetch(self, verbose=True, pbar=None):
         """Download, decompress, extract, delete tamporary files, update
         local version value.
+
+        The file is fetched by only one process at a time. A process that
+        waited for another one to fetch the same version does not fetch it
+        again. A file that is the same as the local one is not written
+        again: only its version is updated and its local files are listed
+        as 'unchanged'. The file is recorded as checked once its local
+        version is up to date.
+
+        Parameters
+        ----------
+        verbose : bool, optional
+            whether the download steps are printed, by default True
+        pbar : tqdm.tqdm, optional
+            a progress bar shared with other downloads, by default None
         """
-        fetched = fetch(self._url, self.out_dir, verbose=verbose)
-        if fetched:
-            version[self.name] = self._vs
+        # the file fetched is at least as recent as the start of the fetch
+        checked = utcnow()
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        with FileLock(self.out_dir.joinpath(f"{self.name}.lock")):
+            version.refresh()
+            current_vs = version[self.name]
+            if current_vs and current_vs >= self._vs:
+                logger.info(f"{self.name} already fetched by another process")
+                version.set_checked(self.name, checked)
+                return []
+
+            # a download the same as the local files is not written again
+            metadata = version.get_metadata(self.name)
+            previous = None
+            if current_vs and metadata.get("files"):
+                local_paths = [
+                    resolve_path(self.out_dir.joinpath(fn))
+                    for fn in metadata["files"]
+                ]
+                if all(fp.is_file() for fp in local_paths):
+                    previous = metadata
+            digest = Digest()
+            fetched = fetch(
+                self._url,
+                self.out_dir,
+                verbose=verbose,
+                pbar=pbar,
+                session=self._session,
+                version=self._vs,
+                digest=digest,
+                previous=previous,
+            )
+            if fetched is None:  # same file as the local version
+                logger.info(f"{self.name} has not changed since {current_vs}")
+                with version.transaction():
+                    version[self.name] = self._vs
+                    version.set_checked(self.name, checked)
+                self._unchanged = local_paths
+                return []
+            elif fetched:
+                size = sum(fp.stat().st_size for fp in fetched)
+                with version.transaction():
+                    version[self.name] = self._vs
+                    version.set_checked(self.name, checked)
+                    version.set_metadata(
+                        self.name,
+                        size=size,
+                        download_size=digest.size,
+                        hash=digest.hexdigest(),
+                        files=[fp.name for fp in fetched],
+                    )
 
         return fetched
 
+    @property
+    def unchanged(self):
+        """Get the paths of the local files that the last fetch found to be
+        the same as the files online
+        """
+        return self._unchanged
+
     @property
     def from_url(self):
         """Get the url from which the file is fetched."""
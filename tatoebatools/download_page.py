@@ -1,23 +1,45 @@
 import logging
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from pathlib import Path
-from tempfile import TemporaryDirectory
 
 import requests
 from bs4 import BeautifulSoup
 
+from .config import DATA_DIR, LISTING_TTL
+from .session import default_session
+from .utils import open_atomically
+
 logger = logging.getLogger(__name__)
 
 
 class DownloadPages:
     """Web pages at downloads.tatoeba.org from
     which export files' versions can be scraped
+
+    The pages are cached in the data directory so that they are shared by
+    all the processes using this directory.
     """
 
-    def __init__(self):
-        self._dir = TemporaryDirectory()
+    def __init__(self, data_dir=None, ttl=LISTING_TTL, offline=False):
+        """
+        Parameters
+        ----------
+        data_dir : str, optional
+            The path of the directory where the Tatoeba data is saved.
+            If None, the pages are cached into the tatoebatools package
+        ttl : int, optional
+            the time in seconds after which a cached page is requested
+            again, by default LISTING_TTL
+        offline : bool, optional
+            whether the cached pages are read without ever requesting
+            the server, by default False
+        """
+        self._dir = Path(data_dir) if data_dir else DATA_DIR
+        self.ttl = ttl
+        self.offline = offline
 
-    def get_versions(self, url):
+    def get_versions(self, url, session=None, offline=False):
         """Scraps the versions of the files listed in the web page
 
         Returns
@@ -25,12 +47,13 @@ class DownloadPages:
         dict
             the versions of all urls listed in the web page
         """
-        html = self._get_html(url)
-        versions = _extract_versions(html)
+        page_url = _get_page_url(url)
+        html = self._get_html(page_url, session=session, offline=offline)
+        versions = _extract_versions(html) if html else {}
 
-        return {self._url + k: v for k, v in versions.items()}
+        return {page_url + k: v for k, v in versions.items()}
 
-    def get_names(self, url):
+    def get_names(self, url, session=None, offline=False):
         """Scraps the directory names listed in the web page
 
         Returns
@@ -38,65 +61,105 @@ class DownloadPages:
         list
             the names of all urls listed in the web page
         """
-        html = self._get_html(url)
+        html = self._get_html(
+            _get_page_url(url), session=session, offline=offline
+        )
 
         return _extract_names(html)
 
-    def _get_html(self, url, update_time=5):
-        """Get the HTML content of this web page
+    def _get_html(self, url, session=None, offline=False):
+        """Get the HTML content of the web page at this url. The cached copy
+        of the page is read when it is younger than the TTL, when the server
+        cannot be reached or in offline mode.
 
         Parameters
         ----------
-        update_time : int, optional
-            the time in minutes after which the local file of the web page
-            is re-downloaded, by default 5
-        """
-        self._url = url if url.endswith("/") else f"{url}/"
-
-        if not self.mtime or self.mtime < datetime.now() - timedelta(
-            minutes=update_time
-        ):
-            # update the local copy of the web page
-            try:
-                r = requests.get(self._url)
-                with open(self.path, "w", encoding="utf-8") as f:
-                    f.write(r.text)
-            except requests.exceptions.RequestException:
-                logger.warning(f"error while requesting {self._url}")
-                return ""
-            else:
-                return r.text
-        else:
-            # load up to date local file
-            with open(self.path, encoding="utf-8") as f:
-                return f.read()
-
-    @property
-    def mtime(self):
-        """Gets the modification time of the local web page
+        url : str
+            the url of the web page, ending with a slash
+        session : requests.Session, optional
+            the HTTP session through which the page is requested,
+            by default None (default pooled session)
+        offline : bool, optional
+            whether only the cached copy of the page is read,
+            by default False
 
         Returns
         -------
-        datetime
-            the last modification time of the file if this one exists
+        str
+            the HTML content of the page, empty if not available
         """
-        if self.path.is_file():
-            return datetime.fromtimestamp(self.path.stat().st_mtime)
+        session = session or default_session
+        path = self._get_path(url)
+
+        mtime = _get_mtime(path)
+        is_fresh = mtime and time.time() - mtime.timestamp() < self.ttl
+        if is_fresh or offline or self.offline:
+            if mtime:
+                return _read_page(path)
+            logger.debug(f"no cached copy of {url}")
+            return ""
+
+        # update the cached copy of the web page
+        try:
+            r = session.get(url)
+            r.raise_for_status()
+        except requests.exceptions.RequestException:
+            logger.warning(f"error while requesting {url}")
+            return _read_page(path) if mtime else ""
         else:
-            return
+            _write_page(path, r.text)
+            return r.text
 
-    @property
-    def path(self):
-        """Get the local path of the web page
+    def _get_path(self, url):
+        """Get the local path of the web page at this url
 
         Returns
         -------
         Path
             the local path of the file
         """
-        stem = self._url[:-1].rsplit("/", 1)[-1]
+        stem = url[:-1].rsplit("/", 1)[-1]
+
+        return self._dir.joinpath("listings", f"{stem}.html")
 
-        return Path(self._dir.name).joinpath(f"{stem}.html")
+    @property
+    def dir(self):
+        """Gets the path of the directory where the pages are cached"""
+        return self._dir
+
+    @dir.setter
+    def dir(self, new_dir_path):
+        """Sets the path of the directory where the pages are cached"""
+        self._dir = Path(new_dir_path)
+
+
+def _get_page_url(url):
+    """Get the url of a web page, ending with a slash"""
+    return url if url.endswith("/") else f"{url}/"
+
+
+def _get_mtime(path):
+    """Get the modification time of the local web page at this path, None
+    if there is none
+    """
+    if path.is_file():
+        return datetime.fromtimestamp(path.stat().st_mtime)
+
+
+def _read_page(path):
+    """Read the cached copy of a web page"""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _write_page(path, html):
+    """Write the cached copy of a web page. The page is written to a
+    temporary file that atomically replaces the previous copy, so that
+    concurrent processes never read a partial page.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open_atomically(path, encoding="utf-8") as f:
+        f.write(html)
 
 
 def _extract_versions(html):
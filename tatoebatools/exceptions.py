@@ -24,3 +24,23 @@ class NotLanguage(Exception):
         super().__init__(f"{lang_codes} is not a valid language")
 
         self.language_codes = lang_codes
+
+
+class NotIndexedTable(Exception):
+    """Raised when the rows of a table cannot be read by id"""
+
+    def __init__(self, table_name):
+        super().__init__(f"the rows of '{table_name}' cannot be read by id")
+
+        self.table_name = table_name
+
+
+class NotStoredVersion(Exception):
+    """Raised when the changes since a version of a data file are not
+    stored
+    """
+
+    def __init__(self, since):
+        super().__init__(f"no changes stored since {since}")
+
+        self.since = since
@@ -0,0 +1,187 @@
+import json
+import logging
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+# the directory of a table directory where the generations are built
+GENERATIONS_DIR = "generations"
+# the file of a table directory that points to the current generations
+MANIFEST_NAME = "generations.json"
+# age in seconds after which an unpublished generation is deemed abandoned
+ABANDONED_AGE = 24 * 60 * 60
+
+# manifests are rewritten by concurrent downloads and processes
+_lock = threading.Lock()
+
+
+@contextmanager
+def new_generation(path, tag=None, keep_old=True):
+    """Write a new generation of the data file at this logical path
+
+    The file is written into its own generation directory, which is
+    published once the file is complete by atomically replacing the manifest
+    of the table directory. Readers that opened the previous generation keep
+    reading a consistent snapshot of the data.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        the logical path of the data file (e.g. 'data/links/links.csv')
+    tag : datetime, optional
+        the export date of the new generation, by default the current time
+    keep_old : bool, optional
+        whether the previous generation is kept as the '_old' version of the
+        data file, by default True
+
+    Yields
+    ------
+    pathlib.Path
+        the path where the new generation of the file must be written
+    """
+    path = Path(path)
+    gens_dir = path.parent.joinpath(GENERATIONS_DIR)
+    gen_name = _get_generation_name(path, tag)
+    tmp_dir = gens_dir.joinpath(f"{gen_name}.tmp")
+    tmp_dir.mkdir(parents=True)
+    try:
+        yield tmp_dir.joinpath(path.name)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    publish(path, tmp_dir.joinpath(path.name), keep_old=keep_old)
+
+
+def publish(path, new_path, keep_old=True):
+    """Make this file the current generation of the data file at this
+    logical path, then remove the generations that are not referenced
+    anymore.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        the logical path of the data file
+    new_path : pathlib.Path
+        the path of the new generation of the file, in a '.tmp' generation
+        directory while it is being built
+    keep_old : bool, optional
+        whether the previous generation is kept as the '_old' version of the
+        data file, by default True
+    """
+    path = Path(path)
+    old_name = f"{path.stem}_old{path.suffix}"
+    lock_path = path.parent.joinpath(f"{MANIFEST_NAME}.lock")
+    with _lock, FileLock(lock_path):
+        # generations are only completed while no collection is running
+        if new_path.parent.suffix == ".tmp":
+            gen_dir = new_path.parent.with_suffix("")
+            new_path.parent.rename(gen_dir)
+            new_path = gen_dir.joinpath(new_path.name)
+        manifest = _load_manifest(path.parent)
+        previous = manifest.get(path.name)
+        if previous and keep_old:
+            manifest[old_name] = previous
+        elif path.is_file():  # file written in place by a former release
+            if keep_old:
+                path.replace(path.with_name(old_name))
+                manifest.pop(old_name, None)
+            else:
+                path.unlink()
+        manifest[path.name] = new_path.relative_to(path.parent).as_posix()
+        _save_manifest(path.parent, manifest)
+
+        collect_garbage(path.parent, manifest)
+
+
+def resolve_path(path):
+    """Get the path of the current generation of the data file at this
+    logical path. The files that were written in place by a former release
+    are found at their logical path.
+    """
+    path = Path(path)
+    entry = _load_manifest(path.parent).get(path.name)
+
+    return path.parent.joinpath(entry) if entry else path
+
+
+def get_logical_path(path):
+    """Get the logical path of a data file from the path of one of its
+    generations
+    'data/links/generations/links-xxx/links.csv' -> 'data/links/links.csv'
+    """
+    path = Path(path)
+    if path.parent.parent.name == GENERATIONS_DIR:
+        return path.parent.parent.parent.joinpath(path.name)
+
+    return path
+
+
+def collect_garbage(directory, manifest=None):
+    """Remove the generations of a table directory that its manifest does
+    not reference anymore. On POSIX systems, readers keep reading the files
+    they opened. Elsewhere, files still open are removed by a later
+    collection.
+    """
+    directory = Path(directory)
+    if manifest is None:
+        manifest = _load_manifest(directory)
+    referenced = {Path(entry).parent.name for entry in manifest.values()}
+
+    gens_dir = directory.joinpath(GENERATIONS_DIR)
+    if not gens_dir.is_dir():
+        return
+    now = time.time()
+    for gen_dir in gens_dir.iterdir():
+        if gen_dir.name in referenced:
+            continue
+        if gen_dir.suffix == ".tmp":  # being built unless abandoned
+            try:
+                age = now - gen_dir.stat().st_mtime
+            except OSError:
+                continue
+            if age < ABANDONED_AGE:
+                continue
+        shutil.rmtree(gen_dir, ignore_errors=True)
+        logger.debug(f"generation {gen_dir.name} removed")
+
+
+def _get_generation_name(path, tag):
+    """Get a unique name for a new generation of the data file at this
+    path
+    """
+    if tag is None:
+        tag = datetime.now(timezone.utc)
+
+    return f"{path.stem}-{tag:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def _load_manifest(directory):
+    """Load the manifest of a table directory"""
+    try:
+        with open(directory.joinpath(MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning(f"invalid generation manifest in {directory}")
+        return {}
+
+
+def _save_manifest(directory, manifest):
+    """Save the manifest of a table directory. The manifest is written to a
+    temporary file that atomically replaces the previous one.
+    """
+    # imported here since the utilities import the generations
+    from .utils import open_atomically
+
+    with open_atomically(directory.joinpath(MANIFEST_NAME)) as f:
+        json.dump(manifest, f)
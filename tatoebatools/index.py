@@ -0,0 +1,123 @@
+import logging
+from array import array
+
+import numpy as np
+
+from .utils import open_atomically
+
+logger = logging.getLogger(__name__)
+
+# the extension of the index of a data file
+INDEX_EXT = ".index.npy"
+
+
+class Index:
+    """The index of the rows of a data file by id
+
+    It is made of the ids of the rows, sorted, along with the byte offsets
+    and sizes of the rows in the data file. It is memory-mapped when read,
+    so that a row is found without loading the index nor the data file.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : pathlib.Path
+            the path of the data file, next to which its index is written
+        """
+        self._fp = path
+        self._path = path.with_name(path.name + INDEX_EXT)
+        # the memory-mapped entries, once loaded
+        self._entries = None
+
+    def exists(self):
+        """Check if the index of the current data file exists locally"""
+        try:
+            index_mtime = self._path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+        return index_mtime >= self._fp.stat().st_mtime_ns
+
+    def build(self, delimiter="\t", escapechar="\\"):
+        """Build the index of the data file, whose rows start with their id.
+        A line that does not start with an id, or that follows an escaped
+        line terminator, belongs to the row before it.
+        """
+        dm = delimiter.encode("utf-8")
+        ec = escapechar.encode("utf-8") if escapechar else None
+        ids = array("q")
+        offsets = array("q")
+        pos = 0
+        continued = False
+        with open(self._fp, "rb") as f:
+            for line in f:
+                content = line[:-1] if line.endswith(b"\n") else line
+                if not continued:
+                    key = content.partition(dm)[0]
+                    if key.isdigit():
+                        ids.append(int(key))
+                        offsets.append(pos)
+                continued = bool(ec) and _is_escaped(content, ec)
+                pos += len(line)
+
+        ids = np.frombuffer(ids, dtype=np.int64)
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        sizes = np.diff(offsets, append=np.int64(pos))
+        # the rows of a same id are kept in the order of the data file
+        order = np.argsort(ids, kind="stable")
+        entries = np.stack([ids[order], offsets[order], sizes[order]])
+
+        with open_atomically(self._path, "wb") as f:
+            np.save(f, entries)
+        self._entries = None
+        logger.debug(f"index of {self._fp.name} written")
+
+    def find(self, ids):
+        """Find the rows of these ids
+
+        Returns
+        -------
+        numpy.ndarray
+            the ids, byte offsets and sizes of the rows found, by id in the
+            order of these ids
+        """
+        entries = self.entries
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = np.searchsorted(entries[0], ids, side="left")
+        stops = np.searchsorted(entries[0], ids, side="right")
+        positions = [
+            i
+            for start, stop in zip(starts.tolist(), stops.tolist())
+            for i in range(start, stop)
+        ]
+
+        return entries[:, positions]
+
+    def slice(self, start, stop):
+        """Get the rows between these positions in the order of their ids
+
+        Returns
+        -------
+        numpy.ndarray
+            the ids, byte offsets and sizes of the rows
+        """
+        return self.entries[:, start:stop]
+
+    @property
+    def entries(self):
+        """Get the ids, byte offsets and sizes of the rows of the data file,
+        sorted by id. They are memory-mapped once.
+        """
+        if self._entries is None:
+            self._entries = np.load(self._path, mmap_mode="r")
+
+        return self._entries
+
+
+def _is_escaped(content, escapechar):
+    """Check if the line terminator after this line content is escaped"""
+    nb_escapes = len(content) - len(content.rstrip(escapechar))
+
+    return nb_escapes % 2 == 1
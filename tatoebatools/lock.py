@@ -0,0 +1,99 @@
+import logging
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """An exclusive lock shared by all the processes using a lock file
+
+    It coordinates the processes that update the same data directory. The
+    lock is released when the process holding it exits, even abruptly.
+    """
+
+    def __init__(self, path, timeout=None, poll_interval=0.05):
+        """
+        Parameters
+        ----------
+        path : pathlib.Path
+            the path of the lock file, created if it does not exist
+        timeout : float, optional
+            the maximum number of seconds to wait for the lock,
+            by default None (no limit)
+        poll_interval : float, optional
+            the number of seconds between two attempts to take the lock,
+            by default 0.05
+        """
+        self._path = path
+        self._timeout = timeout
+        self._poll = poll_interval
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def acquire(self):
+        """Wait for the lock and take it
+
+        Raises
+        ------
+        TimeoutError
+            raised when the lock is not available before the timeout
+        """
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        start = time.monotonic()
+        while True:
+            try:
+                _lock(fd)
+            except OSError:
+                waited = time.monotonic() - start
+                if self._timeout is not None and waited >= self._timeout:
+                    os.close(fd)
+                    raise TimeoutError(f"{self._path} is locked")
+                time.sleep(self._poll)
+            else:
+                self._fd = fd
+                return
+
+    def release(self):
+        """Release the lock"""
+        if self._fd is not None:
+            try:
+                _unlock(self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+    @property
+    def path(self):
+        """Get the path of the lock file"""
+        return self._path
+
+
+def _lock(fd):
+    """Take an exclusive lock on this file descriptor without blocking"""
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(fd):
+    """Release the lock held on this file descriptor"""
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,236 @@
+import bz2
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 48-bit magic numbers that start a compressed block (BCD pi) and that end
+# a compressed stream (BCD sqrt(pi)). They are not aligned on bytes.
+BLOCK_MAGIC = 0x314159265359
+EOS_MAGIC = 0x177245385090
+# header of a stream whose blocks may be up to 900k long
+STREAM_HEADER = 0x425A6839  # 'BZh9'
+# compressed byte size above which parallel decompression pays off
+MIN_PARALLEL_SIZE = 32 * 1024 * 1024
+
+
+def iter_decompressed(chunks, workers=None):
+    """Decompress a bz2 stream of byte chunks block by block in a pool of
+    workers. The decompressed data is yielded in the order of the blocks.
+
+    The bz2 module releases the GIL while decompressing, so the blocks are
+    decompressed in parallel by threads without the cost and the
+    bootstrapping constraints of worker processes.
+
+    Parameters
+    ----------
+    chunks : iterable
+        the byte chunks of one or several concatenated bz2 streams
+    workers : int, optional
+        the number of blocks decompressed concurrently,
+        by default the number of CPUs
+    """
+    workers = workers or os.cpu_count() or 1
+    # the number of blocks being decompressed is bounded to keep memory flat
+    max_pending = 2 * workers
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for block in _iter_blocks(chunks):
+            pending.append((executor.submit(bz2.decompress, block[0]), block))
+            while len(pending) >= max_pending:
+                yield _pop_result(pending)
+        while pending:
+            yield _pop_result(pending)
+    finally:
+        for future, _ in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def is_worth_parallelizing(size):
+    """Check if a bz2 stream of this byte size is decompressed faster in
+    parallel
+    """
+    return size >= MIN_PARALLEL_SIZE and (os.cpu_count() or 1) > 1
+
+
+def decompress_file(in_path, out_path, workers=None, chunk_size=1 << 20):
+    """Decompress a bz2 file into this path with a pool of workers"""
+    with open(in_path, "rb") as in_f, open(out_path, "wb") as out_f:
+        chunks = iter(lambda: in_f.read(chunk_size), b"")
+        for data in iter_decompressed(chunks, workers=workers):
+            out_f.write(data)
+
+
+def _pop_result(pending):
+    """Get the decompressed data of the first pending block. A block that
+    cannot be decompressed was split on a false magic number: it is then
+    merged with the following block(s) and decompressed here.
+    """
+    future, block = pending.popleft()
+    try:
+        return future.result()
+    except (OSError, ValueError, EOFError):
+        pieces = [block]
+        while pending:
+            next_future, next_block = pending.popleft()
+            next_future.cancel()
+            pieces.append(next_block)
+            try:
+                return bz2.decompress(_merge_pieces(pieces))
+            except (OSError, ValueError, EOFError):
+                continue
+        raise OSError("invalid bz2 block")
+
+
+def _iter_blocks(chunks):
+    """Cut a stream of bz2 chunks into standalone single-block streams
+
+    Yields
+    ------
+    tuple
+        the standalone stream of a block, its bits as int, its bit length
+        and its CRC
+    """
+    buf = bytearray()
+    marks = []  # bit offsets and kinds of the magic numbers found in buf
+    last_bit = -1
+    scan_pos = 0
+    is_bz2 = False
+    for chunk in chunks:
+        buf += chunk
+        # magic numbers may overlap the previous chunk
+        for mark in _find_marks(buf, max(0, scan_pos - 7)):
+            if mark[0] > last_bit:
+                marks.append(mark)
+                last_bit = mark[0]
+                is_bz2 = True
+        scan_pos = len(buf)
+
+        yield from _pop_blocks(buf, marks, final=False)
+
+        # forget the bytes that precede the first pending magic number
+        cut = marks[0][0] // 8 if marks else max(0, len(buf) - 7)
+        if cut:
+            del buf[:cut]
+            marks[:] = [(bit - cut * 8, kind) for bit, kind in marks]
+            last_bit -= cut * 8
+            scan_pos -= cut
+
+    yield from _pop_blocks(buf, marks, final=True)
+
+    if marks:
+        raise EOFError("compressed stream ended prematurely")
+    if not is_bz2 and buf:
+        raise OSError("not a bz2 stream")
+
+
+def _pop_blocks(buf, marks, final):
+    """Pop the blocks whose end has been found from the magic numbers
+    found in a buffer. A block ends at the next block magic number or at the
+    end-of-stream magic number. An end-of-stream magic number is only
+    trusted when followed by the end of the data or by the header of a new
+    stream, otherwise it is part of the compressed data of a block.
+    """
+    while marks:
+        start, kind = marks[0]
+        if kind == EOS_MAGIC:
+            if len(marks) < 2 and not final:
+                break
+            del marks[0]
+            continue
+
+        end = None
+        i = 1
+        while i < len(marks):
+            bit, kind = marks[i]
+            if kind == BLOCK_MAGIC:
+                end = bit
+            elif i + 1 < len(marks):
+                # EOS, CRC, padding and 'BZh9' precede the next magic number
+                if 112 <= marks[i + 1][0] - bit <= 119:
+                    end = bit
+                else:
+                    del marks[i]
+                    continue
+            elif final:
+                end = bit
+            break
+
+        if end is None:
+            break
+        yield _get_block(buf, start, end)
+        del marks[0]
+
+
+def _find_marks(buf, from_pos):
+    """Find the block and end-of-stream magic numbers in a buffer
+
+    Returns
+    -------
+    list
+        sorted tuples of magic number bit offsets and values
+    """
+    marks = []
+    for magic in (BLOCK_MAGIC, EOS_MAGIC):
+        for shift in range(8):
+            # only the bytes fully covered by the magic number are searched
+            if shift:
+                pattern = (magic << (8 - shift)).to_bytes(7, "big")[1:6]
+                offset = 8 - shift
+            else:
+                pattern = magic.to_bytes(6, "big")
+                offset = 0
+            pos = buf.find(pattern, from_pos)
+            while pos >= 0:
+                bit = pos * 8 - offset
+                is_full = bit >= 0 and bit + 48 <= len(buf) * 8
+                if is_full and _read_bits(buf, bit, 48) == magic:
+                    marks.append((bit, magic))
+                pos = buf.find(pattern, pos + 1)
+
+    return sorted(marks)
+
+
+def _read_bits(buf, bit_offset, nb_bits):
+    """Read this number of bits from a buffer as an integer"""
+    start = bit_offset // 8
+    end = (bit_offset + nb_bits + 7) // 8
+    value = int.from_bytes(buf[start:end], "big")
+    shift = (end - start) * 8 - bit_offset % 8 - nb_bits
+
+    return (value >> shift) & ((1 << nb_bits) - 1)
+
+
+def _get_block(buf, start, end):
+    """Get the block found between these bit offsets"""
+    nb_bits = end - start
+    bits = _read_bits(buf, start, nb_bits)
+    crc = _read_bits(buf, start + 48, 32)
+
+    return (_build_stream(bits, nb_bits, crc), bits, nb_bits, crc)
+
+
+def _merge_pieces(pieces):
+    """Build the stream of a block made of several pieces"""
+    bits, nb_bits = 0, 0
+    for _, piece_bits, piece_nb_bits, _ in pieces:
+        bits = (bits << piece_nb_bits) | piece_bits
+        nb_bits += piece_nb_bits
+
+    return _build_stream(bits, nb_bits, pieces[0][3])
+
+
+def _build_stream(bits, nb_bits, crc):
+    """Wrap the bits of a block into a standalone bz2 stream. The combined
+    CRC of a single-block stream is the CRC of its block.
+    """
+    value = (STREAM_HEADER << nb_bits) | bits
+    value = (((value << 48) | EOS_MAGIC) << 32) | crc
+    total_bits = 32 + nb_bits + 48 + 32
+    padding = -total_bits % 8
+
+    return (value << padding).to_bytes((total_bits + padding) // 8, "big")
@@ -0,0 +1,750 @@
+import csv
+import io
+import logging
+import re
+from functools import lru_cache
+from io import StringIO
+from itertools import islice, repeat, zip_longest
+
+logger = logging.getLogger(__name__)
+
+# the number of characters parsed at once
+BLOCK_SIZE = 1024 * 1024
+# the number of rows per batch when a file cannot be cut into blocks
+BATCH_SIZE = 10000
+
+
+def iter_batches(
+    f,
+    delimiter="\t",
+    escapechar="\\",
+    quoting=csv.QUOTE_NONE,
+    nb_cols=None,
+    text_col=None,
+    block_size=BLOCK_SIZE,
+    **csv_params,
+):
+    """Parse a delimited text file by large blocks of rows
+
+    Each block is cut after its last unescaped line terminator. When all its
+    lines have the expected number of fields, the block is split into
+    columns at once. Otherwise, its lines are parsed one by one, by a csv
+    reader when they contain escaped delimiters or line terminators, then
+    the rows split over several lines are merged and the extra fields of
+    the text column are joined, like the row iterator of the data files has
+    always done. A blank line is a line of no fields: it may continue the
+    row before it too.
+
+    Parameters
+    ----------
+    f : file-like object
+        the text file to parse, from its current position
+    delimiter : str, optional
+        the field delimiter, by default "\t"
+    escapechar : str, optional
+        the character that removes any special meaning from the following
+        character, by default "\\"
+    quoting : csv module constant, optional
+        the field quoting rule, by default csv.QUOTE_NONE
+    nb_cols : int, optional
+        the expected number of fields per row, by default None
+    text_col : int, optional
+        the column whose text may include additional delimiter or line
+        terminator characters, by default None
+    block_size : int, optional
+        the number of characters parsed at once, by default BLOCK_SIZE
+    csv_params : dict
+        the other csv dialect parameters (e.g. 'quotechar')
+
+    Yields
+    ------
+    list
+        the columns of a batch of rows, each column being a list of fields.
+        Without a number of columns, the fields missing in the shorter rows
+        of a batch are None.
+    """
+    csv_params.update(
+        delimiter=delimiter, escapechar=escapechar, quoting=quoting
+    )
+    parser = _BatchParser(nb_cols, text_col, csv_params)
+    if quoting == csv.QUOTE_NONE:
+        batches = map(parser.parse, _iter_blocks(f, block_size, escapechar))
+    else:  # quoted fields may span lines
+        rd = csv.reader(f, **csv_params)
+        raw_batches = iter(lambda: list(islice(rd, BATCH_SIZE)), [])
+        batches = map(parser.parse_rows, raw_batches)
+
+    # a batch is held back until the next one, so that the last row of the
+    # file does not make a batch on its own
+    columns = []
+    for next_columns in batches:
+        if next_columns:
+            if columns:
+                yield columns
+            columns = next_columns
+    last_row = parser.close()
+    if last_row:
+        if columns:
+            for column, field in zip(columns, last_row):
+                column.append(field)
+        else:
+            columns = [[field] for field in last_row]
+    if columns:
+        yield columns
+
+
+def iter_rows(batches):
+    """Iterate over the rows of these batches of columns
+
+    Yields
+    ------
+    list
+        the fields of a row
+    """
+    for columns in batches:
+        rows = zip(*columns)
+        if None in columns[-1]:  # rows of various lengths
+            rows = (_strip_missing(row) for row in rows)
+        yield from map(list, rows)
+
+
+def iter_repaired_text(
+    f,
+    delimiter="\t",
+    escapechar="\\",
+    nb_cols=None,
+    text_col=None,
+    block_size=BLOCK_SIZE,
+    **csv_params,
+):
+    """Iterate over the text of a file whose malformed rows are repaired
+
+    The lines that have the expected number of fields are kept as they are,
+    so that the text can be read by a faster parser (e.g. the C engine of
+    'pandas.read_csv'). Only the ranges of lines around the malformed ones
+    are parsed like 'iter_batches' does, then written back with the same
+    dialect. The fields are not quoted and the lines end with "\n".
+
+    Parameters
+    ----------
+    f : file-like object
+        the text file to repair, from its current position
+    delimiter : str, optional
+        the field delimiter, by default "\t"
+    escapechar : str, optional
+        the character that removes any special meaning from the following
+        character, by default "\\"
+    nb_cols : int
+        the expected number of fields per row, at least 2
+    text_col : int, optional
+        the column whose text may include additional delimiter or line
+        terminator characters, by default None
+    block_size : int, optional
+        the number of characters repaired at once, by default BLOCK_SIZE
+    csv_params : dict
+        the other csv dialect parameters (e.g. 'quotechar')
+
+    Yields
+    ------
+    str
+        the repaired text of a block of lines
+    """
+    if not nb_cols or nb_cols < 2:
+        raise ValueError("at least 2 columns are expected to repair lines")
+    csv_params.update(
+        delimiter=delimiter,
+        escapechar=escapechar,
+        quoting=csv.QUOTE_NONE,
+        lineterminator="\n",
+    )
+    repairer = _LineRepairer(nb_cols, text_col, csv_params)
+    for block in _iter_blocks(f, block_size, escapechar):
+        yield repairer.repair(block)
+    yield repairer.close()
+
+
+def find_row_start(f, offset, delimiter="\t", escapechar="\\", nb_cols=None):
+    """Find the first position after this offset from which the rows of a
+    file can be parsed without its previous lines
+
+    A line with the expected number of fields and without escape or
+    carriage return character ends a row: the next line cannot continue it
+    when it is such a line too.
+
+    Parameters
+    ----------
+    f : file-like object
+        the binary file in which the position is searched
+    offset : int
+        the byte position after which the search starts
+    delimiter : str, optional
+        the field delimiter, by default "\t"
+    escapechar : str, optional
+        the escape character, by default "\\"
+    nb_cols : int
+        the expected number of fields per row, at least 2
+
+    Returns
+    -------
+    int
+        the byte position of the start of a row, None if there is none
+        after this offset
+    """
+    dm = delimiter.encode("utf-8")
+    ec = escapechar.encode("utf-8") if escapechar else None
+    f.seek(offset)
+    f.readline()  # the end of the line at this offset
+    previous_ok = False
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line:
+            return None
+        if line.endswith(b"\n"):
+            line = line[:-1]
+        ok = (
+            line.count(dm) == nb_cols - 1
+            and not (ec and ec in line)
+            and b"\r" not in line
+        )
+        if previous_ok and ok:
+            return pos
+        previous_ok = ok
+
+
+def _strip_missing(row):
+    """Remove the missing fields at the end of a row"""
+    return row[: row.index(None)] if None in row else row
+
+
+class ChunkedStream(io.TextIOBase):
+    """A read-only text stream over an iterable of text chunks"""
+
+    def __init__(self, chunks=()):
+        """
+        Parameters
+        ----------
+        chunks : iterable, optional
+            the strings read one after the other, by default none
+        """
+        self._chunks = iter(chunks)
+        self._reset()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [self._buf[self._buf_pos :]]
+            while not self._eof:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    self._eof = True
+                else:
+                    parts.append(chunk)
+            data = "".join(parts)
+            self._buf, self._buf_pos = "", 0
+        else:
+            while len(self._buf) - self._buf_pos < size and not self._eof:
+                self._fill()
+            data = self._buf[self._buf_pos : self._buf_pos + size]
+            self._buf_pos += len(data)
+        self._pos += len(data)
+
+        return data
+
+    def readline(self, size=-1):
+        i = self._buf.find("\n", self._buf_pos)
+        while i < 0 and not self._eof:
+            self._fill()
+            i = self._buf.find("\n", self._buf_pos)
+        end = len(self._buf) if i < 0 else i + 1
+        if size is not None and size >= 0:
+            end = min(end, self._buf_pos + size)
+        line = self._buf[self._buf_pos : end]
+        self._buf_pos = end
+        self._pos += len(line)
+
+        return line
+
+    def tell(self):
+        """Get the number of characters read"""
+        return self._pos
+
+    def _reset(self):
+        """Start reading from the beginning of the chunks"""
+        self._buf = ""
+        self._buf_pos = 0
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Append the next chunk to the unread characters"""
+        chunk = self._next_chunk()
+        if chunk is None:
+            self._eof = True
+        else:
+            self._buf = self._buf[self._buf_pos :] + chunk
+            self._buf_pos = 0
+
+    def _next_chunk(self):
+        """Get the next chunk, None when there is none left"""
+        return next(self._chunks, None)
+
+
+class CleanedStream(ChunkedStream):
+    """A read-only text stream that removes the known problematic characters
+    of a data file while it is read
+
+    The file is cleaned chunk by chunk. The end of a chunk that may belong
+    to a sequence to clean is carried over to the next chunk, so that the
+    text is the same as if the whole file had been cleaned at once.
+    """
+
+    def __init__(self, f, delimiter="\t", chunk_size=BLOCK_SIZE):
+        """
+        Parameters
+        ----------
+        f : file-like object
+            the text file to clean
+        delimiter : str, optional
+            the field delimiter of the file, by default "\t"
+        chunk_size : int, optional
+            the number of characters cleaned at once, by default BLOCK_SIZE
+        """
+        self._f = f
+        self._chunk_size = chunk_size
+        self._repairs = _get_repairs(delimiter)
+        # the characters of the sequences to clean
+        self._special = {"\n", "\\", delimiter}
+        super().__init__()
+
+    def seekable(self):
+        return True
+
+    @property
+    def source(self):
+        """Get the file object that is cleaned"""
+        return self._f
+
+    def tell(self):
+        """Get the number of cleaned characters read"""
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Rewind the stream. Other positions are not supported."""
+        if offset or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("a cleaned stream can only rewind")
+        self._f.seek(0)
+        self._reset()
+
+        return 0
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+    def _reset(self):
+        """Start cleaning from the beginning of the file"""
+        super()._reset()
+        self._carry = ""
+        self._done = False
+
+    def _next_chunk(self):
+        """Clean the next chunk of the file"""
+        if self._done:
+            return None
+        data = self._f.read(self._chunk_size)
+        if data:
+            text = self._carry + data
+            # no sequence to clean overlaps a cut after a common character
+            cut = len(text)
+            while cut and text[cut - 1] in self._special:
+                cut -= 1
+            text, self._carry = text[:cut], text[cut:]
+        else:
+            text, self._carry = self._carry, ""
+            self._done = True
+        for pattern, repl in self._repairs:
+            text = pattern.sub(repl, text)
+
+        return text
+
+
+def clean_text(text, delimiter="\t"):
+    """Remove the known problematic characters of a data file text, like
+    CleanedStream does
+    """
+    for pattern, repl in _get_repairs(delimiter):
+        text = pattern.sub(repl, text)
+
+    return text
+
+
+@lru_cache(maxsize=None)
+def _get_escaped_pattern(escapechar):
+    """Get the pattern of the characters escaped by this escape character"""
+    return re.compile(re.escape(escapechar) + ".", re.DOTALL)
+
+
+@lru_cache(maxsize=None)
+def _get_repairs(delimiter):
+    """Get the patterns of the problematic sequences of characters of a data
+    file, with their replacements
+    """
+    return (
+        # multiline 'details' fields in 'user_languages' table have
+        # escaped new lines that can be removed
+        (re.compile(r"\n\\\n"), "  "),
+        # the 'list_name' field of the 'user_lists' table may have
+        # escaped tab delimiter that can be removed
+        (re.compile(r"\\" + re.escape(delimiter) + "+"), " "),
+    )
+
+
+def _iter_blocks(f, block_size, escapechar):
+    """Iterate over blocks of complete lines of a file"""
+    carry = ""
+    while True:
+        data = f.read(block_size)
+        if not data:
+            if carry:
+                yield carry
+            return
+        block = carry + data
+        cut = _find_cut(block, escapechar)
+        if cut < 0:  # no complete line yet
+            carry = block
+        else:
+            carry = block[cut:]
+            yield block[:cut]
+
+
+def _find_cut(block, escapechar):
+    """Get the position after the last line terminator that is not escaped
+    in this block, -1 if there is none
+    """
+    end = len(block)
+    while True:
+        i = block.rfind("\n", 0, end)
+        if i < 0 or not escapechar:
+            return i if i < 0 else i + 1
+        # a line terminator is escaped by an odd number of escape characters
+        j = i
+        while j > 0 and block[j - 1] == escapechar:
+            j -= 1
+        if not (i - j) % 2:
+            return i + 1
+        end = i
+
+
+def _has_escaped_separators(block, delimiter, escapechar):
+    """Check whether this block has escaped delimiters, line terminators or
+    escape characters, which only a csv reader parses correctly
+    """
+    if "\r" in block:
+        return True
+    if not escapechar or escapechar not in block:
+        return False
+
+    return (
+        escapechar * 2 in block
+        or escapechar + delimiter in block
+        or escapechar + "\n" in block
+        or block.endswith(escapechar)
+    )
+
+
+class _BatchParser:
+    """Parses the blocks of a file into batches of columns. The row that
+    ends a batch is kept until the next batch, which may continue it.
+    """
+
+    def __init__(self, nb_cols, text_col, csv_params):
+        self._nc = nb_cols
+        self._tc = text_col
+        self._dm = csv_params["delimiter"]
+        self._ec = csv_params["escapechar"]
+        self._csv_params = csv_params
+        # the last row parsed and the number of lines it is made of
+        self._row = None
+        self._cnt = 0
+
+    def parse(self, block):
+        """Get the columns of the rows that are complete in this block"""
+        if _has_escaped_separators(block, self._dm, self._ec):
+            rd = csv.reader(StringIO(block), **self._csv_params)
+            return self.parse_rows(list(rd))
+
+        if self._ec and self._ec in block:  # e.g. '\N' for NULL
+            block = block.replace(self._ec, "")
+        lines = block.split("\n")
+        if not lines[-1]:
+            lines.pop()
+        columns = self._split_columns(lines)
+        if columns is None:
+            # a blank line has no fields, like when read by a csv reader
+            raw_rows = [line.split(self._dm) if line else [] for line in lines]
+            return self.parse_rows(raw_rows)
+
+        return columns
+
+    def parse_rows(self, raw_rows):
+        """Get the columns of the rows that are complete in this batch of
+        raw rows
+        """
+        rows = self.merge_rows(raw_rows)
+        if self._nc:
+            return [list(column) for column in zip(*rows)]
+
+        return [list(column) for column in zip_longest(*rows)]
+
+    def merge_rows(self, raw_rows):
+        """Get the rows that are complete in this batch of raw rows. The
+        rows split over several lines are merged, then repaired. The last
+        row is kept until the next batch, which may continue it.
+        """
+        nc = self._nc
+        if not nc:
+            return [row for row in raw_rows if row]
+
+        # the regular rows after the last irregular one are not merged
+        lengths = list(map(len, raw_rows))
+        last_irregular = len(lengths) - 1
+        if lengths.count(nc) == len(lengths):
+            last_irregular = -1
+        else:
+            while lengths[last_irregular] == nc:
+                last_irregular -= 1
+
+        rows = []
+        row, cnt = self._row, self._cnt
+        for i, raw_row in enumerate(raw_rows):
+            if row is None:
+                row, cnt = raw_row, 1
+            elif len(row) - cnt + len(raw_row) <= nc:  # multiline row
+                row.extend(raw_row)
+                cnt += 1
+            else:
+                rows.append(row)
+                # a blank line that does not continue a row is dropped
+                row, cnt = raw_row or None, 1
+                if i > last_irregular and nc > 1:
+                    rows.extend(raw_rows[i:-1])
+                    row = raw_rows[-1]
+                    break
+        self._row, self._cnt = row, cnt
+
+        return self._repair(rows)
+
+    def close(self):
+        """Get the last row of the file, None if there is none"""
+        row, self._row = self._row, None
+        if row:
+            rows = self._repair([row])
+            if rows:
+                return rows[0]
+
+    def _split_columns(self, lines):
+        """Split these lines into columns at once. None is returned when the
+        lines do not all have the same number of fields, or when the first
+        one may continue the last row of the previous block.
+        """
+        nc = self._nc
+        if not lines or "" in lines:
+            return None
+        if nc:
+            row = self._row
+            if nc < 2 or (row is not None and len(row) <= self._cnt):
+                return None
+            nb_fields = nc
+        else:
+            nb_fields = lines[0].count(self._dm) + 1
+        counts = list(map(str.count, lines, repeat(self._dm)))
+        if counts.count(nb_fields - 1) != len(counts):
+            return None
+
+        fields = self._dm.join(lines).split(self._dm)
+        columns = [fields[k::nb_fields] for k in range(nb_fields)]
+        if nc:  # the last row may be continued by the next block
+            previous_rows = self._repair([self._row] if self._row else [])
+            self._row = [column.pop() for column in columns]
+            self._cnt = 1
+            for row in previous_rows:
+                for column, field in zip(columns, row):
+                    column.insert(0, field)
+
+        return columns
+
+    def _repair(self, rows):
+        """Join the extra fields of the text column and drop the rows that
+        still do not have the expected number of fields
+        """
+        nc, tc = self._nc, self._tc
+        if list(map(len, rows)).count(nc) == len(rows):
+            return rows
+        repaired = []
+        for row in rows:
+            nb_extra_cols = len(row) - nc
+            if nb_extra_cols > 0:  # field merger required
+                if tc is None:
+                    logger.debug(f"a text column is needed to repair {row}")
+                else:  # remove all delimiters from text field
+                    j = tc + nb_extra_cols + 1
+                    row[tc] = " ".join(row[tc:j])
+                    del row[tc + 1 : j]
+            if len(row) == nc:
+                repaired.append(row)
+            else:
+                logger.debug(f"bad row: {row}")
+
+        return repaired
+
+
+class _LineRepairer:
+    """Repairs the ranges of malformed lines of the blocks of a file. The
+    lines at the end of a block that may be merged with the next lines are
+    kept until the next block.
+    """
+
+    def __init__(self, nb_cols, text_col, csv_params):
+        self._nc = nb_cols
+        self._tc = text_col
+        self._dm = csv_params["delimiter"]
+        self._ec = csv_params["escapechar"]
+        self._csv_params = csv_params
+        self._lines = []
+
+    def repair(self, block):
+        """Get the repaired text of the lines of this block that cannot be
+        merged with the next lines
+        """
+        lines = block.split("\n")
+        if not lines[-1]:
+            lines.pop()
+        lines = self._lines + lines
+        if not lines:
+            return ""
+        ranges = self._find_ranges(lines)
+        # the last line may absorb the malformed first line of the next
+        # block, and a range that ends the block may go on
+        keep = len(lines) - 1
+        if ranges and ranges[-1][1] >= keep:
+            keep = ranges.pop()[0]
+        self._lines = lines[keep:]
+
+        return self._write(lines[:keep], ranges)
+
+    def close(self):
+        """Get the repaired text of the last lines of the file"""
+        lines, self._lines = self._lines, []
+
+        return self._write(lines, self._find_ranges(lines))
+
+    def _find_ranges(self, lines):
+        """Find the ranges of lines to parse, as (first, last) index pairs.
+        A range includes the line before its malformed lines, and the lines
+        after them up to the next well-formed row, which may be merged with
+        them.
+        """
+        k = self._nc - 1
+        counts = list(map(str.count, lines, repeat(self._dm)))
+        block = "\n".join(lines)
+        escaped = _has_escaped_separators(block, self._dm, self._ec)
+        if counts.count(k) == len(counts) and not escaped:
+            return []
+
+        bad = {i for i, cnt in enumerate(counts) if cnt != k}
+        if escaped:
+            bad.update(
+                i
+                for i, line in enumerate(lines)
+                if _has_escaped_separators(line, self._dm, self._ec)
+            )
+        nb_fields = self._count_fields(lines, counts)
+        ranges = []
+        for i in sorted(bad):
+            if ranges and i <= ranges[-1][1]:
+                continue
+            first = max(i - 1, 0)
+            if ranges and first <= ranges[-1][1]:
+                first = ranges.pop()[0]
+            last = self._find_last(nb_fields, bad, first, i)
+            ranges.append([first, last])
+
+        return ranges
+
+    def _count_fields(self, lines, counts):
+        """Count the fields of the raw rows starting on these lines, like a
+        csv reader reads them: a blank line has no fields, and the lines
+        after an escaped line terminator continue the raw row before them,
+        which is marked by None.
+        """
+        ec = self._ec
+        nb_fields = []
+        start = None
+        for line, cnt in zip(lines, counts):
+            escaped_end = False
+            if ec and ec in line:
+                cnt = _get_escaped_pattern(ec).sub("", line).count(self._dm)
+                escaped_end = (len(line) - len(line.rstrip(ec))) % 2 == 1
+            if start is None:
+                start = len(nb_fields)
+                nb_fields.append(cnt + 1 if line else 0)
+            else:
+                nb_fields[start] += cnt
+                nb_fields.append(None)
+            if not escaped_end:
+                start = None
+
+        return nb_fields
+
+    def _find_last(self, nb_fields, bad, first, i):
+        """Find the last line of the range of lines starting with this
+        first line, which includes this malformed line. The range ends
+        before the next well-formed line that the rows are not merged with.
+        """
+        nc = self._nc
+        row_len, cnt = nb_fields[first], 1
+        for j in range(first + 1, len(nb_fields)):
+            n = nb_fields[j]
+            if n is None:  # the same raw row
+                continue
+            if row_len is not None and row_len - cnt + n <= nc:
+                row_len += n  # multiline row
+                cnt += 1
+                continue
+            if j > i and j not in bad and j - 1 not in bad:
+                return j - 1
+            if row_len is None:
+                row_len, cnt = n, 1
+            else:  # a blank line that does not continue a row is dropped
+                row_len, cnt = n or None, 1
+
+        return len(nb_fields) - 1
+
+    def _write(self, lines, ranges):
+        """Join these lines, the ranges of which are parsed and written back"""
+        parts = []
+        start = 0
+        for first, last in ranges + [[len(lines), None]]:
+            if first > start:  # the well-formed lines are kept
+                parts.append("\n".join(lines[start:first]) + "\n")
+            if last is not None:
+                parts.append(self._rewrite(lines[first : last + 1]))
+                start = last + 1
+
+        return "".join(parts)
+
+    def _rewrite(self, lines):
+        """Parse these lines into repaired rows and write them back"""
+        parser = _BatchParser(self._nc, self._tc, self._csv_params)
+        rd = csv.reader(StringIO("\n".join(lines) + "\n"), **self._csv_params)
+        rows = parser.merge_rows(list(rd))
+        last_row = parser.close()
+        if last_row:
+            rows.append(last_row)
+        fb = StringIO()
+        csv.writer(fb, **self._csv_params).writerows(rows)
+
+        return fb.getvalue()
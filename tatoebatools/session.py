@@ -0,0 +1,55 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class Session(requests.Session):
+    """A pooled HTTP session shared by all requests to Tatoeba servers
+
+    Connections are kept alive and reused across requests, failed
+    requests are retried with an exponential backoff, and every request
+    gets a default timeout.
+    """
+
+    def __init__(
+        self, pool_size=16, retries=3, backoff_factor=0.5, timeout=(10, 60)
+    ):
+        """
+        Parameters
+        ----------
+        pool_size : int, optional
+            the maximum number of connections kept alive per host,
+            by default 16
+        retries : int, optional
+            the maximum number of retries of a failed request, by default 3
+        backoff_factor : float, optional
+            the factor of the exponential delay between retries,
+            by default 0.5
+        timeout : float or tuple, optional
+            the default connect and read timeouts in seconds,
+            by default (10, 60)
+        """
+        super().__init__()
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+
+        return super().request(method, url, **kwargs)
+
+
+default_session = Session()
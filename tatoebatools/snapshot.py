@@ -0,0 +1,159 @@
+import gzip
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .parser import iter_rows
+
+logger = logging.getLogger(__name__)
+
+# the extensions of the files of the snapshot of a data file
+FINGERPRINTS_EXT = ".fingerprints.npy"
+ROWS_EXT = ".rows.gz"
+# the rows are kept, since the removed rows are read back in full, but
+# compressed fast, since a snapshot is taken at every update
+ROWS_COMPRESSLEVEL = 1
+# the byte size of the chunks copied into the compressed rows
+CHUNK_SIZE = 1024 * 1024
+# the character joining the fields of a row into the string it is hashed from
+FIELD_SEPARATOR = "\x1f"
+
+
+class Snapshot:
+    """The compact snapshot of a data file, made of the sorted 64-bit
+    fingerprints of its rows and of its compressed rows
+
+    The snapshot of a former version of a data file is compared to the
+    current version without keeping a full copy of the former version.
+    The fingerprints alone tell which rows were removed, but the removed
+    rows are read back in full, which their key columns are not enough
+    for. So the rows are kept too, compressed: the snapshot takes a
+    fraction of the size of the plain copy of the former version it
+    replaces, at the cost of decompressing the rows when the next version
+    is compared to them.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : pathlib.Path
+            the path of the data file, next to which the files of its
+            snapshot are written
+        """
+        self._fp = path
+        self._fps_path = path.with_name(path.name + FINGERPRINTS_EXT)
+        self._rows_path = path.with_name(path.name + ROWS_EXT)
+
+    def exists(self):
+        """Check if this snapshot exists locally"""
+        return self._fps_path.is_file() and self._rows_path.is_file()
+
+    def write(self, fingerprints, data_path):
+        """Write the snapshot of the data file at this path, whose rows have
+        these sorted fingerprints
+        """
+        tmp_rows_path = self._rows_path.with_name(
+            self._rows_path.name + ".tmp"
+        )
+        with open(data_path, "rb") as in_f:
+            with gzip.open(
+                tmp_rows_path, "wb", compresslevel=ROWS_COMPRESSLEVEL
+            ) as out_f:
+                shutil.copyfileobj(in_f, out_f, CHUNK_SIZE)
+        tmp_fps_path = self._fps_path.with_name(self._fps_path.name + ".tmp")
+        with open(tmp_fps_path, "wb") as f:
+            np.save(f, fingerprints)
+        os.replace(tmp_rows_path, self._rows_path)
+        os.replace(tmp_fps_path, self._fps_path)
+        logger.debug(f"snapshot of {data_path.name} written")
+
+    def open_rows(self, encoding_errors=None):
+        """Open the text of the rows of this snapshot"""
+        return gzip.open(
+            self._rows_path, "rt", encoding="utf-8", errors=encoding_errors
+        )
+
+    @property
+    def fingerprints(self):
+        """Get the sorted fingerprints of the rows of this snapshot"""
+        return np.load(self._fps_path, mmap_mode="r")
+
+
+def hash_batch(columns):
+    """Get the 64-bit fingerprints of the rows of this batch of columns"""
+    # strings are hashed up to their first null character
+    lines = np.array(
+        [FIELD_SEPARATOR.join(row) for row in iter_rows([columns])],
+        dtype=object,
+    )
+
+    return pd.util.hash_array(lines)
+
+
+def get_fingerprints(batches):
+    """Get the sorted fingerprints of the rows of these batches of
+    columns
+    """
+    fingerprints = [hash_batch(columns) for columns in batches]
+    if not fingerprints:
+        return np.empty(0, dtype=np.uint64)
+    fingerprints = np.concatenate(fingerprints)
+    fingerprints.sort()
+
+    return fingerprints
+
+
+def diff_fingerprints(old_fingerprints, new_fingerprints):
+    """Compare the sorted fingerprints of two versions of the rows of a data
+    file as multisets
+
+    Returns
+    -------
+    tuple
+        the numbers of the 'removed' rows and of the 'added' rows by
+        fingerprint
+    """
+    old_values, old_counts = np.unique(old_fingerprints, return_counts=True)
+    new_values, new_counts = np.unique(new_fingerprints, return_counts=True)
+    values = np.union1d(old_values, new_values)
+    counts = np.zeros(len(values), dtype=np.int64)
+    counts[np.searchsorted(values, new_values)] += new_counts
+    counts[np.searchsorted(values, old_values)] -= old_counts
+
+    removed = counts < 0
+    added = counts > 0
+
+    return (
+        dict(zip(values[removed].tolist(), (-counts[removed]).tolist())),
+        dict(zip(values[added].tolist(), counts[added].tolist())),
+    )
+
+
+def select_rows(batches, counts):
+    """Iterate over the rows of these batches of columns whose fingerprints
+    are counted, as many times as they are counted
+
+    Yields
+    ------
+    list
+        the fields of a selected row
+    """
+    if not counts:
+        return
+    counts = dict(counts)
+    selected = np.fromiter(counts, dtype=np.uint64, count=len(counts))
+    for columns in batches:
+        fingerprints = hash_batch(columns)
+        indices = np.flatnonzero(np.isin(fingerprints, selected))
+        if not len(indices):
+            continue
+        rows = list(iter_rows([columns]))
+        for i in indices.tolist():
+            fingerprint = int(fingerprints[i])
+            if counts[fingerprint]:
+                counts[fingerprint] -= 1
+                yield rows[i]
@@ -1,16 +1,30 @@
 import logging
+from concurrent.futures import wait
 from pathlib import Path
 
 from .config import (
     DATA_DIR,
     DIFFERENCE_TABLES,
+    INDEXED_TABLES,
     TABLE_CLASSES,
     TABLE_CSV_PARAMS,
     TABLE_DATAFRAME_PARAMS,
 )
 from .datafile import DataFile
-from .exceptions import NotLanguage, NotLanguagePair, NotTable
-from .update import Update, check_languages, check_tables
+from .exceptions import (
+    NotIndexedTable,
+    NotLanguage,
+    NotLanguagePair,
+    NotStoredVersion,
+    NotTable,
+)
+from .generation import resolve_path
+from .update import (
+    Update,
+    background_updates,
+    check_languages,
+    check_tables,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +46,11 @@ class Table:
         row_filters=[],
         update=True,
         verbose=True,
+        max_workers=None,
+        max_workers_per_host=None,
+        session=None,
+        max_age=None,
+        since=None,
     ):
         """
         Parameters
@@ -51,10 +70,32 @@ class Table:
             'col_index': the column for which the rows are filtered by value
             'ok_values': the allowed values in the filter column
             'converter' (optional): a converter applied to the filter column
-        update : bool, optional
-            whether the table data is updated or not, by default True
+        update : bool or str, optional
+            whether the table data is updated or not, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in a background thread. The updated data is read
+            once the update is complete.
         verbose : bool, optional
             verbosity level for the various methods, by default True
+        max_workers : int, optional
+            the maximum number of files downloaded concurrently during
+            an update, by default None (config default)
+        max_workers_per_host : int, optional
+            the maximum number of concurrent downloads from a same host,
+            by default None (config default)
+        session : requests.Session, optional
+            the HTTP session through which Tatoeba servers are requested,
+            by default None (default pooled session)
+        max_age : int or str, optional
+            the time in seconds during which a data file is not checked again
+            for updates, or 'export' to check it only once its next export is
+            expected, by default None (config default)
+        since : datetime, optional
+            with an "added" or "removed" scope, the datetime of the older
+            local version the table data is compared to. The changes since
+            this version must have been logged by the updates that followed
+            it, otherwise NotStoredVersion is raised, by default None
+            (former local version)
 
         Raises
         ------
@@ -72,6 +113,11 @@ class Table:
         self._upd = update
         self._vb = verbose
         self._rf = row_filters
+        self._mw = max_workers
+        self._mwph = max_workers_per_host
+        self._session = session
+        self._max_age = max_age
+        self._since = since
 
         # check validity of arguments
         self._check_table_name_validity()
@@ -83,6 +129,8 @@ class Table:
         self._flg = self._get_filter_lang()
 
         # run necessary updates
+        self._update = None
+        self._is_stale = False
         if self._upd:
             self._update_required_files()
 
@@ -90,6 +138,7 @@ class Table:
         self._it = iter(self._dfile)
 
     def __iter__(self):
+        self._refresh()
         self._it = iter(self._dfile)
 
         return self
@@ -108,11 +157,71 @@ class Table:
         pandas.DataFrame
             the dataframe version of this 'Table'
         """
+        self._refresh()
         params = self._get_dataframe_params(self._name)
         params.update(parameters)
 
         return self._dfile.as_dataframe(**params)
 
+    def get(self, ids):
+        """Get the rows of this 'Table' with these ids, without reading the
+        rows of other ids. The rows of a local data file are read through
+        its index by id.
+
+        Parameters
+        ----------
+        ids : list
+            the ids of the rows, found in their first column
+
+        Returns
+        -------
+        list
+            the rows found, by id in the order of these ids
+
+        Raises
+        ------
+        NotIndexedTable
+            raised when the rows of this table do not start with an id
+        """
+        if self._name not in INDEXED_TABLES:
+            raise NotIndexedTable(self._name)
+        self._refresh()
+
+        return [
+            TABLE_CLASSES[self._name](*row)
+            for row in self._dfile.get_rows(ids)
+        ]
+
+    def slice(self, offset, limit=None):
+        """Get the rows of this 'Table' between these positions in the order
+        of their ids
+
+        Parameters
+        ----------
+        offset : int
+            the position of the first row
+        limit : int, optional
+            the maximum number of rows, by default None (no limit)
+
+        Returns
+        -------
+        list
+            the rows between these positions
+
+        Raises
+        ------
+        NotIndexedTable
+            raised when the rows of this table do not start with an id
+        """
+        if self._name not in INDEXED_TABLES:
+            raise NotIndexedTable(self._name)
+        self._refresh()
+
+        return [
+            TABLE_CLASSES[self._name](*row)
+            for row in self._dfile.slice_rows(offset, limit)
+        ]
+
     @property
     def path(self):
         """Gzt the path of this 'Table' data file
@@ -123,10 +232,12 @@ class Table:
             The local path of the file containing data for this 'Table'
         """
 
-        return self._get_file_path(
-            table_name=self._name,
-            language_codes=self._lgs,
-            scope=self._scp,
+        return resolve_path(
+            self._get_file_path(
+                table_name=self._name,
+                language_codes=self._lgs,
+                scope=self._scp,
+            )
         )
 
     def _check_table_name_validity(self):
@@ -135,9 +246,19 @@ class Table:
             raise NotTable(self._name)
 
     def _check_language_codes_validity(self):
-        """Checks if the language code(s) of this 'Table' is/are valid"""
-        all_languages = set(check_languages()) | {"*"}
-        not_available_langs = set(self._lgs) - all_languages
+        """Checks if the language code(s) of this 'Table' is/are valid.
+        The language codes are first checked against the cached language
+        listing. The listing is only requested again when a language is
+        missing and the table is updated.
+        """
+        languages = check_languages(session=self._session, offline=True)
+        if self._upd and not set(self._lgs) <= set(languages) | {"*"}:
+            languages = check_languages(session=self._session)
+        if languages:
+            all_languages = set(languages) | {"*"}
+            not_available_langs = set(self._lgs) - all_languages
+        else:  # offline without cached listing
+            not_available_langs = set()
         if self._name == "links":
             if len(self._lgs) != 2 or not_available_langs:
                 raise NotLanguagePair(self._lgs)
@@ -163,9 +284,60 @@ class Table:
         q = [(self._name, self._lgs)]
         if self._flg["lang"]:  # update filtered sentence ids
             q.append(("sentences_detailed", [self._flg["lang"]]))
-        update = Update(q, data_dir=self._data_dir)
+        update = Update(q, data_dir=self._data_dir, session=self._session)
+        run_parameters = {
+            "verbose": self._vb,
+            "max_workers": self._mw,
+            "max_workers_per_host": self._mwph,
+            "max_age": self._max_age,
+        }
+        if self._upd == "background":
+            self._update = background_updates.submit(update, **run_parameters)
+            self._is_stale = True
+        else:
+            update.run(**run_parameters)
+
+    def wait_update(self, timeout=None):
+        """Wait for the completion of the background update of this 'Table'
+
+        Parameters
+        ----------
+        timeout : float, optional
+            the maximum number of seconds to wait, by default None (no limit)
+
+        Returns
+        -------
+        bool
+            whether the update is complete
+        """
+        if self._update:
+            wait([self._update], timeout=timeout)
+
+        return self.update_status != "running"
 
-        update.run(verbose=self._vb)
+    @property
+    def update_status(self):
+        """Get the status of the background update of this 'Table'
+
+        Returns
+        -------
+        str
+            'running', 'done' or 'failed', None without background update
+        """
+        if not self._update:
+            return
+        elif not self._update.done():
+            return "running"
+        elif self._update.cancelled() or self._update.exception():
+            return "failed"
+        else:
+            return "done"
+
+    def _refresh(self):
+        """Read the updated data once the background update is complete"""
+        if self._is_stale and self._update.done():
+            self._is_stale = False
+            self._dfile = self._build_datafile()
 
     def _build_datafile(self):
         dfile = self._get_datafile(self._name, self._lgs, self._scp)
@@ -181,8 +353,10 @@ class Table:
                     "ok_values": set(sent_dfile.as_dataframe(usecols=[0])[0]),
                     "converter": int,
                 }
-                self._rf.append(new_filter)
-                return dfile.extract_rows(row_filters=self._rf)
+                # the filters of the caller are left unchanged, so that a
+                # refresh filters the ids of the updated sentences only
+                row_filters = self._rf + [new_filter]
+                return dfile.extract_rows(row_filters=row_filters)
             else:  # faster
                 ids_dframe = sent_dfile.as_dataframe(usecols=[0])
                 return dfile.join(
@@ -192,7 +366,10 @@ class Table:
         return dfile.extract_rows(row_filters=self._rf)
 
     def _get_datafile(self, table_name, language_codes, scope):
-        fp = self._get_file_path(table_name, language_codes, scope)
+        # the current generation is read until the next reopening
+        fp = resolve_path(
+            self._get_file_path(table_name, language_codes, scope)
+        )
         params = self._get_file_csv_params(table_name)
         dfile = DataFile(fp, **params)
 
@@ -200,8 +377,18 @@ class Table:
         if scope != "all" and any(
             t in dfile.path.stem for t in DIFFERENCE_TABLES
         ):
-            path_all = self._get_file_path(table_name, language_codes, "all")
+            path_all = resolve_path(
+                self._get_file_path(table_name, language_codes, "all")
+            )
             dfile_all = DataFile(path_all, **params)
+            if self._since is not None:
+                diffs = dfile_all.find_changes(
+                    save=False, verbose=self._vb, since=self._since
+                )
+                # the difference files of the last update are not a fallback
+                if scope not in diffs:
+                    raise NotStoredVersion(self._since)
+                return diffs[scope]
             if not dfile.version or dfile.version < dfile_all.version:
                 diffs = dfile_all.find_changes(save=True, verbose=self._vb)
                 return diffs.get(scope)
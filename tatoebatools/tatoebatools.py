@@ -2,10 +2,12 @@ import logging
 from pathlib import Path
 
 from .config import DATA_DIR
+from .download_page import download_pages
+from .session import Session
 from .table import Table
-from .update import check_languages, check_tables
+from .update import background_updates, check_languages, check_tables
 from .utils import lazy_property
-from .version import version
+from .version import validators, version
 
 logger = logging.getLogger(__name__)
 
@@ -19,17 +21,52 @@ class Tatoeba:
     https://tatoeba.org/eng/downloads
     """
 
-    def __init__(self, data_dir=None):
+    def __init__(
+        self,
+        data_dir=None,
+        max_workers=None,
+        max_workers_per_host=None,
+        session=None,
+        offline=False,
+        max_age=None,
+    ):
         """
         Parameters
         ----------
         data_dir : str, optional
             The path of the directory where the Tatoeba data is saved
             If None, the data is saved into the tatoebatools package
+        max_workers : int, optional
+            The maximum number of files downloaded concurrently during
+            an update. If None, the config default is used.
+        max_workers_per_host : int, optional
+            The maximum number of concurrent downloads from a same host.
+            If None, the config default is used.
+        session : tatoebatools.session.Session, optional
+            The pooled HTTP session used for all requests to Tatoeba
+            servers. If None, a new session with default retry and timeout
+            settings is created.
+        offline : bool, optional
+            Whether the Tatoeba servers are never requested. If True, data
+            files are not updated and only the cached export listings are
+            read. By default False.
+        max_age : int or str, optional
+            The time in seconds during which a data file is not checked
+            again for updates, or 'export' to check it only once its next
+            weekly export is expected. If None, the config default is used.
         """
         self._dir = Path(data_dir) if data_dir else DATA_DIR
+        self._mw = max_workers
+        self._mwph = max_workers_per_host
+        self._session = session or Session()
+        self._offline = offline
+        self._max_age = max_age
         if version.dir != self._dir:
             version.dir = self._dir
+        if validators.dir != self._dir:
+            validators.dir = self._dir
+        if download_pages.dir != self._dir:
+            download_pages.dir = self._dir
 
     def sentences_detailed(
         self, language, scope="all", update=True, verbose=True
@@ -47,8 +84,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -60,10 +99,9 @@ class Tatoeba:
             attributes.
         """
         return iter(
-            Table(
+            self._get_table(
                 "sentences_detailed",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -84,8 +122,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -96,10 +136,9 @@ class Tatoeba:
             base_of_the_sentence attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "sentences_base",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -121,8 +160,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -133,10 +174,9 @@ class Tatoeba:
             date_last_modified attributes.
         """
         return iter(
-            Table(
+            self._get_table(
                 "sentences_CC0",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -169,8 +209,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -181,10 +223,9 @@ class Tatoeba:
             attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "links",
                 language_codes=[source_language, target_language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -205,8 +246,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -216,10 +259,9 @@ class Tatoeba:
             Tag instances with sentence_id and tag_name attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "tags",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -235,8 +277,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -247,10 +291,9 @@ class Tatoeba:
             date_last_modified, list_name and editable_by attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "user_lists",
                 language_codes=[],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -274,8 +317,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -286,10 +331,9 @@ class Tatoeba:
             attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "sentences_in_lists",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -305,8 +349,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -317,10 +363,9 @@ class Tatoeba:
             attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "jpn_indices",
                 language_codes=[],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -343,8 +388,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -355,10 +402,9 @@ class Tatoeba:
             license and attribution_url attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "sentences_with_audio",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -379,8 +425,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -391,10 +439,9 @@ class Tatoeba:
             username and details attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "user_languages",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -415,8 +462,10 @@ class Tatoeba:
             The scope of the data.
             Use default 'all' to get all latest data. Use 'added' or 'removed'
             to get only differences with the former local data.
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -427,10 +476,9 @@ class Tatoeba:
             script_name, username and transcription attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "transcriptions",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope=scope,
                 update=update,
                 verbose=verbose,
@@ -447,8 +495,10 @@ class Tatoeba:
             Use '*' to designate all supported languages.
             Call the 'all_languages' attribute to get the list
             of all supported languages
-        update : bool
-            Whether a data file is updated before being read, by default True
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool
             Whether update steps are printed, by default True
 
@@ -459,10 +509,9 @@ class Tatoeba:
             attributes
         """
         return iter(
-            Table(
+            self._get_table(
                 "queries",
                 language_codes=[language],
-                data_dir=self._dir,
                 scope="all",
                 update=update,
                 verbose=verbose,
@@ -477,6 +526,7 @@ class Tatoeba:
         row_filters=[],
         update=True,
         verbose=True,
+        since=None,
         **read_csv_parameters
     ):
         """Get the DataFrame of a monolinguel or multilingual Tatoeba table
@@ -503,10 +553,17 @@ class Tatoeba:
             'col_index': the column for which the rows are filtered by value
             'ok_values': the allowed values in the filter column
             'converter' (optional): a converter applied to the filter column
-        update : bool, optional
-            Whether a data file is updated before being read, by default True
+        update : bool or str, optional
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
         verbose : bool, optional
             Whether update steps are printed, by default True
+        since : datetime, optional
+            With the 'added' or 'removed' scope, the datetime of an older
+            local version to get the differences with, instead of the
+            former local data. Its changes must have been logged by the
+            updates that followed it.
         read_csv_parameters : dict, optional
             The tatoebatools default configuration can be overwritten by
             providing these parameters to 'pandas.read_csv'.
@@ -517,18 +574,63 @@ class Tatoeba:
         pandas.DataFrame
             The dataframe object of a Tatoeba export datafile
         """
-        self._curtable = Table(
+        self._curtable = self._get_table(
             table_name,
             language_codes=language_codes,
-            data_dir=self._dir,
             scope=scope,
             row_filters=row_filters,
             update=update,
             verbose=verbose,
+            since=since,
         )
 
         return self._curtable.as_dataframe(**read_csv_parameters)
 
+    def sentence(self, sentence_id, update=True, verbose=True):
+        """Get the sentence with this id, read through the index of the
+        sentences in all languages
+
+        Parameters
+        ----------
+        sentence_id : int
+            The id of a Tatoeba sentence
+        update : bool or str
+            Whether a data file is updated before being read, by default True.
+            Set to 'background' to read the local data at once while the
+            update runs in the background.
+        verbose : bool
+            Whether update steps are printed, by default True
+
+        Returns
+        -------
+        SentenceDetailed
+            The sentence with this id, None if there is none
+        """
+        sentences = self._get_table(
+            "sentences_detailed",
+            language_codes=["*"],
+            update=update,
+            verbose=verbose,
+        ).get([sentence_id])
+
+        return sentences[0] if sentences else None
+
+    def _get_table(self, name, language_codes, **kwargs):
+        """Get a 'Table' handler configured by this 'Tatoeba' instance"""
+        if self._offline:
+            kwargs["update"] = False
+
+        return Table(
+            name,
+            language_codes=language_codes,
+            data_dir=self._dir,
+            max_workers=self._mw,
+            max_workers_per_host=self._mwph,
+            session=self._session,
+            max_age=self._max_age,
+            **kwargs
+        )
+
     @property
     def all_tables(self):
         """All tables that are downloadable from tatoeba.org
@@ -550,7 +652,32 @@ class Tatoeba:
             See https://tatoeba.org/eng/stats/sentences_by_language
             for more information.
         """
-        return check_languages()
+        return check_languages(session=self._session, offline=self._offline)
+
+    def wait_updates(self, timeout=None):
+        """Wait for the completion of the background updates
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait. If None, there is no limit.
+
+        Returns
+        -------
+        bool
+            Whether all background updates are complete
+        """
+        return background_updates.wait(timeout=timeout)
+
+    @property
+    def updating(self):
+        """Whether background updates are running"""
+        return background_updates.running
+
+    @property
+    def session(self):
+        """Gets the HTTP session used for all requests to Tatoeba servers"""
+        return self._session
 
     @property
     def dir(self):
@@ -563,3 +690,5 @@ class Tatoeba:
         if self._dir != Path(new_data_dir):
             self._dir = Path(new_data_dir) if new_data_dir else DATA_DIR
             version.dir = self._dir
+            validators.dir = self._dir
+            download_pages.dir = self._dir
@@ -1,13 +1,37 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from datetime import timedelta, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from urllib.parse import urlparse
 
-from .config import DATA_DIR, SUPPORTED_TABLES, TABLE_CSV_PARAMS
+import requests
+from tqdm import tqdm
+
+from .config import (
+    CHECK_WORKERS,
+    DATA_DIR,
+    DIFF_WORKERS,
+    DIFFERENCE_TABLES,
+    DOWNLOAD_WORKERS,
+    DOWNLOAD_WORKERS_PER_HOST,
+    EXPORT_INTERVAL,
+    INDEXED_TABLES,
+    PRECOMPUTE_DIFFS,
+    PRECOMPUTE_INDEXES,
+    SPLIT_WORKERS,
+    SUPPORTED_TABLES,
+    TABLE_CSV_PARAMS,
+    UPDATE_MAX_AGE,
+)
 from .datafile import DataFile
 from .download import Download
 from .download_page import download_pages
 from .exceptions import NotLanguagePair
-from .utils import get_endpoint, get_filestem
-from .version import version
+from .session import default_session
+from .utils import get_filestem, new_process_pool, utcnow
+from .version import validators, version
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +39,7 @@ logger = logging.getLogger(__name__)
 class Update:
     """A handler for updating data files"""
 
-    def __init__(self, table_language_pairs, data_dir=None):
+    def __init__(self, table_language_pairs, data_dir=None, session=None):
         """
         Parameters
         ----------
@@ -24,16 +48,90 @@ class Update:
         data_dir : str, optional
             the directory where the data is stored,
             set to None to use the config default data directory
+        session : requests.Session, optional
+            the HTTP session through which the update is run,
+            set to None to use the default pooled session
         """
         self._tlps = table_language_pairs
         self._data_dir = Path(data_dir) if data_dir else DATA_DIR
+        self._session = session
+
+    def run(
+        self,
+        verbose=True,
+        max_workers=None,
+        max_workers_per_host=None,
+        max_age=None,
+        split_workers=None,
+        precompute_diffs=None,
+        diff_workers=None,
+        precompute_indexes=None,
+    ):
+        """Run the update
 
-    def run(self, verbose=True):
-        """Run the update"""
+        Parameters
+        ----------
+        verbose : bool, optional
+            whether the update steps are printed, by default True
+        max_workers : int, optional
+            the maximum number of files downloaded concurrently,
+            set to None to use the config default
+        max_workers_per_host : int, optional
+            the maximum number of concurrent downloads from a same host,
+            set to None to use the config default
+        max_age : int or str, optional
+            the time in seconds during which a datafile is not checked again
+            for updates, or 'export' to check it only once its next export is
+            expected, set to None to use the config default
+        split_workers : int, optional
+            the maximum number of processes splitting a large data file
+            (e.g. 'queries'), set to None to use the config default
+        precompute_diffs : bool, optional
+            whether the 'added' and 'removed' rows of the updated data files
+            are found at once, rather than when they are first read,
+            set to None to use the config default
+        diff_workers : int, optional
+            the maximum number of processes finding the changes of data
+            files at once, set to None to use the config default
+        precompute_indexes : bool, optional
+            whether the rows of the updated data files are indexed by id at
+            once, rather than when they are first read by id,
+            set to None to use the config default
+        """
         self._vb = verbose
-        to_download = self._check()
+        self._mw = max_workers or DOWNLOAD_WORKERS
+        self._mwph = max_workers_per_host or DOWNLOAD_WORKERS_PER_HOST
+        self._max_age = UPDATE_MAX_AGE if max_age is None else max_age
+        self._sw = split_workers or SPLIT_WORKERS
+        self._pd = (
+            PRECOMPUTE_DIFFS if precompute_diffs is None else precompute_diffs
+        )
+        self._dw = diff_workers or DIFF_WORKERS
+        self._pi = (
+            PRECOMPUTE_INDEXES
+            if precompute_indexes is None
+            else precompute_indexes
+        )
+        # the checks and the splits of many files are saved at once
+        with version.transaction(), validators.transaction():
+            to_download = self._check()
         downloads = self._download(to_download)
-        self._split(downloads)
+        with version.transaction():
+            dfiles = self._split(downloads)
+        self._snapshot(dfiles)
+        self._record_unchanged()
+        if self._pi:
+            self._index(dfiles)
+        if self._pd:
+            self._find_changes(dfiles)
+
+    @property
+    def key(self):
+        """Get the key identifying the files updated by this update"""
+        return (
+            str(self._data_dir),
+            tuple((tbl, tuple(lgs)) for tbl, lgs in self._tlps),
+        )
 
     def _check(self):
         """Get the urls and versions of the datafiles for which a newer
@@ -43,23 +141,64 @@ class Update:
         for tbl, lgs in self._tlps:
             langs = ["*"] if (not lgs or "*" in lgs) else lgs
             d = check_updates(
-                [tbl], langs, oriented_pair=True, verbose=self._vb
+                [tbl],
+                langs,
+                oriented_pair=True,
+                verbose=self._vb,
+                session=self._session,
+                max_age=self._max_age,
             )
             to_download.setdefault(tbl, {}).update(d)
 
         return to_download
 
     def _download(self, to_download):
-        """Download the files to update"""
-        downloads = {}
-        for tbl, d in to_download.items():
-            for url, vs in d.items():
-                dl = Download(url, vs, data_dir=self._data_dir)
-                dl_paths = dl.fetch(verbose=self._vb)
-                downloads.setdefault(tbl, []).extend(dl_paths)
+        """Download the files to update concurrently, so that network I/O
+        and decompression overlap across files
+        """
+        dls = [
+            (
+                tbl,
+                Download(
+                    url, vs, data_dir=self._data_dir, session=self._session
+                ),
+            )
+            for tbl, d in to_download.items()
+            for url, vs in d.items()
+        ]
+        self._unchanged = {}
+        if not dls:
+            return {}
+
+        # one progress bar is shared by all concurrent downloads
+        pbar = tqdm(total=0, unit="iB", unit_scale=True) if self._vb else None
+        semaphores = {}
+        with ThreadPoolExecutor(max_workers=self._mw) as executor:
+            futures = []
+            for tbl, dl in dls:
+                host = urlparse(dl.from_url).netloc
+                sem = semaphores.setdefault(
+                    host, threading.BoundedSemaphore(self._mwph)
+                )
+                futures.append(
+                    (tbl, executor.submit(self._fetch, dl, sem, pbar))
+                )
+            downloads = {}
+            for tbl, future in futures:
+                downloads.setdefault(tbl, []).extend(future.result())
+        if pbar:
+            pbar.close()
+        for tbl, dl in dls:
+            if dl.unchanged:
+                self._unchanged.setdefault(tbl, []).extend(dl.unchanged)
 
         return downloads
 
+    def _fetch(self, download, semaphore, pbar):
+        """Fetch a download once a connection to its host is available"""
+        with semaphore:
+            return download.fetch(verbose=self._vb, pbar=pbar)
+
     def _split(self, downloads):
         """Split datafiles not 'monolingually' available"""
         new_dfiles = {}
@@ -70,19 +209,173 @@ class Update:
                 tbl_dfiles = {dfile}
                 if dfile.path.stem == "queries":
                     splits = dfile.split(
-                        columns=[1], verbose=self._vb, save=True
+                        columns=[1],
+                        verbose=self._vb,
+                        save=True,
+                        max_workers=self._sw,
                     )
                     tbl_dfiles |= set(splits)
             new_dfiles[tbl] = tbl_dfiles
 
         return new_dfiles
 
+    def _find_changes(self, dfiles):
+        """Find the changes of the updated data files, in parallel across
+        files, so that their differences are read at once. A failure is
+        logged, and the changes are then found when first read.
+        """
+        jobs = [
+            (dfile.path, TABLE_CSV_PARAMS[tbl])
+            for tbl, tbl_dfiles in dfiles.items()
+            if tbl in DIFFERENCE_TABLES
+            for dfile in tbl_dfiles
+            if dfile.exists()
+        ]
+        if self._dw > 1 and len(jobs) > 1:
+            with new_process_pool(min(self._dw, len(jobs))) as executor:
+                futures = {
+                    executor.submit(
+                        _find_changes, fp, params, version.dir, self._vb
+                    ): fp
+                    for fp, params in jobs
+                }
+                for future in as_completed(futures):
+                    if future.exception():
+                        logger.error(
+                            f"changes in {futures[future].name} not found",
+                            exc_info=future.exception(),
+                        )
+            # the versions of the difference files were set by the workers
+            version.refresh()
+        else:
+            for fp, params in jobs:
+                try:
+                    _find_changes(fp, params, version.dir, self._vb)
+                except Exception:
+                    logger.exception(f"changes in {fp.name} not found")
+
+    def _record_unchanged(self):
+        """Record that the data files whose new version was the same as
+        their local one have not changed, without reading them
+        """
+        for tbl, fps in self._unchanged.items():
+            if tbl not in DIFFERENCE_TABLES:
+                continue
+            for fp in fps:
+                DataFile(fp, **TABLE_CSV_PARAMS[tbl]).record_no_changes()
+
+    def _snapshot(self, dfiles):
+        """Take the snapshots of the new data files whose changes are
+        searched and log their changes, then remove the former versions
+        they replace
+        """
+        for tbl, tbl_dfiles in dfiles.items():
+            if tbl not in DIFFERENCE_TABLES:
+                continue
+            for dfile in tbl_dfiles:
+                if dfile.exists():
+                    dfile.take_snapshot()
+                    dfile.log_changes()
+                    dfile.release_old()
+
+    def _index(self, dfiles):
+        """Index the rows of the new data files by id, so that they are read
+        by id at once. A failure is logged, and the rows are then indexed
+        when first read by id.
+        """
+        for tbl, tbl_dfiles in dfiles.items():
+            if tbl not in INDEXED_TABLES:
+                continue
+            for dfile in tbl_dfiles:
+                if not dfile.exists():
+                    continue
+                try:
+                    dfile.build_index()
+                except Exception:
+                    logger.exception(f"{dfile.path.name} not indexed")
+
+
+class BackgroundUpdates:
+    """Updates run one after another in a background thread
+
+    An update that is submitted while the same update is still pending is
+    not run twice: the pending one is shared.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="tatoebatools-update"
+        )
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, update, **run_parameters):
+        """Schedule an update in the background
+
+        Parameters
+        ----------
+        update : Update
+            the update to run
+        run_parameters : dict, optional
+            the parameters passed to 'Update.run'
+
+        Returns
+        -------
+        concurrent.futures.Future
+            the future of the run of the update
+        """
+        with self._lock:
+            future = self._futures.get(update.key)
+            if future is None or future.done():
+                future = self._executor.submit(update.run, **run_parameters)
+                future.add_done_callback(_log_failure)
+                self._futures[update.key] = future
+
+        return future
+
+    def wait(self, timeout=None):
+        """Wait for the completion of the pending updates
+
+        Returns
+        -------
+        bool
+            whether all updates are complete
+        """
+        with self._lock:
+            futures = list(self._futures.values())
+        _, not_done = wait(futures, timeout=timeout)
+
+        return not not_done
+
+    @property
+    def running(self):
+        """Whether some updates are still pending"""
+        with self._lock:
+            return any(not f.done() for f in self._futures.values())
 
-def check_languages():
-    """Lists all available languages for Tatoeba downloads"""
+
+def _find_changes(fp, params, version_dir, verbose):
+    """Find the changes of the data file at this path and save its
+    difference files, in a worker sharing this version directory
+    """
+    if version.dir != version_dir:
+        version.dir = version_dir
+    DataFile(fp, **params).find_changes(verbose=verbose, save=True)
+
+
+def _log_failure(future):
+    """Log the failure of a background update"""
+    if not future.cancelled() and future.exception():
+        logger.error("background update failed", exc_info=future.exception())
+
+
+def check_languages(session=None, offline=False):
+    """Lists all available languages for Tatoeba downloads. In offline mode,
+    only the cached language listing is read.
+    """
     url = "https://downloads.tatoeba.org/exports/per_language"
 
-    return download_pages.get_names(url)
+    return download_pages.get_names(url, session=session, offline=offline)
 
 
 def check_tables():
@@ -95,28 +388,163 @@ def check_updates(
     language_codes,
     oriented_pair=False,
     verbose=True,
+    session=None,
+    max_age=0,
 ):
-    """Check for updates on for these tables and these languages"""
+    """Check for updates on for these tables and these languages. The
+    datafiles checked more recently than the max age are skipped.
+    """
     # get the urls where newer versions of datafiles could be found
     urls_to_check = _get_urls_to_check(
         table_names, language_codes, oriented_pair
     )
-    # get the urls of the web pages from which file versions will be scraped
-    urls_to_scrap = {get_endpoint(url) for url in urls_to_check}
+    now = utcnow()
+    urls_to_check = [
+        url for url in urls_to_check if not _is_fresh(url, max_age, now)
+    ]
+
+    return _check_urls(sorted(urls_to_check), session=session)
+
+
+def _is_fresh(url, max_age, now):
+    """Check if the local version of the file at this url was checked
+    recently enough to skip a new check
+
+    Parameters
+    ----------
+    url : str
+        the url of the file
+    max_age : int or str
+        the time in seconds during which a file is not checked again, or
+        'export' to wait until the next export of the file is expected
+    now : datetime
+        the current UTC time
+    """
+    stem = get_filestem(url)
+    checked = version.get_checked(stem)
+    if not checked or not max_age:
+        return False
+
+    if max_age == "export":
+        vs = version[stem]
+        next_export = vs + timedelta(seconds=EXPORT_INTERVAL) if vs else None
+        if next_export and checked < next_export:
+            return now < next_export
+        # the next export is late or unknown
+        max_age = UPDATE_MAX_AGE
+
+    return now - checked < timedelta(seconds=max_age)
+
+
+def _check_urls(urls, session=None):
+    """Get the online versions of the files at these urls that are newer
+    than their local versions. The files are checked concurrently.
+    """
+    session = session or default_session
+    with ThreadPoolExecutor(max_workers=CHECK_WORKERS) as executor:
+        checks = list(
+            executor.map(lambda url: _revalidate(url, session), urls)
+        )
 
+    # the results are saved by the calling thread, at once for all files
     to_update = {}
-    for url in urls_to_scrap:
-        online_versions = download_pages.get_versions(url)
-        # compare versions
-        for url, vs in online_versions.items():
-            if url in urls_to_check:
-                current_vs = version[get_filestem(url)]
-                if not current_vs or current_vs.date() < vs.date():
-                    to_update[url] = vs
+    with version.transaction(), validators.transaction():
+        for url, (vs, checked, new_validators) in zip(urls, checks):
+            if checked:
+                version.set_checked(get_filestem(url), checked)
+            if new_validators:
+                validators[url] = new_validators
+            if vs:
+                to_update[url] = vs
 
     return to_update
 
 
+def _revalidate(url, session):
+    """Check if the remote file at this url is newer than its local version
+    with a conditional HEAD request. The validators of the local version are
+    sent so that the server only has to answer 'Not Modified' when the file
+    has not changed.
+
+    Returns
+    -------
+    tuple
+        the version of the remote file if newer than the local one, the
+        time of the check if the local version is up to date and the
+        validators of the remote file, each None if unknown
+    """
+    current_vs = version[get_filestem(url)]
+    current_vs_string = _format_version(current_vs)
+    saved = validators[url]
+    headers = {}
+    if current_vs and saved.get("version") == current_vs_string:
+        if saved.get("etag"):
+            headers["If-None-Match"] = saved["etag"]
+        if saved.get("last_modified"):
+            headers["If-Modified-Since"] = saved["last_modified"]
+
+    try:
+        r = session.head(url, headers=headers, allow_redirects=True)
+    except requests.exceptions.RequestException:
+        logger.warning(f"error while requesting {url}")
+        return None, None, None
+    checked = utcnow()
+    if r.status_code == 304:
+        return None, checked, None
+    elif r.status_code != 200:
+        logger.debug(f"{url} not available ({r.status_code})")
+        return None, None, None
+
+    online_vs = _parse_http_date(r.headers.get("last-modified"))
+    if headers:  # servers may ignore the conditions of the request
+        is_newer = not _same_validators(headers, r.headers)
+    else:  # the versions scraped from listings are compared by date
+        is_newer = not current_vs or current_vs.date() < online_vs.date()
+    new_vs = online_vs if is_newer else current_vs
+    new_validators = {
+        "etag": r.headers.get("etag"),
+        "last_modified": r.headers.get("last-modified"),
+        "version": _format_version(new_vs),
+    }
+
+    # a newer file is only checked once its new version is fetched
+    if is_newer:
+        return online_vs, None, new_validators
+
+    return None, checked, new_validators
+
+
+def _same_validators(request_headers, response_headers):
+    """Check if the validators of a response are the same as the ones sent
+    with the conditional request, the ETag being compared first
+    """
+    etag = request_headers.get("If-None-Match")
+    if etag and response_headers.get("etag"):
+        return response_headers["etag"] == etag
+    last_modified = request_headers.get("If-Modified-Since")
+    if last_modified and response_headers.get("last-modified"):
+        return response_headers["last-modified"] == last_modified
+
+    return False
+
+
+def _parse_http_date(http_date):
+    """Parse the date of an HTTP header into a naive UTC datetime"""
+    try:
+        dt = parsedate_to_datetime(http_date)
+    except (TypeError, ValueError):
+        return utcnow()
+    else:
+        if dt.tzinfo:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt
+
+
+def _format_version(vs):
+    """Get the string of a version datetime"""
+    return vs.strftime("%Y-%m-%d %H:%M:%S") if vs else None
+
+
 def _get_urls_to_check(table_names, language_codes, oriented_pair):
     """Get the urls where datafiles may be downloadable for these tables
     and languages.
@@ -178,3 +606,6 @@ def _get_urls_to_check(table_names, language_codes, oriented_pair):
             urls.add(f"{ROOT_URL}/stats/{tbl}.csv.bz2")
 
     return urls
+
+
+background_updates = BackgroundUpdates()
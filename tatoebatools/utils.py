@@ -1,162 +1,503 @@
 import bz2
 import csv
+import hashlib
+import io
+import json
 import logging
 import math
+import multiprocessing
 import os
-import sys
+import shutil
 import tarfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 
 import requests
 from tqdm import tqdm
 
+from .generation import new_generation, resolve_path
+from .parallel_bz2 import is_worth_parallelizing, iter_decompressed
+from .session import default_session
+
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 64 * 1024
+
+# the flags creating a new temporary file, in binary mode on Windows
+_TMP_FLAGS = (
+    os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+)
+
 
-def download(from_url, to_directory, verbose=True):
-    """Download a file. Overwrite previous version."""
+def download(from_url, to_directory, verbose=True, session=None):
+    """Download a file. Overwrite previous version. An interrupted download
+    is resumed from the partial file it left behind.
+    """
     # build out file path
     filename = from_url.rsplit("/", 1)[-1]
     to_dir_path = Path(to_directory)
     to_dir_path.mkdir(parents=True, exist_ok=True)
     to_path = to_dir_path.joinpath(filename)
+    part_path = to_dir_path.joinpath(f"{filename}.part")
 
     try:
-        with requests.get(from_url, stream=True) as r:
-            r.raise_for_status()
+        with open_resumable(from_url, part_path, session=session) as (
+            chunks,
+            total_size,
+        ):
             # init progress bar
             if verbose:
-                total_size = int(r.headers.get("content-length", 0))
-                tqdm_args = {
-                    "total": total_size,
-                    "unit": "iB",
-                    "unit_scale": True,
-                }
-                pbar = tqdm(**tqdm_args)
+                pbar = tqdm(total=total_size, unit="iB", unit_scale=True)
             else:
                 pbar = None
-            # write data in out file
-            with open(to_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=1024):
-                    f.write(chunk)
-                    if pbar:
-                        pbar.update(len(chunk))
+            # the data is written in the partial file while iterating
+            for chunk in chunks:
                 if pbar:
-                    pbar.close()
+                    pbar.update(len(chunk))
+            if pbar:
+                pbar.close()
     except requests.exceptions.RequestException:
         logger.error(f"downloading of {from_url} failed")
         return
     else:
+        part_path.replace(to_path)
+        _remove_part(part_path)
         return to_path
 
 
-def decompress(compressed_path):
-    """Decompress a bz2 file here. Overwrite previous version. Delete
-    compressed file after decompression.
-    """
-    in_path = Path(compressed_path)
-    out_path = in_path.parent.joinpath(in_path.stem)
-
-    # rename latest decompressed file at this path (enables file comparison)
-    indicate_as_old(out_path)
+@contextmanager
+def open_resumable(from_url, part_path, session=None):
+    """Open a remote file as an iterator of byte chunks. If a partial file
+    of a previous download of this url exists, only the missing bytes are
+    requested with an HTTP range request, and the chunks of the partial file
+    are iterated first. Otherwise, or when the server refuses the range
+    request, the file is downloaded from the start. The chunks received
+    are appended to the partial file as they arrive.
 
-    try:
-        with bz2.open(in_path) as in_f:
-            with open(out_path, "wb") as out_f:
-                data = in_f.read()
-                out_f.write(data)
-        in_path.unlink()
-    except FileNotFoundError:
-        logger.error(f"{compressed_path} not found by file decompressor")
-        return
-    except OSError:
-        logger.error(f"{compressed_path} is not a valid compressed file")
-        return
+    Yields
+    ------
+    tuple
+        the chunk iterator and the total byte size of the file (0 if unknown)
+    """
+    session = session or default_session
+    part_path = Path(part_path)
+    metadata = _load_part_metadata(part_path)
+    if metadata.get("url") == from_url:
+        offset = _get_file_size(part_path)
     else:
-        return out_path
+        offset = 0
+
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        # a range is only served if the file has not changed in between
+        validator = metadata.get("etag") or metadata.get("last_modified")
+        if validator:
+            headers["If-Range"] = validator
+
+    with session.get(from_url, stream=True, headers=headers) as r:
+        content_range = r.headers.get("content-range", "")
+        if offset and r.status_code == 206:
+            if not content_range.startswith(f"bytes {offset}-"):
+                raise requests.exceptions.RequestException(
+                    f"unexpected content range '{content_range}'"
+                )
+            total_size = int(content_range.rsplit("/", 1)[-1])
+            chunks = _iter_resumed_chunks(r, part_path, offset)
+        elif offset and r.status_code == 416 and metadata["size"] == offset:
+            # the partial file is already complete
+            total_size = offset
+            chunks = _iter_resumed_chunks(None, part_path, offset)
+        else:
+            if r.status_code == 416:  # the partial file is unusable
+                _remove_part(part_path)
+            r.raise_for_status()
+            if offset:
+                logger.info(f"restarting download of {from_url}")
+            total_size = int(r.headers.get("content-length", 0))
+            _save_part_metadata(part_path, from_url, r, total_size)
+            chunks = _iter_resumed_chunks(r, part_path, 0)
+
+        yield chunks, total_size
 
 
-def extract(archive_path):
-    """Extract here all files in an archive. Overwrite previous versions.
-    Delete archive after extraction.
+def _iter_resumed_chunks(response, part_path, offset):
+    """Iterate through the first bytes of a download stored in its partial
+    file, then through the chunks of the response, which are appended to
+    the partial file
+    """
+    with open(part_path, "r+b" if offset else "wb") as f:
+        while f.tell() < offset:
+            chunk = f.read(min(CHUNK_SIZE, offset - f.tell()))
+            if not chunk:
+                break
+            yield chunk
+        f.seek(offset)
+        f.truncate()
+        if response is not None:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                yield chunk
+
+
+def _get_part_metadata_path(part_path):
+    """Get the path of the metadata file of a partial download"""
+    return part_path.with_name(f"{part_path.name}.json")
+
+
+def _load_part_metadata(part_path):
+    """Load the metadata of a partial download"""
+    try:
+        with open(_get_part_metadata_path(part_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_part_metadata(part_path, from_url, response, size):
+    """Save the url, the validators and the size of a partial download"""
+    metadata = {
+        "url": from_url,
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "size": size,
+    }
+    with open(_get_part_metadata_path(part_path), "w") as f:
+        json.dump(metadata, f)
+
+
+def _remove_part(part_path):
+    """Remove the partial file of a download and its metadata"""
+    part_path.unlink(missing_ok=True)
+    _get_part_metadata_path(part_path).unlink(missing_ok=True)
+
+
+def fetch(
+    from_url,
+    to_directory,
+    verbose=True,
+    pbar=None,
+    session=None,
+    version=None,
+    digest=None,
+    previous=None,
+):
+    """Download a file, decompress it and extract it on the fly. Each
+    extracted file is published as a new generation tagged by the version
+    passed, and the previous generation is kept as its '_old' version.
+
+    The downloaded chunks are decompressed and untarred as they arrive, so
+    that only the final files are written to disk and the memory footprint
+    is bounded by the chunk size. The compressed chunks are checkpointed in
+    a partial file so that an interrupted download is resumed where it
+    stopped. When a progress bar is passed, it is shared with other
+    downloads and is not closed here. Requests are sent through the session
+    passed, or through a default pooled session.
+
+    A download whose byte size is the same as the previous download of this
+    url is hashed before being decompressed, so that nothing is written
+    when it is the same file.
+
+    Parameters
+    ----------
+    digest : Digest, optional
+        the digest updated with the downloaded bytes, by default None
+    previous : dict, optional
+        the byte size ('download_size') and the SHA-256 hex digest ('hash')
+        of the previous download of this url, by default None
+
+    Returns
+    -------
+    list
+        the paths of the new generations of the extracted files, None when
+        the file downloaded is the same as the previous one
     """
-    arx_path = Path(archive_path)
+    filename = from_url.rsplit("/", 1)[-1]
+    to_dir_path = Path(to_directory)
+    to_dir_path.mkdir(parents=True, exist_ok=True)
+    part_path = to_dir_path.joinpath(f"{filename}.part")
 
+    if verbose:
+        logger.info(f"downloading {from_url}")
     try:
-        with tarfile.open(arx_path) as tar:
-            out_filenames = tar.getnames()
-            out_paths = [arx_path.parent.joinpath(fn) for fn in out_filenames]
-            # rename latest extracted files at this path for file comparison
-            for fp in out_paths:
-                indicate_as_old(fp)
-
-            def is_within_directory(directory, target):
-                abs_directory = os.path.abspath(directory)
-                abs_target = os.path.abspath(target)
-
-                prefix = os.path.commonprefix([abs_directory, abs_target])
-
-                return prefix == abs_directory
-
-            def safe_extract(
-                tar, path=".", members=None, *, numeric_owner=False
-            ):
-                for member in tar.getmembers():
-                    member_path = os.path.join(path, member.name)
-                    if not is_within_directory(path, member_path):
-                        raise Exception("Attempted Path Traversal in Tar File")
-
-                if sys.version_info.major == 3 and sys.version_info.minor < 12:
-                    tar.extractall(path, members, numeric_owner=numeric_owner)
+        with open_resumable(from_url, part_path, session=session) as (
+            chunks,
+            total_size,
+        ):
+            # init progress bar
+            if pbar is not None:
+                with pbar.get_lock():
+                    pbar.total += total_size
+                    pbar.refresh()
+                own_pbar = None
+            elif verbose:
+                pbar = own_pbar = tqdm(
+                    total=total_size, unit="iB", unit_scale=True
+                )
+            else:
+                own_pbar = None
+            chunks = _track_progress(chunks, pbar)
+            if previous and total_size == previous.get("download_size"):
+                # the partial file is only decompressed if it has changed
+                digest = digest or Digest()
+                for chunk in chunks:
+                    digest.update(chunk)
+                if digest.hexdigest() == previous.get("hash"):
+                    out_paths = None
                 else:
-                    # when supported, tarfile extraction filters mitigate some
-                    # of the security issues.
-                    # The 'data' filter ignore or block most features specific
-                    # to UNIX-like filesystems. Intended for extracting cross-
-                    # platform data archives.
-                    tar.extractall(
-                        path,
-                        members,
-                        numeric_owner=numeric_owner,
-                        filter="data",
+                    out_paths = write_stream(
+                        _iter_resumed_chunks(None, part_path, total_size),
+                        filename,
+                        to_dir_path,
+                        size=total_size,
+                        version=version,
                     )
-
-            safe_extract(tar, arx_path.parent)
-
-        arx_path.unlink()
-    except FileNotFoundError:
-        logger.error(f"{arx_path} not found by file extractor")
+            else:
+                if digest:
+                    chunks = _update_digest(chunks, digest)
+                out_paths = write_stream(
+                    chunks,
+                    filename,
+                    to_dir_path,
+                    size=total_size,
+                    version=version,
+                )
+            if own_pbar:
+                own_pbar.close()
+    except requests.exceptions.RequestException:
+        logger.error(f"downloading of {from_url} failed")
         return []
-    except tarfile.ReadError:
-        logger.error(f"{arx_path} is not an extractable archive")
+    except (OSError, EOFError, tarfile.TarError):
+        logger.error(f"{filename} is not a valid compressed file or archive")
+        _remove_part(part_path)
         return []
     else:
+        _remove_part(part_path)
         return out_paths
 
 
-def fetch(from_url, to_directory, verbose=True):
-    """Download a file, decompress it, extract it and delete temporary files.
-    Overwrite previous versions.
-    """
-    if verbose:
-        logger.info(f"downloading {from_url}")
-    dl_path = download(from_url, to_directory, verbose=verbose)
+def write_stream(chunks, filename, to_directory, size=0, version=None):
+    """Write the files contained in this stream of byte chunks into a
+    directory. Chunks are decompressed if the file name ends with '.bz2' and
+    untarred if it ends with '.tar'. Each file is written as a new
+    generation.
 
-    if not dl_path:
-        return []
-    elif str(dl_path).endswith(".bz2"):
-        if verbose:
-            logger.info(f"decompressing {dl_path.name}")
-        uz_path = decompress(dl_path)
-        if str(uz_path).endswith(".tar"):
-            if verbose:
-                logger.info(f"extracting {uz_path.name}")
-            out_paths = extract(uz_path)
-            return out_paths
+    Large bz2 streams are decompressed block by block in parallel when
+    their byte size is known.
+    """
+    to_dir_path = Path(to_directory)
+    if filename.endswith(".bz2"):
+        if is_worth_parallelizing(size):
+            stream = ChunkStream(iter_decompressed(chunks))
         else:
-            return [uz_path]
+            stream = ChunkStream(chunks, decompressor=bz2.BZ2Decompressor)
+        filename = filename[: -len(".bz2")]
     else:
-        return [dl_path]
+        stream = ChunkStream(chunks)
+
+    with io.BufferedReader(stream, buffer_size=CHUNK_SIZE) as f:
+        if filename.endswith(".tar"):
+            return _untar_stream(f, to_dir_path, version)
+        else:
+            out_path = to_dir_path.joinpath(filename)
+            return [_write_file(f, out_path, version)]
+
+
+class Digest:
+    """The SHA-256 hash and the byte size of a download"""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def update(self, chunk):
+        """Update this digest with a chunk of bytes"""
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def hexdigest(self):
+        """Get the hex digest of the bytes downloaded"""
+        return self._hash.hexdigest()
+
+
+class ChunkStream(io.RawIOBase):
+    """A read-only binary stream over an iterator of byte chunks
+
+    When a decompressor class is passed (e.g. 'bz2.BZ2Decompressor'), the
+    chunks are decompressed as they are read, so that the whole compressed
+    payload never has to be held in memory or written to disk.
+    """
+
+    def __init__(self, chunks, decompressor=None):
+        """
+        Parameters
+        ----------
+        chunks : iterable
+            the byte chunks of the stream
+        decompressor : class, optional
+            the class of the incremental decompressor applied to the chunks,
+            by default None
+        """
+        self._chunks = iter(chunks)
+        self._dcp_cls = decompressor
+        self._dcp = decompressor() if decompressor else None
+        # whether the current decompressor has been fed with data
+        self._fed = False
+        # whether a first compressed stream has been fully decompressed
+        self._eos = False
+        self._buf = b""
+        self._buf_pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._buf_pos >= len(self._buf):
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                if self._dcp and self._fed and not self._dcp.eof:
+                    raise EOFError("compressed stream ended prematurely")
+                return 0
+            self._buf = self._decompress(chunk)
+            self._buf_pos = 0
+
+        n = min(len(b), len(self._buf) - self._buf_pos)
+        b[:n] = self._buf[self._buf_pos : self._buf_pos + n]
+        self._buf_pos += n
+
+        return n
+
+    def _decompress(self, data):
+        """Decompress this chunk of data if required"""
+        if not self._dcp:
+            return data
+
+        out = []
+        while data:
+            try:
+                out.append(self._dcp.decompress(data))
+            except OSError:
+                if self._eos:  # trailing garbage after a complete stream
+                    self._chunks = iter(())
+                    break
+                raise
+            self._fed = True
+            if self._dcp.eof:  # concatenated compressed streams
+                self._eos = True
+                data = self._dcp.unused_data
+                self._dcp = self._dcp_cls()
+                self._fed = False
+            else:
+                data = b""
+
+        return b"".join(out)
+
+
+def _update_digest(chunks, digest):
+    """Update a digest with the chunks iterated"""
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def _track_progress(chunks, pbar=None):
+    """Update a progress bar with the size of the chunks iterated"""
+    for chunk in chunks:
+        if pbar:
+            pbar.update(len(chunk))
+        yield chunk
+
+
+def _untar_stream(fileobj, to_dir_path, version=None):
+    """Extract the regular files of a tar stream into this directory"""
+    out_paths = []
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        for member in tar:
+            out_path = to_dir_path.joinpath(member.name)
+            if not _is_within_directory(to_dir_path, out_path):
+                raise tarfile.ExtractError(
+                    "Attempted Path Traversal in Tar File"
+                )
+            if not member.isfile():
+                continue
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            out_paths.append(
+                _write_file(tar.extractfile(member), out_path, version)
+            )
+
+    return out_paths
+
+
+def _write_file(fileobj, out_path, version=None):
+    """Copy a binary file object into a new generation of the data file at
+    this path. The generation is published once complete, and the previous
+    one is kept as the '_old' version of the file (enables file comparison).
+
+    Returns
+    -------
+    pathlib.Path
+        the path of the new generation of the file
+    """
+    with new_generation(out_path, tag=version) as gen_path:
+        with open(gen_path, "wb") as out_f:
+            shutil.copyfileobj(fileobj, out_f, CHUNK_SIZE)
+
+    return resolve_path(out_path)
+
+
+@contextmanager
+def open_atomically(path, mode="w", **kwargs):
+    """Open a temporary file that atomically replaces the file at this path
+    once written, so that readers never see a partial file. The file is
+    discarded if an exception is raised while writing it.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        the path of the file written
+    mode : str, optional
+        the mode in which the file is written, 'w' or 'wb'
+    kwargs : dict, optional
+        the parameters passed to 'open' (e.g. the encoding)
+
+    Yields
+    ------
+    file object
+        the temporary file
+    """
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    # the file is created like by 'open', with the permissions allowed by
+    # the umask, while a 'tempfile' file is only accessible by its owner
+    fd = os.open(tmp_path, _TMP_FLAGS, 0o666)
+    try:
+        with open(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _get_file_size(file_path):
+    """Get the byte size of a file, 0 if it cannot be accessed"""
+    try:
+        return Path(file_path).stat().st_size
+    except OSError:
+        return 0
+
+
+def _is_within_directory(directory, target):
+    """Check if this target path is inside this directory"""
+    abs_directory = os.path.abspath(directory)
+    abs_target = os.path.abspath(target)
+
+    prefix = os.path.commonprefix([abs_directory, abs_target])
+
+    return prefix == abs_directory
 
 
 class lazy_property(object):
@@ -178,6 +519,27 @@ class lazy_property(object):
         return val
 
 
+def utcnow():
+    """Get the current time as a naive UTC datetime"""
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    return now.replace(tzinfo=None)
+
+
+def new_process_pool(max_workers):
+    """Get a pool of worker processes that are started from scratch.
+
+    The workers are not forked: other threads of this process, e.g. the
+    checks and downloads of an update, may hold locks while it forks, and a
+    forked worker would inherit them locked, with no thread to release
+    them, and could deadlock.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
 def get_filestem(url):
     """Get the stem of the file at this url."""
     return url.rsplit("/", 1)[-1].split(".", 1)[0]
@@ -200,15 +562,6 @@ def get_extended_name(file_path, extension):
     return f"{file_path.stem}_{extension}{file_path.suffix}"
 
 
-def indicate_as_old(file_path):
-    """Show that a file is an old version by including 'old' in its name
-    'foobar.txt' -> 'foobar_old.txt'
-    """
-    if file_path.is_file():
-        name_of_old = get_extended_name(file_path, "old")
-        file_path.replace(file_path.with_name(name_of_old))
-
-
 def count_csv_columns(csv_path, delimiter):
     """Count the columns in a CSV file"""
     nb_cols = None
@@ -1,19 +1,36 @@
 import json
 import logging
+import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 from .config import DATA_DIR
+from .lock import FileLock
+from .utils import open_atomically
 
 logger = logging.getLogger(__name__)
 
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-class Version:
-    """A JSON file which stores the versions of the local Tatoeba datafiles
-    A version is the string of the date when a file was published at
-    https://downloads.tatoeba.org
+
+class JSONStore:
+    """A JSON file shared by the threads and processes using a data
+    directory
+
+    A change is committed by locking the file, reloading the changes made by
+    other processes, applying the change and atomically replacing the file.
+    The changes made inside a transaction are only applied in memory, then
+    committed at once when the outermost transaction of the thread ends.
+    Each thread has its own transactions: the changes of a thread are
+    neither committed nor discarded with the transaction of another one.
     """
 
+    # the name of the JSON file in the data directory
+    filename = None
+
     def __init__(self, data_dir=None):
         """
         Parameters
@@ -23,53 +40,279 @@ class Version:
             If None, the data is saved into the tatoebatools package
         """
         self._dir = Path(data_dir) if data_dir else DATA_DIR
-        # the dict from which versions' values are fetched
+        # the dict from which values are fetched
         self._dict = self._load()
+        # the changes not committed yet and the depths of the transactions,
+        # by thread
+        self._pending = {}
+        self._depths = {}
+        # values are set by concurrent downloads and checks
+        self._lock = threading.RLock()
 
-    def __getitem__(self, filename):
-        vs = self._dict.get(filename)
+    def __len__(self):
+        return len(self._dict)
+
+    @contextmanager
+    def transaction(self):
+        """Batch the changes made by this thread in this context into a
+        single commit. The changes are discarded if an exception is raised.
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._depths[thread_id] = self._depths.get(thread_id, 0) + 1
+        try:
+            yield self
+        except BaseException:
+            with self._lock:
+                if not self._leave(thread_id):
+                    self._pending.pop(thread_id, None)
+                    self._dict = self._load()
+                    self._apply_pending()
+            raise
+        else:
+            with self._lock:
+                if not self._leave(thread_id):
+                    changes = self._pending.pop(thread_id, [])
+                    if changes:
+                        self._commit(changes)
 
-        return datetime.strptime(vs, "%Y-%m-%d %H:%M:%S") if vs else None
+    def refresh(self):
+        """Reload the data file if another process has changed it"""
+        with self._lock:
+            if _get_stamp(self.path) != self._stamp:
+                self._dict = self._load()
+                self._apply_pending()
 
-    def __setitem__(self, filename, new_version):
-        self._dict[filename] = new_version.strftime("%Y-%m-%d %H:%M:%S")
-        self._save()
+    def _leave(self, thread_id):
+        """Leave a transaction of this thread
 
-    def __len__(self):
-        return len(self._dict)
+        Returns
+        -------
+        int
+            the depth of the transactions of this thread left open
+        """
+        depth = self._depths.pop(thread_id) - 1
+        if depth:
+            self._depths[thread_id] = depth
+
+        return depth
+
+    def _apply(self, change):
+        """Apply a change to the data. The change is committed at once
+        outside of a transaction of this thread.
+
+        Parameters
+        ----------
+        change : callable
+            a function that changes the dict of data in place
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            change(self._dict)
+            if self._depths.get(thread_id):
+                self._pending.setdefault(thread_id, []).append(change)
+            else:
+                self._commit([change])
+
+    def _apply_pending(self):
+        """Apply the changes not committed yet by any thread to the data"""
+        for changes in self._pending.values():
+            for change in changes:
+                change(self._dict)
+
+    def _commit(self, changes):
+        """Commit these changes while no other process does. The changes
+        still pending in other threads are not committed with them.
+        """
+        with FileLock(self._get_lock_path()):
+            self._dict = self._load()
+            for change in changes:
+                change(self._dict)
+            self._save()
+            self._apply_pending()
 
     def _load(self):
         """Load the data file."""
+        self._stamp = _get_stamp(self.path)
         try:
             with open(self.path) as f:
                 data = json.load(f)
         except FileNotFoundError:
             data = {}
         else:
-            logger.debug("version datafile loaded")
+            logger.debug(f"{self.filename} loaded")
 
         return data
 
     def _save(self):
-        """Save the data file."""
-        with open(self.path, "w") as f:
-            json.dump(self._dict, f)
+        """Save the data file. The file is written to a temporary file that
+        atomically replaces the previous one.
+        """
+        _dump_atomically(self._dict, self.path)
+        self._stamp = _get_stamp(self.path)
+
+    def _get_lock_path(self):
+        """Get the path of the lock file of this data file"""
+        self._dir.mkdir(parents=True, exist_ok=True)
+
+        return self._dir.joinpath(f"{self.filename}.lock")
 
     @property
     def path(self):
-        """Gets the path of this version file"""
-        return self._dir.joinpath("versions.json")
+        """Gets the path of this data file"""
+        return self._dir.joinpath(self.filename)
 
     @property
     def dir(self):
-        """Gets the path of the directory where the versions are saved"""
+        """Gets the path of the directory where the data file is saved"""
         return self._dir
 
     @dir.setter
     def dir(self, new_dir_path):
-        """Gets the path of the directory where the versions are saved"""
-        self._dir = Path(new_dir_path)
-        self._dict = self._load()
+        """Sets the path of the directory where the data file is saved"""
+        with self._lock:
+            self._dir = Path(new_dir_path)
+            self._dict = self._load()
+            self._pending = {}
+
+
+class Version(JSONStore):
+    """A JSON file which stores the versions of the local Tatoeba datafiles
+    A version is the string of the date when a file was published at
+    https://downloads.tatoeba.org
+
+    The time of the last update check of a datafile and metadata about its
+    local copy (e.g. 'size', 'hash' or 'rows') may be recorded with its
+    version. Such an entry is a dict instead of a plain version string.
+    """
+
+    filename = "versions.json"
+
+    def __getitem__(self, filename):
+        return _parse_datetime(self._get_field(filename, "version"))
+
+    def __setitem__(self, filename, new_version):
+        vs = new_version.strftime(DATETIME_FORMAT)
+        self._apply(lambda d: _set_field(d, filename, "version", vs))
+
+    def get_checked(self, filename):
+        """Get the time when the online version of this datafile was last
+        checked
+
+        Returns
+        -------
+        datetime
+            the UTC time of the last check, None if never checked
+        """
+        return _parse_datetime(self._get_field(filename, "checked"))
+
+    def set_checked(self, filename, checked_time):
+        """Record the time when the online version of this datafile was
+        checked
+
+        Parameters
+        ----------
+        filename : str
+            the stem of the datafile
+        checked_time : datetime
+            the UTC time of the check
+        """
+        checked = checked_time.strftime(DATETIME_FORMAT)
+        self._apply(lambda d: _set_field(d, filename, "checked", checked))
+
+    def get_metadata(self, filename):
+        """Get the metadata recorded about the local copy of this datafile
+
+        Returns
+        -------
+        dict
+            the metadata of the datafile (e.g. 'size', 'hash' or 'rows')
+        """
+        entry = self._dict.get(filename)
+        if not isinstance(entry, dict):
+            return {}
+
+        return {
+            k: v for k, v in entry.items() if k not in ("version", "checked")
+        }
+
+    def set_metadata(self, filename, **metadata):
+        """Record metadata about the local copy of this datafile
+
+        Parameters
+        ----------
+        filename : str
+            the stem of the datafile
+        metadata : dict
+            the JSON serializable metadata (e.g. 'size', 'hash' or 'rows')
+        """
+
+        def change(d):
+            for field, value in metadata.items():
+                _set_field(d, filename, field, value)
+
+        self._apply(change)
+
+    def _get_field(self, filename, field):
+        """Get a field of the entry of this datafile"""
+        entry = self._dict.get(filename)
+        if isinstance(entry, dict):
+            return entry.get(field)
+
+        return entry if field == "version" else None
+
+
+class Validators(JSONStore):
+    """A JSON file which stores the HTTP validators (ETag and Last-Modified
+    headers) of the remote Tatoeba datafiles, next to their versions.
+
+    The validators of a url are only valid for the local version of the
+    datafile they were received with.
+    """
+
+    filename = "validators.json"
+
+    def __getitem__(self, url):
+        return self._dict.get(url, {})
+
+    def __setitem__(self, url, new_validators):
+        self._apply(lambda d: d.__setitem__(url, new_validators))
+
+
+def _set_field(data, filename, field, value):
+    """Set a field of the entry of a datafile. The entry stays a plain
+    version string as long as it has no other field.
+    """
+    entry = data.get(filename)
+    if field == "version" and not isinstance(entry, dict):
+        data[filename] = value
+    else:
+        if not isinstance(entry, dict):
+            entry = data[filename] = {"version": entry}
+        entry[field] = value
+
+
+@lru_cache(maxsize=None)
+def _parse_datetime(string):
+    """Parse a datetime string of a data file, None if there is none"""
+    return datetime.strptime(string, DATETIME_FORMAT) if string else None
+
+
+def _get_stamp(path):
+    """Get the modification stamp of a file, None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    else:
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _dump_atomically(data, path):
+    """Dump data as JSON into a temporary file that replaces this path"""
+    with open_atomically(path) as f:
+        json.dump(data, f)
 
 
 version = Version()
+validators = Validators()
@@ -0,0 +1,165 @@
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FileServer:
+    """A local HTTP stand-in for downloads.tatoeba.org
+
+    It serves in-memory files with ETag and Last-Modified validators,
+    conditional requests and byte range requests.
+    """
+
+    def __init__(self, files=None, accept_ranges=True, conditional=True):
+        """
+        Parameters
+        ----------
+        files : dict, optional
+            the bytes of the files served, by URL path
+        accept_ranges : bool, optional
+            whether range requests are served, by default True
+        conditional : bool, optional
+            whether the conditions of the requests are checked,
+            by default True
+        """
+        self.files = {}
+        self.accept_ranges = accept_ranges
+        self.conditional = conditional
+        # number of bytes sent before the next GET response is interrupted
+        self.cut_after = None
+        self.requests = []
+        # client addresses of the connections opened to the server
+        self.connections = set()
+        self._lock = threading.Lock()
+        for path, data in (files or {}).items():
+            self.set_file(path, data)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def set_file(self, path, data, mtime=1590215100):
+        """Serve these bytes at this path"""
+        with self._lock:
+            self.files[path] = {
+                "data": data,
+                "etag": f'"{len(data):x}-{mtime:x}"',
+                "last_modified": formatdate(mtime, usegmt=True),
+            }
+
+    def url(self, path):
+        """Get the URL of a file served at this path"""
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}{path}"
+
+    def count(self, method, path=None):
+        """Count the requests received with this method (and path)"""
+        with self._lock:
+            return sum(
+                1
+                for m, p, _ in self.requests
+                if m == method and (path is None or p == path)
+            )
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        # keep connections alive between requests
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self._serve(send_body=False)
+
+        def do_GET(self):
+            self._serve(send_body=True)
+
+        def _serve(self, send_body):
+            with server._lock:
+                server.requests.append(
+                    (self.command, self.path, dict(self.headers))
+                )
+                server.connections.add(self.client_address)
+                f = server.files.get(self.path)
+                cut_after = server.cut_after if send_body else None
+                if cut_after is not None:
+                    server.cut_after = None
+            if not f:
+                self.send_error(404)
+                return
+            if self._is_not_modified(f):
+                self.send_response(304)
+                self._send_validators(f)
+                self.end_headers()
+                return
+
+            data = f["data"]
+            start = self._get_range_start(f)
+            if start is not None and start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if start is not None:
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range",
+                    f"bytes {start}-{len(data) - 1}/{len(data)}",
+                )
+                body = data[start:]
+            else:
+                self.send_response(200)
+                body = data
+            if server.accept_ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            self._send_validators(f)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+
+            if send_body:
+                if cut_after is not None:
+                    self.wfile.write(body[:cut_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                else:
+                    self.wfile.write(body)
+
+        def _send_validators(self, f):
+            self.send_header("ETag", f["etag"])
+            self.send_header("Last-Modified", f["last_modified"])
+
+        def _is_not_modified(self, f):
+            if not server.conditional:
+                return False
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match is not None:
+                return if_none_match == f["etag"]
+            if_modified_since = self.headers.get("If-Modified-Since")
+            if if_modified_since is not None:
+                since = parsedate_to_datetime(if_modified_since)
+                return parsedate_to_datetime(f["last_modified"]) <= since
+            return False
+
+        def _get_range_start(self, f):
+            range_header = self.headers.get("Range")
+            if not server.accept_ranges or not range_header:
+                return
+            if_range = self.headers.get("If-Range")
+            if if_range and if_range not in (f["etag"], f["last_modified"]):
+                return
+            return int(range_header.split("=")[1].split("-")[0])
+
+    return Handler
@@ -4,9 +4,15 @@ from pathlib import Path
 from unittest.mock import patch
 
 import pandas as pd
+import pytest
+from tatoebatools.config import TABLE_CSV_PARAMS, TABLE_DATAFRAME_PARAMS
 from tatoebatools.datafile import DataFile
 
 
+def _zfill(field):
+    return field.zfill(3)
+
+
 class TestDataFileInit:
     data = "a,b,c\nd,e,f\n"
     params = {"delimiter": ","}
@@ -113,6 +119,47 @@ class TestDataFileIterator:
             assert out_rows == in_rows
 
 
+class TestDataFileBatches:
+    data = "1\ta\t\\N\n2\tb\tx\n3\tc\\\nc\t\\\ty\n4\td\tz\n"
+
+    def test_columns(self):
+        dfile = DataFile("a\tb\tc\nd\te\tf\n", nb_cols=3)
+        batches = list(dfile.iter_batches())
+        assert batches == [[["a", "d"], ["b", "e"], ["c", "f"]]]
+
+    def test_same_rows_whatever_the_block_size(self):
+        dfile = DataFile(self.data, nb_cols=3)
+        expected = [
+            ["1", "a", "N"],
+            ["2", "b", "x"],
+            ["3", "c\nc", "\ty"],
+            ["4", "d", "z"],
+        ]
+        for block_size in (1, 5, 1000):
+            batches = dfile.iter_batches(block_size=block_size)
+            rows = [list(r) for cols in batches for r in zip(*cols)]
+            assert rows == expected
+        assert [row for row in dfile] == expected
+
+    def test_multiline_row_across_blocks(self):
+        dfile = DataFile("a\tb\tc\nc\nd\te\tf", nb_cols=3, text_col=2)
+        for block_size in (1, 7, 1000):
+            batches = dfile.iter_batches(block_size=block_size)
+            rows = [list(r) for cols in batches for r in zip(*cols)]
+            assert rows == [["a", "b", "c c"], ["d", "e", "f"]]
+
+    def test_blank_lines_merged(self):
+        params = TABLE_CSV_PARAMS["user_lists"]
+        dfile = DataFile("1\t2\t3\t4\tMy list.\t\n\nMore\t5\n", **params)
+        assert [row for row in dfile] == [
+            ["1", "2", "3", "4", "My list.  More", "5"]
+        ]
+
+        params = TABLE_CSV_PARAMS["user_languages"]
+        dfile = DataFile("195\t518\t255\t\taé\n\nx \n", **params)
+        assert [row for row in dfile] == [["195", "518", "255", " aé x "]]
+
+
 class TestDataFileAsDataFrame:
     delimiters = ("\t", ",")
 
@@ -149,6 +196,189 @@ class TestDataFileAsDataFrame:
             assert dframe1.equals(dframe2)
 
 
+class TestDataFileRepairedDataFrame:
+    data = (
+        "1\tuser\t\\N\tlist\\\tname\tpublic\n"
+        "2\tuser\t12\tmulti\n"
+        "line\tpublic\n"
+        "\n"
+        "3\tuser\t13\tsome\ttabs\tpublic\n"
+        "4\tuser\t14\tescaped\\\nline\tpublic\n"
+        "bad row\n"
+        "5\tuser\t15\tok\tpublic"
+    )
+    params = {"nb_cols": 5, "text_col": 3, "na_values": ["N"]}
+
+    def _get_fixed_dataframe(self, **parameters):
+        dfile = DataFile(self.data, **self.params)
+        with patch.object(
+            dfile, "_get_repaired_file", dfile._get_fixed_file_buffer
+        ):
+            return dfile.as_dataframe(**parameters)
+
+    def test_same_as_fixed_file_buffer(self):
+        for params in ({}, {"usecols": [0, 3]}, {"index_col": 0}):
+            dfile = DataFile(self.data, **self.params)
+            dframe = dfile.as_dataframe(**params)
+            expected = self._get_fixed_dataframe(**params)
+            pd.testing.assert_frame_equal(dframe, expected)
+            assert dframe.shape[0] == 5
+
+    def test_chunksize(self):
+        dfile = DataFile(self.data, **self.params)
+        dframe = pd.concat(dfile.as_dataframe(chunksize=2))
+        pd.testing.assert_frame_equal(dframe, self._get_fixed_dataframe())
+
+    def test_extracted_rows(self):
+        row_filters = [{"col_index": 0, "ok_values": {"2", "4"}}]
+        dfile = DataFile(self.data, **self.params)
+        dframe = dfile.extract_rows(row_filters).as_dataframe()
+        assert dframe[0].tolist() == [2, 4]
+        assert dframe[3].tolist()[0] == "multi line"
+
+    def test_fixed_file_buffer_fallback(self):
+        dfile = DataFile("a\tb\nc\\\td\n", text_col=1)
+        with patch.object(
+            dfile, "_get_fixed_file_buffer", wraps=dfile._get_fixed_file_buffer
+        ) as m_fixed:
+            dframe = dfile.as_dataframe()
+            m_fixed.assert_called_once()
+        assert dframe.equals(pd.DataFrame([["a", "b"], ["c d", None]]))
+
+
+class TestDataFileFrame:
+    dframe = pd.DataFrame(
+        [
+            [1, "eng", "a b", "N", "2020-05-22 11:51:00"],
+            [2, "fra", "12", "x", "0000-00-00 00:00:00"],
+            [3, "eng", "c", None, "2021-01-01 00:00:00"],
+        ]
+    )
+    params = {"na_values": ["N"], "nb_cols": 5}
+
+    def _get_text_datafile(self):
+        fb = StringIO()
+        self.dframe.to_csv(
+            fb,
+            sep="\t",
+            escapechar="\\",
+            quoting=csv.QUOTE_NONE,
+            na_rep="N",
+            header=None,
+            index=False,
+        )
+        fb.seek(0)
+
+        return DataFile(fb, **self.params)
+
+    @patch("pandas.DataFrame.to_csv")
+    def test_no_text_round_trip(self, m_to_csv):
+        dfile = DataFile(self.dframe, **self.params)
+        assert next(dfile) == ["1", "eng", "a b", "N", "2020-05-22 11:51:00"]
+        assert len(list(dfile.iter_batches())) == 1
+        dfile.as_dataframe()
+        m_to_csv.assert_not_called()
+
+    def test_same_rows(self):
+        dfile = DataFile(self.dframe, **self.params)
+        assert list(dfile) == list(self._get_text_datafile())
+        assert str(dfile) == str(self._get_text_datafile())
+
+    def test_same_dataframe(self):
+        names = ["id", "lang", "text", "user", "date"]
+        for params in (
+            {},
+            {"names": names, "na_values": ["N", "0000-00-00 00:00:00"]},
+            {
+                "names": names,
+                "parse_dates": ["date"],
+                "date_format": "%Y-%m-%d %H:%M:%S",
+            },
+            {"names": names, "usecols": ["id", "text"], "index_col": 0},
+            {"usecols": [0, 1], "dtype": str},
+        ):
+            dfile = DataFile(self.dframe, **self.params)
+            dframe = dfile.as_dataframe(**params)
+            expected = self._get_text_datafile().as_dataframe(**params)
+            pd.testing.assert_frame_equal(dframe, expected)
+
+    def test_extract_rows(self):
+        row_filters = [{"col_index": 1, "ok_values": {"eng"}}]
+        dfile = DataFile(self.dframe, **self.params)
+        dfile_rows = dfile.extract_rows(row_filters=row_filters)
+        text_rows = self._get_text_datafile().extract_rows(row_filters)
+        assert list(dfile_rows) == list(text_rows)
+        dframe = dfile_rows.as_dataframe()
+        pd.testing.assert_frame_equal(dframe, text_rows.as_dataframe())
+
+    def test_save(self, tmp_path):
+        dfile = DataFile(self.dframe, **self.params)
+        dfile.save(to_path=tmp_path.joinpath("frame.tsv"))
+        assert dfile.path.read_text() == str(self._get_text_datafile())
+
+
+class TestDataFileTableFrames:
+    rows = {
+        "sentences_base": "1\t0\n2\t1\n3\tN\n",
+        "sentences_detailed": (
+            "1\teng\tfoo\tbob\t2020-05-23 06:25:00\t0000-00-00 00:00:00\n"
+            "2\tfra\t12\tN\t2020-05-24 06:25:00\t2020-05-24 06:25:00\n"
+        ),
+        "sentences_CC0": (
+            "1\teng\tfoo\t2020-05-23 06:25:00\n"
+            "2\tfra\t12\t0000-00-00 00:00:00\n"
+        ),
+        "transcriptions": "1\tjpn\tHrkt\tbob\tfoo\n2\tcmn\tLatn\t\tbar\n",
+        "links": "1\t2\n2\t1\n",
+        "tags": "1\tfoo\n2\tbar baz\n",
+        "user_lists": (
+            "1\tbob\t2020-05-23 06:25:00\t2020-05-23 06:25:00\tfoo\tcreator\n"
+            "2\tann\t0000-00-00 00:00:00\t2020-05-23 06:25:00\tbar\tanyone\n"
+        ),
+        "sentences_in_lists": "1\t2\n1\t3\n",
+        "jpn_indices": "1\t2\tfoo\n3\t4\tbar\n",
+        "sentences_with_audio": (
+            "1\t2\tbob\tCC BY 2.0\thttp://a.b\n2\t3\tann\tN\tN\n"
+        ),
+        "user_languages": "eng\t5\tbob\tN\nfra\tN\tann\tfoo\n",
+        "queries": "23 May 2020\teng\tfoo\n24 May 2020\tfra\tbar\n",
+    }
+
+    @pytest.mark.parametrize("table_name", list(TABLE_DATAFRAME_PARAMS))
+    def test_same_dataframe(self, table_name):
+        csv_params = TABLE_CSV_PARAMS[table_name]
+        params = TABLE_DATAFRAME_PARAMS[table_name]
+        raw = DataFile(self.rows[table_name], **csv_params).as_dataframe()
+        # the nullable dtypes are read from the text of the dataframe
+        for dframe in (raw, raw.convert_dtypes()):
+            dfile = DataFile(dframe, **csv_params)
+            expected = DataFile(str(dfile), **csv_params).as_dataframe(
+                **params
+            )
+            pd.testing.assert_frame_equal(
+                dfile.as_dataframe(**params), expected
+            )
+
+    @pytest.mark.parametrize(
+        "values",
+        [
+            ["1", "NULL", "-2"],
+            ["TRUE", "false", "n/a"],
+            ["1e3", " 5", "inf"],
+            ["0012", "1.5", "nan"],
+            ["True", "0", "1"],
+            ["foo", None, "#N/A"],
+        ],
+    )
+    def test_same_inferred_dtypes(self, values):
+        dframe = pd.DataFrame({0: [1, 2, 3], 1: values}, dtype=object)
+        dfile = DataFile(dframe)
+        params = {"header": None, "na_values": ["foo"]}
+        expected = pd.read_csv(StringIO(str(dfile)), sep="\t", **params)
+
+        pd.testing.assert_frame_equal(dfile.as_dataframe(**params), expected)
+
+
 class TestDataFileExtract:
     delimiters = ("\t", ",")
     data = "a,b,c\nd,e,f\n"
@@ -165,6 +395,136 @@ class TestDataFileExtract:
         dfile_rows = dfile.extract_rows(row_filters=row_filters)
         assert str(dfile_rows) == str(DataFile("d,e,f\n", **self.params))
 
+    def test_extract_rows_lazily(self):
+        data = "1,eng,a\n2,fra,b\n3,eng,c\n4,eng,d\n"
+        row_filters = [
+            {"col_index": 0, "ok_values": {1, 2, 3}, "converter": int},
+            {"col_index": 1, "ok_values": {"eng"}},
+        ]
+        dfile = DataFile(data, **self.params)
+        dfile_rows = dfile.extract_rows(row_filters=row_filters)
+        assert [row for row in dfile_rows] == [
+            ["1", "eng", "a"],
+            ["3", "eng", "c"],
+        ]
+        # the original data file is not filtered
+        assert len([row for row in dfile]) == 4
+
+    def test_extract_rows_as_dataframe(self):
+        data = "1,eng,a\n2,fra,b\n3,eng,c\n4,eng,d\n"
+        row_filters = [
+            {"col_index": 0, "ok_values": {1, 2, 3}, "converter": int},
+            {"col_index": 1, "ok_values": {"eng"}},
+        ]
+        names = ["i", "l", "t"]
+        expected = pd.read_csv(
+            StringIO("1,eng,a\n3,eng,c\n"), header=None, names=names
+        )
+        parameters = [
+            {},
+            {"usecols": ["i", "t"]},
+            {"usecols": [2]},
+            {"index_col": "i"},
+            {"usecols": [0, 2], "index_col": [0]},
+            {"usecols": lambda c: c == "t"},
+            {"dtype": {"i": str}},
+        ]
+        for params in parameters:
+            dfile = DataFile(data, **self.params)
+            dfile_rows = dfile.extract_rows(row_filters=row_filters)
+            dframe = dfile_rows.as_dataframe(names=names, **params)
+            other = DataFile(expected, **self.params)
+            assert dframe.equals(other.as_dataframe(names=names, **params))
+
+    def test_extract_rows_as_dataframe_filtered_on_text(self):
+        data = "1,2\n3,4\n5,6\n"
+        filters = [
+            [{"col_index": 0, "ok_values": {"1", "5"}}],
+            [{"col_index": 0, "ok_values": {"001"}, "converter": _zfill}],
+        ]
+        frame = pd.read_csv(StringIO(data), header=None)
+        for row_filters in filters:
+            for source in (data, frame):
+                dfile = DataFile(source, **self.params)
+                dfile_rows = dfile.extract_rows(row_filters=row_filters)
+                rows = [list(map(int, row)) for row in dfile_rows]
+                dframe = dfile_rows.as_dataframe()
+                assert rows
+                assert dframe.values.tolist() == rows
+
+    def test_save_extracted_rows(self, tmp_path):
+        dfile = DataFile(self.data, **self.params)
+        row_filters = [{"col_index": 0, "ok_values": {"d"}}]
+        dfile_rows = dfile.extract_rows(row_filters=row_filters)
+        dfile_rows.save(to_path=tmp_path.joinpath("rows.csv"))
+        assert dfile_rows.path.read_text() == "d,e,f\n"
+
+
+class TestDataFileSplit:
+    data = (
+        "1,eng,hello,0\n"
+        "2,fra,a\\,b,1\n"
+        "3,,nowhere,2\n"
+        "4,eng,multi\nline,3\n"
+        "5,deu,hallo,4\n"
+        "6,fra,salut,5\n"
+    )
+    params = {"delimiter": ",", "text_col": 2, "nb_cols": 4}
+    expected = {
+        "eng_queries.csv": "1,eng,hello,0\n4,eng,multi line,3\n",
+        "fra_queries.csv": "2,fra,a b,1\n6,fra,salut,5\n",
+        "deu_queries.csv": "5,deu,hallo,4\n",
+    }
+
+    def _get_datafile(self, tmp_path):
+        fp = tmp_path.joinpath("queries.csv")
+        fp.write_text(self.data)
+
+        return DataFile(fp, **self.params)
+
+    @patch.object(DataFile, "version", None)
+    def test_split_saved(self, tmp_path):
+        dfile = self._get_datafile(tmp_path)
+        splits = dfile.split(columns=[1], verbose=False)
+        assert [split.path.name for split in splits] == list(self.expected)
+        for split in splits:
+            assert split.path.read_text() == self.expected[split.path.name]
+            assert str(split) == self.expected[split.path.name]
+
+    @patch.object(DataFile, "version", None)
+    def test_split_in_memory(self, tmp_path):
+        dfile = self._get_datafile(tmp_path)
+        splits = dfile.split(columns=[1], verbose=False, save=False)
+        assert [str(split) for split in splits] == list(self.expected.values())
+        assert list(tmp_path.iterdir()) == [dfile.path]
+
+    @patch.object(DataFile, "version", None)
+    def test_few_open_files(self, tmp_path):
+        dfile = self._get_datafile(tmp_path)
+        iter_batches = dfile.iter_batches
+        with patch("tatoebatools.datafile.SPLIT_MAX_OPEN_FILES", 1), patch(
+            "builtins.open", wraps=open
+        ) as m_open, patch.object(
+            dfile, "iter_batches", lambda: iter_batches(block_size=8)
+        ):
+            splits = dfile.split(columns=[1], verbose=False, save=False)
+        # the split files are opened again after being closed
+        assert m_open.call_count > len(self.expected)
+
+    @patch.object(DataFile, "version", None)
+    def test_parallel_split(self, tmp_path):
+        dfile = self._get_datafile(tmp_path)
+        with patch("tatoebatools.datafile.SPLIT_MIN_RANGE_SIZE", 16):
+            assert len(dfile._get_split_ranges(max_workers=3)) > 1
+            splits = dfile.split(columns=[1], verbose=False, max_workers=3)
+        assert [split.path.name for split in splits] == list(self.expected)
+        for split in splits:
+            assert split.path.read_text() == self.expected[split.path.name]
+        assert [fp.name for fp in tmp_path.iterdir() if fp.is_dir()] == [
+            "generations"
+        ]
+        assert [str(split) for split in splits] == list(self.expected.values())
+
 
 class TestDataFileJoin:
     delimiters = ("\t", ",")
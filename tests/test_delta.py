@@ -0,0 +1,93 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from pytest import raises
+from tatoebatools.datafile import DataFile
+from tatoebatools.delta import DeltaLog
+from tatoebatools.exceptions import NotStoredVersion
+from tatoebatools.generation import new_generation, resolve_path
+from tatoebatools.version import version
+
+VERSIONS = [datetime(2030, 1, day) for day in (1, 8, 15, 22)]
+
+
+def _append(log, new_version, removed, added, rows=""):
+    with log.append(new_version, removed, added) as f:
+        f.write(rows)
+
+
+class TestDeltaLog:
+    def test_changes_since_version(self, tmp_path):
+        log = DeltaLog(tmp_path / "eng_sentences.tsv")
+        log.reset(VERSIONS[0])
+        _append(log, VERSIONS[1], {1: 1}, {2: 1}, "1\tfoo\n")
+        _append(log, VERSIONS[2], {2: 1}, {3: 2})
+
+        assert log.versions == VERSIONS[:3]
+        removed, added, rows_paths = log.get_changes(VERSIONS[0])
+        assert (removed, added) == ({1: 1}, {3: 2})
+        assert len(rows_paths) == 2
+        assert log.get_changes(VERSIONS[1])[:2] == ({2: 1}, {3: 2})
+        assert log.get_changes(VERSIONS[3]) == ({}, {}, [])
+
+    def test_not_stored_version(self, tmp_path):
+        log = DeltaLog(tmp_path / "eng_sentences.tsv")
+        with raises(NotStoredVersion):
+            log.get_changes(VERSIONS[0])
+        log.reset(VERSIONS[1])
+        with raises(NotStoredVersion):
+            log.get_changes(VERSIONS[0])
+
+    def test_compaction(self, tmp_path):
+        log = DeltaLog(tmp_path / "eng_sentences.tsv")
+        log.reset(VERSIONS[0])
+        with patch("tatoebatools.delta.DELTA_MAX_COUNT", 2):
+            _append(log, VERSIONS[1], {1: 1}, {2: 1}, "1\tfoo\n")
+            _append(log, VERSIONS[2], {2: 1}, {}, "2\tbar\n")
+            _append(log, VERSIONS[3], {}, {4: 1})
+
+        assert log.versions == [VERSIONS[0], VERSIONS[2], VERSIONS[3]]
+        removed, added, rows_paths = log.get_changes(VERSIONS[1])
+        assert (removed, added) == ({1: 1}, {4: 1})
+        assert len(list(log._dir.iterdir())) == 6
+
+
+class TestDataFileChangesSince:
+    def test_find_changes_since(self, tmp_path):
+        path = tmp_path.joinpath("eng_sentences.tsv")
+        versions = {}
+        datas = ("1\tfoo\n2\tbar\n", "1\tfoo\n3\tbaz\n", "3\tbaz\n4\tqux\n")
+        with patch("tatoebatools.datafile.version", versions):
+            for vs, data in zip(VERSIONS, datas):
+                with new_generation(path, tag=vs) as gen_path:
+                    gen_path.write_text(data)
+                versions["eng_sentences"] = vs
+                dfile = DataFile(resolve_path(path))
+                dfile.take_snapshot()
+                dfile.log_changes()
+                dfile.release_old()
+            diffs = dfile.find_changes(verbose=False, since=VERSIONS[0])
+
+        assert str(diffs["added"]) == "3\tbaz\n4\tqux\n"
+        assert str(diffs["removed"]) == "1\tfoo\n2\tbar\n"
+
+    def test_record_no_changes(self, tmp_path):
+        path = tmp_path.joinpath("eng_sentences.tsv")
+        data_dir = version.dir
+        version.dir = tmp_path
+        try:
+            version["eng_sentences"] = VERSIONS[0]
+            with new_generation(path, tag=VERSIONS[0]) as gen_path:
+                gen_path.write_text("1\tfoo\n")
+            dfile = DataFile(resolve_path(path))
+            dfile.take_snapshot()
+            dfile.log_changes()
+            version["eng_sentences"] = VERSIONS[1]
+            dfile.record_no_changes()
+
+            added_path = resolve_path(tmp_path / "eng_sentences_added.tsv")
+            assert added_path.read_text() == ""
+            assert version["eng_sentences_removed"] == VERSIONS[1]
+            assert DeltaLog(path).get_changes(VERSIONS[0])[:2] == ({}, {})
+        finally:
+            version.dir = data_dir
@@ -0,0 +1,43 @@
+from unittest.mock import patch
+
+from pytest import raises
+from tatoebatools.diff import UnsortedRows, iter_changes, sort_rows
+
+
+class TestIterChanges:
+    old_rows = [["1", "a"], ["2", "b"], ["2", "c"], ["10", "d"], ["11", "e"]]
+    new_rows = [["1", "a"], ["2", "c"], ["2", "f"], ["9", "g"], ["11", "h"]]
+
+    def test_changes(self):
+        changes = list(iter_changes(self.old_rows, self.new_rows))
+        assert changes == [
+            ("removed", ["2", "b"]),
+            ("added", ["2", "f"]),
+            ("added", ["9", "g"]),
+            ("removed", ["10", "d"]),
+            ("removed", ["11", "e"]),
+            ("added", ["11", "h"]),
+        ]
+
+    def test_modified(self):
+        changes = iter_changes(self.old_rows, self.new_rows, modified=True)
+        assert ("modified", ["11", "h"]) in changes
+
+    def test_duplicate_rows(self):
+        changes = iter_changes([["1", "a"], ["1", "a"]], [["1", "a"]])
+        assert list(changes) == [("removed", ["1", "a"])]
+
+    def test_unsorted_rows(self):
+        with raises(UnsortedRows):
+            list(iter_changes([["2", "a"], ["1", "b"]], []))
+
+
+class TestSortRows:
+    def test_sorted_by_id(self, tmp_path):
+        rows = [[str(i), "x"] for i in (5, 12, 1, 30, 2, 12, 7)]
+        with patch("tatoebatools.diff.SORT_CHUNK_SIZE", 3):
+            sorted_rows = list(sort_rows(iter(rows), tmp_path))
+        assert [int(row[0]) for row in sorted_rows] == sorted(
+            int(row[0]) for row in rows
+        )
+        assert len(list(tmp_path.iterdir())) == 3
@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from tatoebatools.download_page import _extract_versions
+from tatoebatools.download_page import DownloadPages, _extract_versions
+
+from .server import FileServer
 
 
 def test_extract_versions():
@@ -33,3 +36,72 @@ def test_extract_versions():
     }
 
     assert _extract_versions(html) == ok_versions
+
+
+class TestDownloadPages:
+
+    html = (
+        '<html><body><pre><a href="../">../</a>\r\n'
+        '<a href="eng/">eng/</a>   23-May-2020 06:25    -\r\n'
+        '<a href="fra/">fra/</a>   23-May-2020 06:25    -\r\n'
+        "</pre></body></html>\r\n"
+    ).encode("utf-8")
+
+    def test_cached_page_shared(self, tmp_path):
+        with FileServer({"/per_language/": self.html}) as server:
+            url = server.url("/per_language")
+            names = DownloadPages(tmp_path).get_names(url)
+            # another process using the same data directory
+            other_names = DownloadPages(tmp_path).get_names(url)
+
+        assert names == other_names == ["eng", "fra"]
+        assert server.count("GET") == 1
+        assert not list(tmp_path.joinpath("listings").glob("*.tmp"))
+
+    def test_expired_page(self, tmp_path):
+        with FileServer({"/per_language/": self.html}) as server:
+            url = server.url("/per_language")
+            DownloadPages(tmp_path).get_names(url)
+            DownloadPages(tmp_path, ttl=0).get_names(url)
+
+        assert server.count("GET") == 2
+
+    def test_offline(self, tmp_path):
+        with FileServer({"/per_language/": self.html}) as server:
+            url = server.url("/per_language")
+            pages = DownloadPages(tmp_path, ttl=0)
+            assert pages.get_names(url, offline=True) == []
+            pages.get_names(url)
+            pages.offline = True
+            assert pages.get_names(url) == ["eng", "fra"]
+
+        assert server.count("GET") == 1
+
+    def test_stale_page_on_error(self, tmp_path):
+        with FileServer({"/per_language/": self.html}) as server:
+            url = server.url("/per_language")
+            DownloadPages(tmp_path).get_names(url)
+            del server.files["/per_language/"]
+            names = DownloadPages(tmp_path, ttl=0).get_names(url)
+
+        assert names == ["eng", "fra"]
+
+    def test_concurrent_pages(self, tmp_path):
+        paths = [f"/per_language/{lang}/" for lang in ("eng", "fra")]
+        listing = (
+            '<html><body><pre><a href="../">../</a>\r\n'
+            '<a href="{0}.tsv">{0}.tsv</a>   23-May-2020 06:25    1\r\n'
+            "</pre></body></html>\r\n"
+        )
+        files = {
+            p: listing.format(p.split("/")[2]).encode("utf-8") for p in paths
+        }
+        with FileServer(files) as server:
+            pages = DownloadPages(tmp_path, ttl=0)
+            urls = [server.url(p) for p in paths] * 10
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(pages.get_versions, urls))
+
+        for url, versions in zip(urls, results):
+            lang = url.rstrip("/").rsplit("/", 1)[-1]
+            assert list(versions) == [f"{url}{lang}.tsv"]
@@ -0,0 +1,138 @@
+import os
+import time
+
+from pytest import raises
+from tatoebatools.datafile import DataFile
+from tatoebatools.generation import (
+    ABANDONED_AGE,
+    collect_garbage,
+    get_logical_path,
+    new_generation,
+    resolve_path,
+)
+
+
+def _write_generation(path, data, **kwargs):
+    with new_generation(path, **kwargs) as gen_path:
+        gen_path.write_text(data)
+
+
+class TestNewGeneration:
+    def test_published(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        with new_generation(path) as gen_path:
+            gen_path.write_text("1\t2\n")
+            # not published until complete
+            assert resolve_path(path) == path
+
+        assert resolve_path(path).read_text() == "1\t2\n"
+        assert resolve_path(path).parent.parent.name == "generations"
+        assert get_logical_path(resolve_path(path)) == path
+
+    def test_previous_generation_kept_as_old(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        for data in ("a\n", "b\n", "c\n"):
+            _write_generation(path, data)
+
+        assert resolve_path(path).read_text() == "c\n"
+        assert resolve_path(tmp_path / "links_old.csv").read_text() == "b\n"
+        assert len(list(tmp_path.joinpath("generations").iterdir())) == 2
+
+    def test_without_old(self, tmp_path):
+        path = tmp_path.joinpath("links_added.csv")
+        for data in ("a\n", "b\n"):
+            _write_generation(path, data, keep_old=False)
+
+        assert resolve_path(path).read_text() == "b\n"
+        assert len(list(tmp_path.joinpath("generations").iterdir())) == 1
+
+    def test_file_written_in_place(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        path.write_text("a\n")
+        _write_generation(path, "b\n")
+
+        assert not path.exists()
+        assert resolve_path(path).read_text() == "b\n"
+        assert resolve_path(tmp_path / "links_old.csv").read_text() == "a\n"
+
+    def test_failed_generation(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        _write_generation(path, "a\n")
+        with raises(OSError):
+            with new_generation(path) as gen_path:
+                gen_path.write_text("b")
+                raise OSError
+
+        assert resolve_path(path).read_text() == "a\n"
+        assert len(list(tmp_path.joinpath("generations").iterdir())) == 1
+
+    def test_open_reader_keeps_snapshot(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        _write_generation(path, "a\n")
+        with open(resolve_path(path)) as reader:
+            _write_generation(path, "b\n")
+            _write_generation(path, "c\n")
+            assert reader.read() == "a\n"
+
+
+class TestCollectGarbage:
+    def test_abandoned_generation(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        _write_generation(path, "a\n")
+        gens_dir = tmp_path.joinpath("generations")
+        building = gens_dir.joinpath("links-1.tmp")
+        abandoned = gens_dir.joinpath("links-0.tmp")
+        building.mkdir()
+        abandoned.mkdir()
+        past = time.time() - ABANDONED_AGE - 1
+        os.utime(abandoned, (past, past))
+        collect_garbage(tmp_path)
+
+        assert building.exists()
+        assert not abandoned.exists()
+        assert resolve_path(path).read_text() == "a\n"
+
+
+class TestFindChangesAcrossGenerations:
+    def test_find_changes(self, tmp_path):
+        path = tmp_path.joinpath("eng_sentences.tsv")
+        _write_generation(path, "1\tfoo\n2\tbar\n")
+        _write_generation(path, "1\tfoo\n3\tbaz\n")
+        diffs = DataFile(resolve_path(path)).find_changes(verbose=False)
+
+        assert str(diffs["added"]) == "3\tbaz\n"
+        assert str(diffs["removed"]) == "2\tbar\n"
+        added_path = resolve_path(tmp_path / "eng_sentences_added.tsv")
+        assert added_path.read_text() == "3\tbaz\n"
+
+    def test_find_changes_of_unsorted_rows(self, tmp_path):
+        path = tmp_path.joinpath("eng_sentences.tsv")
+        _write_generation(path, "2\tbar\n1\tfoo\n10\tqux\n")
+        _write_generation(path, "10\tquux\n1\tfoo\n3\tbaz\n")
+        dfile = DataFile(resolve_path(path))
+        diffs = dfile.find_changes(verbose=False, save=False, modified=True)
+
+        assert str(diffs["added"]) == "3\tbaz\n"
+        assert str(diffs["removed"]) == "2\tbar\n"
+        assert str(diffs["modified"]) == "10\tquux\n"
+        assert [p.name for p in tmp_path.iterdir() if p.is_dir()] == [
+            "generations"
+        ]
+
+    def test_find_changes_from_snapshot(self, tmp_path):
+        path = tmp_path.joinpath("eng_sentences.tsv")
+        for data in (
+            "1\tfoo\n2\tbar\n10\tqux\n",
+            "1\tfoo\n3\tbaz\n10\tquux\n",
+        ):
+            _write_generation(path, data)
+            dfile = DataFile(resolve_path(path))
+            dfile.take_snapshot()
+            dfile.release_old()
+        path_old = resolve_path(tmp_path / "eng_sentences_old.tsv")
+        diffs = dfile.find_changes(verbose=False, save=False, modified=True)
+
+        assert not path_old.exists()
+        assert str(diffs["added"]) == "3\tbaz\n"
+        assert str(diffs["removed"]) == "2\tbar\n"
+        assert str(diffs["modified"]) == "10\tquux\n"
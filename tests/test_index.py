@@ -0,0 +1,140 @@
+import os
+from unittest.mock import patch
+
+from pytest import raises
+from tatoebatools.config import TABLE_CSV_PARAMS
+from tatoebatools.datafile import DataFile
+from tatoebatools.exceptions import NotIndexedTable
+from tatoebatools.generation import new_generation
+from tatoebatools.index import Index
+from tatoebatools.table import Table
+
+
+class TestIndex:
+    data = "3\tc\n1\ta\n1\tb\n2\tfoo\\\n12\tbar\n10\tx"
+
+    def test_build(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        path.write_text(self.data)
+        index = Index(path)
+        index.build()
+
+        assert index.exists()
+        # the line after an escaped line terminator does not start a row
+        assert index.entries.tolist() == [
+            [1, 1, 2, 3, 10],
+            [4, 8, 12, 0, 26],
+            [4, 4, 14, 4, 4],
+        ]
+
+    def test_find(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        path.write_text(self.data)
+        index = Index(path)
+        index.build()
+
+        assert index.find([10, 99, 1])[0].tolist() == [10, 1, 1]
+        assert index.slice(1, 3)[0].tolist() == [1, 2]
+
+    def test_outdated_index(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        path.write_text(self.data)
+        index = Index(path)
+        index.build()
+        mtime = path.stat().st_mtime_ns + 10 ** 9
+        os.utime(path, ns=(mtime, mtime))
+
+        assert not index.exists()
+
+
+class TestGetRows:
+    data = "3\tc\n1\ta\n1\tb\n2\tfoo\n10\tx"
+
+    def test_get_rows(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        path.write_text(self.data)
+        dfile = DataFile(path)
+
+        assert dfile.get_rows([10, 99, "1"]) == [
+            ["10", "x"],
+            ["1", "a"],
+            ["1", "b"],
+        ]
+        assert Index(path).exists()
+
+    def test_get_rows_filtered(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        path.write_text(self.data)
+        row_filters = [{"col_index": 1, "ok_values": {"b", "x"}}]
+        dfile = DataFile(path).extract_rows(row_filters)
+
+        assert dfile.get_rows([1, 3, 10]) == [["1", "b"], ["10", "x"]]
+
+    def test_get_rows_without_index(self):
+        dfile = DataFile(self.data)
+
+        assert dfile.get_rows([10, 1]) == [
+            ["10", "x"],
+            ["1", "a"],
+            ["1", "b"],
+        ]
+
+    def test_slice_rows(self, tmp_path):
+        path = tmp_path.joinpath("links.csv")
+        path.write_text(self.data)
+        dfile = DataFile(path)
+
+        assert dfile.slice_rows(1, 3) == [["1", "b"], ["2", "foo"], ["3", "c"]]
+        assert dfile.slice_rows(4) == [["10", "x"]]
+
+    def test_multiline_row(self, tmp_path):
+        path = tmp_path.joinpath("user_lists.csv")
+        path.write_text(
+            "1\tbob\t2020-05-23\t2020-05-23\tfoo\nbar\tcreator\n"
+            "2\tbob\t2020-05-23\t2020-05-23\tbaz\tcreator\n"
+        )
+        dfile = DataFile(path, **TABLE_CSV_PARAMS["user_lists"])
+
+        assert dfile.get_rows([1]) == [
+            [
+                "1",
+                "bob",
+                "2020-05-23",
+                "2020-05-23",
+                "foo bar",
+                "creator",
+            ]
+        ]
+
+
+class TestTableGet:
+    ok_languages = {"eng", "fra"}
+    rows = (
+        "2\teng\tbar\tbob\t2020-05-23\t2020-05-23\n"
+        "1\tfra\tfoo\tbob\t2020-05-23\t2020-05-23\n"
+    )
+
+    @patch("tatoebatools.table.check_languages", return_value=ok_languages)
+    def test_get(self, m_check_lg, tmp_path):
+        tbl_dir = tmp_path.joinpath("sentences_detailed")
+        path = tbl_dir.joinpath("sentences_detailed.csv")
+        tbl_dir.mkdir()
+        with new_generation(path) as gen_path:
+            gen_path.write_text(self.rows)
+        table = Table(
+            "sentences_detailed", ["*"], data_dir=tmp_path, update=False
+        )
+
+        sentences = table.get([1])
+        assert [(s.sentence_id, s.text) for s in sentences] == [(1, "foo")]
+        assert [s.sentence_id for s in table.slice(0, 2)] == [1, 2]
+
+    @patch("tatoebatools.table.check_languages", return_value=ok_languages)
+    def test_get_not_indexed(self, m_check_lg, tmp_path):
+        table = Table(
+            "user_languages", ["eng"], data_dir=tmp_path, update=False
+        )
+        with raises(NotIndexedTable):
+            table.get([1])
+        with raises(NotIndexedTable):
+            table.slice(0, 1)
@@ -0,0 +1,105 @@
+import bz2
+import json
+import multiprocessing
+from datetime import datetime
+
+from pytest import raises
+from tatoebatools.download import Download
+from tatoebatools.generation import resolve_path
+from tatoebatools.lock import FileLock
+from tatoebatools.version import Version, version
+
+from .server import FileServer
+
+VS = datetime(2020, 5, 23, 6, 25)
+
+
+def _fetch_in_process(url, data_dir, start):
+    """Fetch a file like a worker sharing this data directory"""
+    version.dir = data_dir
+    start.wait(10)
+    fetched = Download(url, VS, data_dir=data_dir).fetch(verbose=False)
+
+    return [str(fp) for fp in fetched]
+
+
+def _set_versions_in_process(data_dir, worker, start):
+    """Set versions like a worker sharing this data directory"""
+    vs = Version(data_dir)
+    start.wait(10)
+    for i in range(10):
+        vs[f"{worker}-{i}"] = VS
+
+
+def _run_processes(target, args_list):
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Manager().Event()
+    with ctx.Pool(len(args_list)) as pool:
+        results = [
+            pool.apply_async(target, (*args, start)) for args in args_list
+        ]
+        start.set()
+        return [r.get(timeout=60) for r in results]
+
+
+class TestFileLock:
+    def test_exclusive(self, tmp_path):
+        lock_path = tmp_path.joinpath("foo.lock")
+        with FileLock(lock_path):
+            with raises(TimeoutError):
+                FileLock(lock_path, timeout=0.1).acquire()
+
+        with FileLock(lock_path, timeout=0.1):
+            pass
+
+
+class TestSharedDataDirectory:
+    path = "/exports/per_language/eng/eng_sentences_detailed.tsv.bz2"
+    rows = b"".join(
+        b"%d\teng\tfoo\tbar\t\\N\t\\N\n" % i for i in range(10000)
+    )
+
+    def test_downloaded_once(self, tmp_path):
+        with FileServer({self.path: bz2.compress(self.rows)}) as server:
+            url = server.url(self.path)
+            results = _run_processes(_fetch_in_process, [(url, tmp_path)] * 4)
+
+        assert server.count("GET") == 1
+        fetched = [fps for fps in results if fps]
+        assert len(fetched) == 1
+        fp = resolve_path(
+            tmp_path.joinpath(
+                "sentences_detailed", "eng_sentences_detailed.tsv"
+            )
+        )
+        assert fetched[0] == [str(fp)]
+        assert fp.read_bytes() == self.rows
+        assert Version(tmp_path)["eng_sentences_detailed"] == VS
+
+    def test_same_file_not_fetched_again(self, tmp_path):
+        new_vs = datetime(2020, 5, 30, 6, 25)
+        data_dir = version.dir
+        version.dir = tmp_path
+        try:
+            with FileServer({self.path: bz2.compress(self.rows)}) as server:
+                url = server.url(self.path)
+                dl = Download(url, VS, data_dir=tmp_path)
+                fetched = dl.fetch(verbose=False)
+                dl = Download(url, new_vs, data_dir=tmp_path)
+                assert dl.fetch(verbose=False) == []
+            metadata = version.get_metadata("eng_sentences_detailed")
+
+            assert dl.unchanged == fetched
+            assert version["eng_sentences_detailed"] == new_vs
+            assert metadata["files"] == ["eng_sentences_detailed.tsv"]
+        finally:
+            version.dir = data_dir
+
+    def test_versions_not_lost(self, tmp_path):
+        _run_processes(
+            _set_versions_in_process, [(tmp_path, w) for w in range(4)]
+        )
+
+        with open(tmp_path.joinpath("versions.json")) as f:
+            versions = json.load(f)
+        assert len(versions) == 40
@@ -0,0 +1,78 @@
+import bz2
+import random
+
+from pytest import raises
+from tatoebatools.parallel_bz2 import (
+    _iter_blocks,
+    _merge_pieces,
+    iter_decompressed,
+)
+
+
+def _get_data(nb_rows=40000, seed=0):
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices("abcdefghij", k=rng.randint(1, 9)))
+        for _ in range(3000)
+    ]
+    return "".join(
+        f"{i}\teng\t{' '.join(rng.choices(words, k=6))}\n"
+        for i in range(nb_rows)
+    ).encode("utf-8")
+
+
+def _iter_chunks(data, chunk_size):
+    for i in range(0, len(data), chunk_size):
+        yield data[i : i + chunk_size]
+
+
+class TestIterDecompressed:
+    data = _get_data()
+
+    def test_multiple_blocks(self):
+        compressed = bz2.compress(self.data, 1)
+        chunks = _iter_chunks(compressed, 4096)
+
+        assert len(list(_iter_blocks(_iter_chunks(compressed, 4096)))) > 1
+        assert b"".join(iter_decompressed(chunks, workers=2)) == self.data
+
+    def test_small_chunks(self):
+        compressed = bz2.compress(self.data[:20000], 1)
+        chunks = _iter_chunks(compressed, 1)
+
+        assert b"".join(iter_decompressed(chunks)) == self.data[:20000]
+
+    def test_multiple_streams(self):
+        compressed = (
+            bz2.compress(self.data, 1)
+            + bz2.compress(b"")
+            + bz2.compress(self.data[:100], 9)
+        )
+        chunks = _iter_chunks(compressed, 1000)
+
+        assert b"".join(iter_decompressed(chunks, workers=3)) == (
+            self.data + self.data[:100]
+        )
+
+    def test_truncated_stream(self):
+        compressed = bz2.compress(self.data, 1)[:-100]
+        with raises(EOFError):
+            b"".join(iter_decompressed(_iter_chunks(compressed, 4096)))
+
+    def test_not_compressed(self):
+        with raises(OSError):
+            b"".join(iter_decompressed(_iter_chunks(self.data, 4096)))
+
+    def test_block_split_on_false_magic(self):
+        compressed = bz2.compress(self.data[:50000], 1)
+        (stream, bits, nb_bits, crc), = _iter_blocks([compressed])
+        # a false magic number would cut a block into pieces
+        cut = nb_bits // 3
+        head = bits >> (nb_bits - cut)
+        tail = bits & ((1 << (nb_bits - cut)) - 1)
+        pieces = [
+            (None, head, cut, crc),
+            (None, tail, nb_bits - cut, 0),
+        ]
+
+        assert bz2.decompress(_merge_pieces(pieces)) == self.data[:50000]
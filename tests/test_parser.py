@@ -0,0 +1,183 @@
+import csv
+import random
+import re
+from io import BytesIO, StringIO
+
+from pytest import raises
+from tatoebatools.parser import (
+    CleanedStream,
+    find_row_start,
+    iter_batches,
+    iter_repaired_text,
+    iter_rows,
+)
+
+
+def _clean_at_once(text, delimiter):
+    text = re.sub(r"\n\\\n", "  ", text)
+    return re.sub(r"\\" + delimiter + r"+", " ", text)
+
+
+def _iter_rows_like_before(text, nb_cols, text_col):
+    """Parse rows like the former row iterator of the data files"""
+    rd = csv.reader(
+        StringIO(text), delimiter="\t", escapechar="\\", quoting=csv.QUOTE_NONE
+    )
+    next_row = None
+    while True:
+        row = next_row
+        if not row:  # a blank line that does not continue a row
+            row = next(rd, None)
+            if row is None:
+                return
+        cnt = 1
+        next_row = next(rd, None)
+        while next_row is not None:
+            if len(row) - cnt + len(next_row) > nb_cols:
+                break
+            row.extend(next_row)  # multiline row
+            cnt += 1
+            next_row = next(rd, None)
+        nb_extra_cols = len(row) - nb_cols
+        if nb_extra_cols > 0:
+            j = text_col + nb_extra_cols + 1
+            row[text_col] = " ".join(row[text_col:j])
+            del row[text_col + 1 : j]
+        if len(row) == nb_cols:
+            yield row
+        if next_row is None:
+            return
+
+
+def _random_texts(nb_texts, seed=0):
+    """Get random multiline texts with blank lines, with the numbers of
+    columns and the text columns of their rows
+    """
+    rng = random.Random(seed)
+    alphabet = ["a", "b", "\t", "\t", "\n", "\n", "\n", "\\"]
+    for _ in range(nb_texts):
+        nb_cols = rng.randint(2, 6)
+        text = "".join(rng.choices(alphabet, k=rng.randint(0, 60)))
+        yield text, nb_cols, rng.randrange(nb_cols)
+
+
+class TestCleanedStream:
+    def test_same_as_cleaned_at_once(self):
+        rng = random.Random(0)
+        for delimiter in ("\t", ","):
+            alphabet = ["a", "b", "\n", "\\", delimiter]
+            for _ in range(200):
+                text = "".join(rng.choices(alphabet, k=rng.randint(0, 50)))
+                expected = _clean_at_once(text, delimiter)
+                for chunk_size in (1, 2, 5, 100):
+                    stream = CleanedStream(
+                        StringIO(text), delimiter, chunk_size=chunk_size
+                    )
+                    assert stream.read() == expected
+
+    def test_read_by_size(self):
+        stream = CleanedStream(StringIO("a\\\t\tb\n\\\nc\n"), chunk_size=2)
+        parts = iter(lambda: stream.read(3), "")
+        assert "".join(parts) == "a b  c\n"
+        assert stream.tell() == 7
+
+    def test_readline(self):
+        text = "a\tb\\\tc\nd\n\\\ne\nf"
+        stream = CleanedStream(StringIO(text), chunk_size=3)
+        assert list(stream) == ["a\tb c\n", "d  e\n", "f"]
+
+    def test_rewind(self):
+        stream = CleanedStream(StringIO("a\\\tb\n"), chunk_size=2)
+        assert stream.read() == "a b\n"
+        stream.seek(0)
+        assert stream.read(2) == "a "
+        with raises(OSError):
+            stream.seek(1)
+
+
+class TestIterBatches:
+    def test_same_rows_as_before(self):
+        for text, nb_cols, text_col in _random_texts(1000):
+            expected = list(_iter_rows_like_before(text, nb_cols, text_col))
+            for block_size in (1, 4, 1000):
+                batches = iter_batches(
+                    StringIO(text),
+                    nb_cols=nb_cols,
+                    text_col=text_col,
+                    block_size=block_size,
+                )
+                assert list(iter_rows(batches)) == expected
+
+
+class TestIterRepairedText:
+    text = (
+        "1\ta\tb\n"
+        "2\tc\n"
+        "d\te\n"
+        "\n"
+        "3\tf\tg\th\n"
+        "4\ti\\\nj\tk\n"
+        "5\tl\tm\n"
+    )
+
+    def test_repaired_lines(self):
+        chunks = iter_repaired_text(StringIO(self.text), nb_cols=3, text_col=1)
+        assert "".join(chunks) == (
+            "1\ta\tb\n2\tc d\te\n3\tf g\th\n4\ti\\\nj\tk\n5\tl\tm\n"
+        )
+
+    def test_well_formed_lines_kept(self):
+        text = "1\t\\N\tb\n2\tc\td\n"
+        assert "".join(iter_repaired_text(StringIO(text), nb_cols=3)) == text
+
+    def test_same_text_whatever_the_block_size(self):
+        params = {"nb_cols": 3, "text_col": 1}
+        expected = "".join(iter_repaired_text(StringIO(self.text), **params))
+        for block_size in (1, 2, 5, 13):
+            chunks = iter_repaired_text(
+                StringIO(self.text), block_size=block_size, **params
+            )
+            assert "".join(chunks) == expected
+
+    def test_same_rows_as_before(self):
+        for text, nb_cols, text_col in _random_texts(1000, seed=1):
+            expected = list(_iter_rows_like_before(text, nb_cols, text_col))
+            for block_size in (1, 4, 1000):
+                chunks = iter_repaired_text(
+                    StringIO(text),
+                    nb_cols=nb_cols,
+                    text_col=text_col,
+                    block_size=block_size,
+                )
+                repaired = "".join(chunks)
+                rows = _iter_rows_like_before(repaired, nb_cols, text_col)
+                assert list(rows) == expected
+
+    def test_too_few_columns(self):
+        with raises(ValueError):
+            next(iter_repaired_text(StringIO(self.text), nb_cols=1))
+
+
+class TestFindRowStart:
+    data = (
+        b"1\ta\tb\n"
+        b"2\tmulti\n"
+        b"line\tc\n"
+        b"3\td\\\te\tf\n"
+        b"4\tg\th\n"
+        b"one field\n"
+        b"5\ti\tj\n"
+        b"6\tk\tl\n"
+    )
+
+    def _find(self, offset):
+        return find_row_start(BytesIO(self.data), offset, nb_cols=3)
+
+    def test_after_two_regular_lines(self):
+        assert self.data[self._find(0) :].startswith(b"6\t")
+
+    def test_from_the_middle_of_a_line(self):
+        assert self._find(self.data.index(b"one")) == self.data.index(b"6\t")
+
+    def test_none_left(self):
+        assert self._find(self.data.index(b"6\t")) is None
@@ -0,0 +1,41 @@
+from unittest.mock import patch
+
+from tatoebatools.session import Session
+from tatoebatools.utils import download
+
+from .server import FileServer
+
+
+class TestSession:
+    def test_adapter_config(self):
+        session = Session(pool_size=4, retries=5, backoff_factor=1)
+        adapter = session.get_adapter("https://downloads.tatoeba.org")
+
+        assert adapter._pool_maxsize == 4
+        assert adapter.max_retries.total == 5
+        assert adapter.max_retries.backoff_factor == 1
+        assert 503 in adapter.max_retries.status_forcelist
+
+    @patch("requests.Session.request")
+    def test_default_timeout(self, m_request):
+        session = Session(timeout=(1, 2))
+        session.get("https://downloads.tatoeba.org")
+
+        assert m_request.call_args[1]["timeout"] == (1, 2)
+
+    @patch("requests.Session.request")
+    def test_timeout_overridden(self, m_request):
+        session = Session(timeout=(1, 2))
+        session.get("https://downloads.tatoeba.org", timeout=3)
+
+        assert m_request.call_args[1]["timeout"] == 3
+
+    def test_connections_reused(self, tmp_path):
+        session = Session()
+        with FileServer({"/a.csv": b"a\n", "/b.csv": b"b\n"}) as server:
+            download(server.url("/a.csv"), tmp_path, session=session)
+            download(server.url("/b.csv"), tmp_path, session=session)
+
+        assert (tmp_path / "a.csv").read_bytes() == b"a\n"
+        assert (tmp_path / "b.csv").read_bytes() == b"b\n"
+        assert len(server.connections) == 1
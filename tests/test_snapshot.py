@@ -0,0 +1,50 @@
+from tatoebatools.datafile import DataFile
+from tatoebatools.snapshot import (
+    Snapshot,
+    diff_fingerprints,
+    get_fingerprints,
+    hash_batch,
+    select_rows,
+)
+
+
+class TestHashBatch:
+    def test_rows_of_a_same_id(self):
+        fingerprints = hash_batch([["1", "1"], ["foo", "bar"]])
+        assert fingerprints[0] != fingerprints[1]
+
+    def test_rows_of_various_lengths(self):
+        short = hash_batch([["1"], ["foo"]])
+        padded = hash_batch([["1", "2"], ["foo", "bar"], [None, "baz"]])
+        assert short[0] == padded[0]
+
+
+class TestDiffFingerprints:
+    def test_multisets(self):
+        old = get_fingerprints([[["1", "2", "2"], ["a", "b", "b"]]])
+        new = get_fingerprints([[["2", "3"], ["b", "c"]]])
+        removed, added = diff_fingerprints(old, new)
+
+        assert sorted(removed.values()) == [1, 1]
+        assert list(added.values()) == [1]
+
+    def test_selected_rows(self):
+        batches = [[["1", "2", "2"], ["a", "b", "b"]]]
+        old = get_fingerprints(batches)
+        new = get_fingerprints([[["1"], ["a"]]])
+        removed, _ = diff_fingerprints(old, new)
+
+        assert list(select_rows(batches, removed)) == [["2", "b"], ["2", "b"]]
+
+
+class TestSnapshot:
+    def test_write(self, tmp_path):
+        path = tmp_path.joinpath("eng_sentences.tsv")
+        path.write_text("2\tbar\n1\tfoo\n")
+        DataFile(path).take_snapshot()
+        snapshot = Snapshot(path)
+
+        assert snapshot.exists()
+        assert len(snapshot.fingerprints) == 2
+        with snapshot.open_rows() as f:
+            assert f.read() == "2\tbar\n1\tfoo\n"
@@ -1,7 +1,15 @@
+import threading
+from datetime import datetime
 from unittest.mock import patch
 
 from pytest import raises
-from tatoebatools.exceptions import NotLanguage, NotLanguagePair, NotTable
+from tatoebatools.download_page import DownloadPages
+from tatoebatools.exceptions import (
+    NotLanguage,
+    NotLanguagePair,
+    NotStoredVersion,
+    NotTable,
+)
 from tatoebatools.table import Table
 
 
@@ -78,3 +86,97 @@ class TestTable:
     def test_init_links_with_not_language_pair_2(self, m_check_lg):
         with raises(NotLanguagePair):
             Table("links", ["eng"])
+
+    @patch("tatoebatools.download_page.default_session.get")
+    @patch("tatoebatools.update.Update.run")
+    def test_init_without_update_offline(self, m_update, m_get, tmp_path):
+        with patch(
+            "tatoebatools.update.download_pages", DownloadPages(tmp_path)
+        ):
+            Table("sentences_detailed", ["eng"], update=False)
+
+        assert m_get.call_count == 0
+        assert m_update.call_count == 0
+
+    @patch("tatoebatools.table.check_languages", return_value=ok_languages)
+    def test_init_with_background_update(self, m_check_lg, tmp_path):
+        fp = tmp_path.joinpath(
+            "sentences_detailed", "eng_sentences_detailed.tsv"
+        )
+        fp.parent.mkdir()
+        fp.write_text("1\teng\tfoo\tbar\t\\N\t\\N\n")
+        started = threading.Event()
+        release = threading.Event()
+
+        def run(update, **kwargs):
+            started.set()
+            release.wait(5)
+            fp.write_text(
+                "1\teng\tfoo\tbar\t\\N\t\\N\n2\teng\tbaz\tbar\t\\N\t\\N\n"
+            )
+
+        with patch("tatoebatools.update.Update.run", autospec=True) as m_run:
+            m_run.side_effect = run
+            table = Table(
+                "sentences_detailed",
+                ["eng"],
+                data_dir=tmp_path,
+                update="background",
+            )
+            assert started.wait(5)
+            assert table.update_status == "running"
+            assert [s.sentence_id for s in table] == [1]
+            assert not table.wait_update(timeout=0.01)
+
+            release.set()
+            assert table.wait_update(timeout=5)
+
+        assert table.update_status == "done"
+        assert [s.sentence_id for s in table] == [1, 2]
+
+    @patch("tatoebatools.table.check_languages", return_value=ok_languages)
+    def test_refreshed_links_filter(self, m_check_lg, tmp_path):
+        sentences_fp = tmp_path.joinpath(
+            "sentences_detailed", "eng_sentences_detailed.tsv"
+        )
+        links_fp = tmp_path.joinpath("links", "links.csv")
+        for fp in (sentences_fp, links_fp):
+            fp.parent.mkdir()
+        sentences_fp.write_text("1\teng\tfoo\tbar\t\\N\t\\N\n")
+        links_fp.write_text("1\t3\n2\t3\n")
+        row_filters = [{"col_index": 1, "ok_values": {3}, "converter": int}]
+        table = Table(
+            "links",
+            ["eng", "*"],
+            data_dir=tmp_path,
+            update=False,
+            row_filters=row_filters,
+        )
+        assert [lk.sentence_id for lk in table] == [1]
+
+        # the sentences added by an update are read once refreshed
+        sentences_fp.write_text(
+            "1\teng\tfoo\tbar\t\\N\t\\N\n2\teng\tbaz\tbar\t\\N\t\\N\n"
+        )
+        table._dfile = table._build_datafile()
+
+        assert len(row_filters) == 1
+        assert [lk.sentence_id for lk in table] == [1, 2]
+
+    @patch("tatoebatools.table.check_languages", return_value=ok_languages)
+    def test_changes_since_not_stored(self, m_check_lg, tmp_path):
+        # the difference file left by an update is not read instead
+        fp = tmp_path.joinpath(
+            "sentences_detailed", "eng_sentences_detailed_added.tsv"
+        )
+        fp.parent.mkdir()
+        fp.write_text("1\teng\tfoo\tbar\t\\N\t\\N\n")
+        with raises(NotStoredVersion):
+            Table(
+                "sentences_detailed",
+                ["eng"],
+                data_dir=tmp_path,
+                scope="added",
+                update=False,
+                since=datetime(2020, 5, 23),
+            )
@@ -1,6 +1,27 @@
+import bz2
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
 from pytest import raises
+from tatoebatools.config import TABLE_CSV_PARAMS
+from tatoebatools.datafile import DataFile
+from tatoebatools.download import Download
 from tatoebatools.exceptions import NotLanguagePair
-from tatoebatools.update import _get_urls_to_check
+from tatoebatools.generation import new_generation, resolve_path
+from tatoebatools.index import Index
+from tatoebatools.update import (
+    BackgroundUpdates,
+    Update,
+    _check_urls,
+    _get_urls_to_check,
+    check_updates,
+)
+from tatoebatools.version import Validators, Version, version
+
+from .server import FileServer
 
 
 class TestGetURLsToCheck:
@@ -81,3 +102,324 @@ class TestGetURLsToCheck:
         language_codes = ["eng", "fra", "deu"]
         with raises(NotLanguagePair):
             _get_urls_to_check(table_names, language_codes, oriented_pair=True)
+
+
+class TestUpdateDownload:
+    vs = datetime(2020, 5, 23, 6, 25)
+
+    def _to_download(self, hosts, nb_files):
+        return {
+            "sentences_detailed": {
+                f"https://{host}/exports/per_language/{i}/"
+                f"{i}_sentences_detailed.tsv.bz2": self.vs
+                for host in hosts
+                for i in range(nb_files)
+            }
+        }
+
+    def _run_download(self, to_download, max_workers, max_workers_per_host):
+        lock = threading.Lock()
+        running = {}
+        peaks = {}
+
+        def fetch(dl, verbose=True, pbar=None):
+            host = dl.from_url.split("/")[2]
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                peaks[host] = max(peaks.get(host, 0), running[host])
+            time.sleep(0.02)
+            with lock:
+                running[host] -= 1
+            return [dl.name]
+
+        update = Update([])
+        update._vb = False
+        update._mw = max_workers
+        update._mwph = max_workers_per_host
+        with patch(
+            "tatoebatools.update.Download.fetch", autospec=True
+        ) as m_fetch:
+            m_fetch.side_effect = fetch
+            downloads = update._download(to_download)
+
+        return downloads, peaks
+
+    def test_per_host_limit(self):
+        to_download = self._to_download(["foo.org", "bar.org"], 6)
+        _, peaks = self._run_download(to_download, 8, 2)
+
+        assert set(peaks) == {"foo.org", "bar.org"}
+        assert all(peak == 2 for peak in peaks.values())
+
+    def test_downloads_in_input_order(self):
+        to_download = self._to_download(["foo.org"], 5)
+        downloads, _ = self._run_download(to_download, 4, 4)
+
+        assert downloads == {
+            "sentences_detailed": [
+                f"{i}_sentences_detailed" for i in range(5)
+            ]
+        }
+
+    def test_nothing_to_download(self):
+        downloads, peaks = self._run_download({}, 4, 2)
+
+        assert downloads == {}
+        assert peaks == {}
+
+
+class TestUpdateFindChanges:
+    vs = datetime(2020, 5, 23, 6, 25)
+    rows = (
+        "1\teng\tfoo\tbob\t2020-05-23\t2020-05-23\n",
+        "2\teng\tbar\tbob\t2020-05-23\t2020-05-23\n",
+    )
+
+    @pytest.mark.parametrize("diff_workers", [1, 2])
+    def test_diffs_precomputed(self, tmp_path, diff_workers):
+        data_dir = version.dir
+        version.dir = tmp_path
+        try:
+            tbl_dir = tmp_path.joinpath("sentences_detailed")
+            dfiles = set()
+            for lang in ("eng", "fra"):
+                path = tbl_dir.joinpath(f"{lang}_sentences_detailed.tsv")
+                for data in self.rows:
+                    with new_generation(path) as gen_path:
+                        gen_path.write_text(data)
+                version[path.stem] = self.vs
+                params = TABLE_CSV_PARAMS["sentences_detailed"]
+                dfiles.add(DataFile(resolve_path(path), **params))
+            update = Update([])
+            update._vb = False
+            update._dw = diff_workers
+            update._find_changes({"sentences_detailed": dfiles})
+
+            for lang in ("eng", "fra"):
+                stem = f"{lang}_sentences_detailed_added"
+                added_path = resolve_path(tbl_dir.joinpath(f"{stem}.tsv"))
+                assert added_path.read_text() == self.rows[1]
+                assert version[stem] == self.vs
+        finally:
+            version.dir = data_dir
+
+    def test_indexes_precomputed(self, tmp_path):
+        path = tmp_path.joinpath("eng_sentences_detailed.tsv")
+        with new_generation(path) as gen_path:
+            gen_path.write_text("".join(self.rows))
+        params = TABLE_CSV_PARAMS["sentences_detailed"]
+        dfile = DataFile(resolve_path(path), **params)
+        Update([])._index({"sentences_detailed": {dfile}})
+
+        assert Index(dfile.path).exists()
+
+
+class TestCheckUrls:
+    paths = [
+        "/exports/per_language/eng/eng_sentences_detailed.tsv.bz2",
+        "/exports/per_language/fra/fra_sentences_detailed.tsv.bz2",
+    ]
+    mtime = 1590215100  # 2020-05-23 06:25:00 UTC
+
+    def _check(self, server, tmp_path):
+        urls = [server.url(p) for p in self.paths]
+        with patch("tatoebatools.update.version", Version(tmp_path)), patch(
+            "tatoebatools.update.validators", Validators(tmp_path)
+        ):
+            return _check_urls(urls)
+
+    def _save_versions(self, to_update, tmp_path):
+        vs = Version(tmp_path)
+        for url, dt in to_update.items():
+            vs[url.rsplit("/", 1)[-1].split(".")[0]] = dt
+
+    def test_no_local_version(self, tmp_path):
+        files = {p: b"foo" for p in self.paths}
+        with FileServer(files) as server:
+            to_update = self._check(server, tmp_path)
+
+        assert sorted(to_update) == [server.url(p) for p in self.paths]
+        assert set(to_update.values()) == {datetime(2020, 5, 23, 6, 25)}
+        assert server.count("GET") == 0
+        assert server.count("HEAD") == 2
+
+    def test_not_modified(self, tmp_path):
+        files = {p: b"foo" for p in self.paths}
+        with FileServer(files) as server:
+            self._save_versions(self._check(server, tmp_path), tmp_path)
+            to_update = self._check(server, tmp_path)
+            headers = server.requests[-1][2]
+
+        assert to_update == {}
+        assert "If-None-Match" in headers
+        assert "If-Modified-Since" in headers
+
+    def test_conditions_ignored(self, tmp_path):
+        files = {p: b"foo" for p in self.paths}
+        with FileServer(files, conditional=False) as server:
+            self._save_versions(self._check(server, tmp_path), tmp_path)
+            to_update = self._check(server, tmp_path)
+
+        assert to_update == {}
+
+    def test_modified(self, tmp_path):
+        files = {p: b"foo" for p in self.paths}
+        with FileServer(files) as server:
+            self._save_versions(self._check(server, tmp_path), tmp_path)
+            server.set_file(self.paths[0], b"bar", mtime=self.mtime + 604800)
+            to_update = self._check(server, tmp_path)
+
+        assert to_update == {
+            server.url(self.paths[0]): datetime(2020, 5, 30, 6, 25)
+        }
+
+    def test_interrupted_update(self, tmp_path):
+        files = {p: b"foo" for p in self.paths}
+        with FileServer(files) as server:
+            self._save_versions(self._check(server, tmp_path), tmp_path)
+            server.set_file(self.paths[0], b"bar", mtime=self.mtime + 604800)
+            # the new version has not been downloaded
+            self._check(server, tmp_path)
+            to_update = self._check(server, tmp_path)
+
+        assert list(to_update) == [server.url(self.paths[0])]
+
+    def test_not_available(self, tmp_path):
+        with FileServer({self.paths[0]: b"foo"}) as server:
+            to_update = self._check(server, tmp_path)
+
+        assert list(to_update) == [server.url(self.paths[0])]
+
+    def test_saved_once(self, tmp_path):
+        files = {p: b"foo" for p in self.paths}
+        vs = Version(tmp_path)
+        vds = Validators(tmp_path)
+        with FileServer(files) as server:
+            self._save_versions(self._check(server, tmp_path), tmp_path)
+            vs.refresh()
+            urls = [server.url(p) for p in self.paths]
+            with patch("tatoebatools.update.version", vs), patch(
+                "tatoebatools.update.validators", vds
+            ):
+                with patch.object(
+                    vs, "_save", wraps=vs._save
+                ) as m_vs_save, patch.object(
+                    vds, "_save", wraps=vds._save
+                ) as m_vds_save:
+                    _check_urls(urls)
+
+        assert m_vs_save.call_count == 1
+        assert m_vds_save.call_count == 1
+
+
+class TestCheckUpdates:
+    url = (
+        "https://downloads.tatoeba.org/exports/per_language/eng/"
+        "eng_sentences_detailed.tsv.bz2"
+    )
+    now = datetime(2020, 5, 25, 12, 0)
+
+    def _check(self, version, max_age):
+        with patch("tatoebatools.update.version", version), patch(
+            "tatoebatools.update._check_urls", return_value={}
+        ) as m_check, patch(
+            "tatoebatools.update.utcnow", return_value=self.now
+        ):
+            check_updates(["sentences_detailed"], ["eng"], max_age=max_age)
+
+        return m_check.call_args[0][0]
+
+    def _version(self, tmp_path, checked):
+        vs = Version(tmp_path)
+        vs["eng_sentences_detailed"] = datetime(2020, 5, 23, 6, 25)
+        vs.set_checked("eng_sentences_detailed", checked)
+        return vs
+
+    def test_never_checked(self, tmp_path):
+        assert self._check(Version(tmp_path), 3600) == [self.url]
+
+    def test_recently_checked(self, tmp_path):
+        vs = self._version(tmp_path, self.now - timedelta(minutes=30))
+
+        assert self._check(vs, 3600) == []
+        assert self._check(vs, 600) == [self.url]
+        assert self._check(vs, 0) == [self.url]
+
+    def test_before_next_export(self, tmp_path):
+        vs = self._version(tmp_path, datetime(2020, 5, 23, 8, 0))
+
+        assert self._check(vs, "export") == []
+
+    def test_after_next_export(self, tmp_path):
+        vs = self._version(tmp_path, datetime(2020, 5, 23, 8, 0))
+        now = datetime(2020, 5, 30, 7, 0)
+        with patch.object(self, "now", now):
+            assert self._check(vs, "export") == [self.url]
+            # the next export is late
+            vs.set_checked("eng_sentences_detailed", now)
+            assert self._check(vs, "export") == []
+
+    def test_check_recorded(self, tmp_path):
+        vs = Version(tmp_path)
+        vs["foo"] = datetime(2020, 5, 23, 6, 25)
+        with FileServer({"/foo.tsv.bz2": b"foo"}) as server:
+            with patch("tatoebatools.update.version", vs), patch(
+                "tatoebatools.update.validators", Validators(tmp_path)
+            ):
+                _check_urls([server.url("/foo.tsv.bz2")])
+
+        assert vs.get_checked("foo") is not None
+        assert Version(tmp_path).get_checked("foo") == vs.get_checked("foo")
+
+    def test_check_recorded_once_fetched(self, tmp_path):
+        path = "/exports/per_language/eng/eng_sentences_detailed.tsv.bz2"
+        stem = "eng_sentences_detailed"
+        data = bz2.compress(b"1\teng\tfoo\tbob\t\\N\t\\N\n")
+        vs = Version(tmp_path)
+        with FileServer({path: data}) as server:
+            url = server.url(path)
+            with patch("tatoebatools.update.version", vs), patch(
+                "tatoebatools.update.validators", Validators(tmp_path)
+            ), patch("tatoebatools.download.version", vs):
+                online_vs = _check_urls([url])[url]
+                # the newer version is not checked before it is fetched
+                assert vs.get_checked(stem) is None
+
+                server.cut_after = 10
+                dl = Download(url, online_vs, data_dir=tmp_path)
+                assert not dl.fetch(verbose=False)
+                assert vs.get_checked(stem) is None
+                assert _check_urls([url]) == {url: online_vs}
+
+                assert dl.fetch(verbose=False)
+                assert vs.get_checked(stem) is not None
+                assert _check_urls([url]) == {}
+
+
+class TestBackgroundUpdates:
+    def test_pending_update_shared(self):
+        release = threading.Event()
+        updates = BackgroundUpdates()
+        with patch("tatoebatools.update.Update.run") as m_run:
+            m_run.side_effect = lambda **kwargs: release.wait(5)
+            future = updates.submit(Update([("links", ["eng", "fra"])]))
+            same = updates.submit(Update([("links", ["eng", "fra"])]))
+            other = updates.submit(Update([("links", ["fra", "eng"])]))
+            assert updates.running
+            assert not updates.wait(timeout=0.01)
+
+            release.set()
+            assert updates.wait(timeout=5)
+
+        assert future is same
+        assert future is not other
+        assert m_run.call_count == 2
+        assert not updates.running
+
+    def test_failed_update(self):
+        updates = BackgroundUpdates()
+        with patch("tatoebatools.update.Update.run", side_effect=OSError):
+            future = updates.submit(Update([]))
+            assert updates.wait(timeout=5)
+
+        assert isinstance(future.exception(), OSError)
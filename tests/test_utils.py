@@ -1,162 +1,284 @@
-import sys
-from pathlib import Path
-from tarfile import ReadError
+import bz2
+import os
+import random
+import stat
+import tarfile
+from io import BytesIO
 from unittest.mock import patch
 
+import requests
+from pytest import raises
 from requests.exceptions import RequestException
 
-from tatoebatools.utils import decompress, download, extract, fetch
+from tatoebatools.generation import resolve_path
+from tatoebatools.utils import Digest, download, fetch, open_atomically
+
+from .server import FileServer
+
+
+def _get_rows(nb_rows=20000, seed=0):
+    rng = random.Random(seed)
+    return b"".join(
+        b"%d\teng\t%016x\n" % (i, rng.getrandbits(64))
+        for i in range(nb_rows)
+    )
 
 
 class TestDownload:
-    from_url = "https://foobar.com/myfile.tar.bz2"
-    to_dir = "/this/is/my/dir"
-    to_path = "/this/is/my/dir/myfile.tar.bz2"
-    data = [b"B", b"Z", b"&", b"S", b"Y"]
-
-    @patch("builtins.open")
-    @patch("tatoebatools.utils.requests.get")
-    @patch("tatoebatools.utils.Path.mkdir")
-    def test_download_ok(self, m_mkdir, m_get, m_open):
-        m_r = m_get.return_value.__enter__.return_value
-        m_r.status_code = 200
-        m_r.iter_content.return_value = iter(self.data)
-        m_f = m_open.return_value.__enter__.return_value
-        dl = download(self.from_url, self.to_dir)
-
-        m_mkdir.assert_called_once_with(parents=True, exist_ok=True)
-        m_get.assert_called_once_with(self.from_url, stream=True)
-        m_open.assert_called_once_with(Path(self.to_path), "wb")
-        assert [x[0][0] for x in m_f.write.call_args_list] == self.data
-        assert dl == Path(self.to_path)
-
-    @patch("tatoebatools.utils.requests.get")
-    @patch("tatoebatools.utils.Path.mkdir")
-    def test_download_not_ok(self, m_mkdir, m_get):
-        m_get.side_effect = RequestException
-        dl = download(self.from_url, self.to_dir)
+    data = bz2.compress(_get_rows())
+    path = "/exports/myfile.tar.bz2"
+
+    def test_download_ok(self, tmp_path):
+        with FileServer({self.path: self.data}) as server:
+            dl = download(server.url(self.path), tmp_path, verbose=False)
+
+        assert dl == tmp_path.joinpath("myfile.tar.bz2")
+        assert dl.read_bytes() == self.data
+        assert [p.name for p in tmp_path.iterdir()] == [dl.name]
 
-        assert m_get.call_count == 1
+    def test_download_not_ok(self, tmp_path):
+        with FileServer() as server:
+            dl = download(server.url(self.path), tmp_path, verbose=False)
+
+        assert server.count("GET") == 1
         assert dl is None
 
+    def test_resumed_download(self, tmp_path):
+        with FileServer({self.path: self.data}) as server:
+            server.cut_after = 100000
+            assert download(server.url(self.path), tmp_path) is None
+            part_path = tmp_path.joinpath("myfile.tar.bz2.part")
+            part_size = part_path.stat().st_size
 
-class TestDecompress:
-    in_path = "/my/path/myfile.ext.bz2"
-    out_path = "/my/path/myfile.ext"
-
-    @patch("tatoebatools.utils.Path.unlink")
-    @patch("builtins.open")
-    @patch("tatoebatools.utils.bz2.open")
-    def test_with_compressed_file(self, m_bz2_open, m_open, m_unlink):
-        m_in_f = m_bz2_open.return_value.__enter__.return_value
-        m_out_f = m_open.return_value.__enter__.return_value
-        out_path = decompress(self.in_path)
-
-        m_bz2_open.assert_called_once_with(Path(self.in_path))
-        m_open.assert_called_once_with(Path(self.out_path), "wb")
-        assert m_in_f.read.call_count == 1
-        assert m_out_f.write.call_count == 1
-        assert m_unlink.call_count == 1
-        assert out_path == Path(self.out_path)
-
-    @patch("builtins.open")
-    @patch("tatoebatools.utils.bz2.open", side_effect=FileNotFoundError)
-    def test_with_no_file(self, m_bz2_open, m_open):
-        out_path = decompress(self.in_path)
-
-        m_bz2_open.assert_called_once_with(Path(self.in_path))
-        assert out_path is None
-
-    @patch("builtins.open")
-    @patch("tatoebatools.utils.bz2.open", side_effect=OSError)
-    def test_with_not_compressed_file(self, m_bz2_open, m_open):
-        out_path = decompress(self.in_path)
-
-        m_bz2_open.assert_called_once_with(Path(self.in_path))
-        assert out_path is None
-
-
-class TestExtract:
-    archive_path = "/my/dir/arx_filename.tar"
-    out_dir = "/my/dir"
-    out_filenames = ["foobar.ext", "foo.bar"]
-    out_filepaths = ["/my/dir/foobar.ext", "/my/dir/foo.bar"]
-
-    @patch("tatoebatools.utils.Path.unlink")
-    @patch("tatoebatools.utils.tarfile.open")
-    def test_with_archive(self, m_tar_open, m_unlink):
-        m_tar = m_tar_open.return_value.__enter__.return_value
-        m_tar.getnames.return_value = self.out_filenames
-
-        out_filepaths = extract(self.archive_path)
-
-        m_tar_open.assert_called_once_with(Path(self.archive_path))
-
-        if sys.version_info.major == 3 and sys.version_info.minor < 12:
-            m_tar.extractall.assert_called_once_with(
-                Path(self.out_dir), None, numeric_owner=False
-            )
-        else:
-            m_tar.extractall.assert_called_once_with(
-                Path(self.out_dir), None, numeric_owner=False, filter="data"
-            )
-        assert m_tar.getnames.call_count == 1
-        assert m_unlink.call_count == 1
-        assert out_filepaths == [Path(fp) for fp in self.out_filepaths]
-
-    @patch("tatoebatools.utils.tarfile.open")
-    def test_without_archive(self, m_tar_open):
-        m_tar = m_tar_open.return_value.__enter__.return_value
-        m_tar.extractall.side_effect = ReadError
-
-        out_filepaths = extract(self.archive_path)
-
-        m_tar_open.assert_called_once_with(Path(self.archive_path))
-
-        if sys.version_info.major == 3 and sys.version_info.minor < 12:
-            m_tar.extractall.assert_called_once_with(
-                Path(self.out_dir), None, numeric_owner=False
-            )
-        else:
-            m_tar.extractall.assert_called_once_with(
-                Path(self.out_dir), None, numeric_owner=False, filter="data"
-            )
-        assert out_filepaths == []
-
-    @patch("tatoebatools.utils.tarfile.open", side_effect=FileNotFoundError)
-    def test_without_file(self, m_tar_open):
-        out_filepaths = extract(self.archive_path)
-
-        assert out_filepaths == []
+            dl = download(server.url(self.path), tmp_path, verbose=False)
+            range_header = server.requests[-1][2]["Range"]
 
+        assert part_size > 0
+        assert range_header == f"bytes={part_size}-"
+        assert dl.read_bytes() == self.data
+        assert [p.name for p in tmp_path.iterdir()] == [dl.name]
 
-class TestFetch:
-    @patch("tatoebatools.utils.extract")
-    @patch("tatoebatools.utils.decompress")
-    @patch("tatoebatools.utils.download")
-    def test_with_tar_bz2_file(self, m_download, m_decompress, m_extract):
-        m_download.return_value = Path("/mydir/file.tar.bz2")
-        m_decompress.return_value = Path("/mydir/file.tar")
-        m_extract.return_value = [Path("/mydir/file.ext")]
 
-        assert fetch("any_url", "any_dir") == [Path("/mydir/file.ext")]
+class TestOpenAtomically:
+    def test_written(self, tmp_path):
+        path = tmp_path.joinpath("foo.json")
+        umask = os.umask(0o002)
+        try:
+            with open_atomically(path) as f:
+                f.write("foo")
+        finally:
+            os.umask(umask)
+
+        assert path.read_text() == "foo"
+        assert stat.S_IMODE(path.stat().st_mode) == 0o664
+        assert [p.name for p in tmp_path.iterdir()] == ["foo.json"]
 
-    @patch("tatoebatools.utils.decompress")
-    @patch("tatoebatools.utils.download")
-    def test_with_tsv_bz2_file(self, m_download, m_decompress):
-        m_download.return_value = Path("/mydir/file.tsv.bz2")
-        m_decompress.return_value = Path("/mydir/file.tsv")
+    def test_failed_write(self, tmp_path):
+        path = tmp_path.joinpath("foo.json")
+        path.write_text("foo")
+        with raises(ValueError):
+            with open_atomically(path) as f:
+                f.write("bar")
+                raise ValueError
 
-        assert fetch("any_url", "any_dir") == [Path("/mydir/file.tsv")]
+        assert path.read_text() == "foo"
+        assert [p.name for p in tmp_path.iterdir()] == ["foo.json"]
 
-    @patch("tatoebatools.utils.download")
-    def test_with_csv_file(self, m_download):
-        m_download.return_value = Path("/mydir/file.csv")
 
-        assert fetch("any_url", "any_dir") == [Path("/mydir/file.csv")]
+class TestFetch:
+    rows = b"1\teng\tfoo\n2\tfra\tbar\n"
 
-    @patch("tatoebatools.utils.download")
-    def test_with_failed_download(self, m_download):
-        m_download.return_value = None
+    @staticmethod
+    def _mock_response(m_get, data, chunk_size=7):
+        m_r = m_get.return_value.__enter__.return_value
+        m_r.headers = {"content-length": str(len(data))}
+        m_r.iter_content.return_value = iter(
+            [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+        )
+
+    @staticmethod
+    def _tar_bz2(members):
+        fb = BytesIO()
+        with tarfile.open(fileobj=fb, mode="w") as tar:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, BytesIO(data))
+
+        return bz2.compress(fb.getvalue())
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_with_tar_bz2_file(self, m_get, tmp_path):
+        members = {"file.ext": self.rows, "other.ext": self.rows * 2}
+        self._mock_response(m_get, self._tar_bz2(members))
+        out_paths = fetch("https://foo.bar/file.tar.bz2", tmp_path)
+
+        assert out_paths == [resolve_path(tmp_path / fn) for fn in members]
+        for fn, data in members.items():
+            assert resolve_path(tmp_path / fn).read_bytes() == data
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "generations",
+            "generations.json",
+            "generations.json.lock",
+        ]
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_with_tsv_bz2_file(self, m_get, tmp_path):
+        self._mock_response(m_get, bz2.compress(self.rows))
+        out_paths = fetch("https://foo.bar/file.tsv.bz2", tmp_path)
+
+        assert out_paths == [resolve_path(tmp_path / "file.tsv")]
+        assert out_paths[0].parent.parent == tmp_path / "generations"
+        assert out_paths[0].read_bytes() == self.rows
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_with_multistream_bz2_file(self, m_get, tmp_path):
+        data = bz2.compress(self.rows) + bz2.compress(self.rows)
+        self._mock_response(m_get, data)
+        fetch("https://foo.bar/file.tsv.bz2", tmp_path)
+
+        assert resolve_path(tmp_path / "file.tsv").read_bytes() == (
+            self.rows * 2
+        )
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_with_csv_file(self, m_get, tmp_path):
+        self._mock_response(m_get, self.rows)
+        out_paths = fetch("https://foo.bar/file.csv", tmp_path)
+
+        assert out_paths == [resolve_path(tmp_path / "file.csv")]
+        assert out_paths[0].read_bytes() == self.rows
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_previous_version_kept_as_old(self, m_get, tmp_path):
+        tmp_path.joinpath("file.tsv").write_bytes(b"old")
+        self._mock_response(m_get, bz2.compress(self.rows))
+        fetch("https://foo.bar/file.tsv.bz2", tmp_path)
+
+        assert tmp_path.joinpath("file_old.tsv").read_bytes() == b"old"
+        assert resolve_path(tmp_path / "file.tsv").read_bytes() == self.rows
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_previous_generation_kept_as_old(self, m_get, tmp_path):
+        self._mock_response(m_get, bz2.compress(b"old"))
+        fetch("https://foo.bar/file.tsv.bz2", tmp_path)
+        with open(resolve_path(tmp_path / "file.tsv"), "rb") as reader:
+            self._mock_response(m_get, bz2.compress(self.rows))
+            fetch("https://foo.bar/file.tsv.bz2", tmp_path)
+            # the data opened before the update is unchanged
+            assert reader.read() == b"old"
+        self._mock_response(m_get, bz2.compress(self.rows * 2))
+        fetch("https://foo.bar/file.tsv.bz2", tmp_path)
+
+        assert resolve_path(tmp_path / "file_old.tsv").read_bytes() == (
+            self.rows
+        )
+        assert resolve_path(tmp_path / "file.tsv").read_bytes() == (
+            self.rows * 2
+        )
+        # the first generation is not referenced anymore
+        assert len(list(tmp_path.joinpath("generations").iterdir())) == 2
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_same_file_not_written_again(self, m_get, tmp_path):
+        data = bz2.compress(self.rows)
+        digest = Digest()
+        self._mock_response(m_get, data)
+        fetch("https://foo.bar/file.tsv.bz2", tmp_path, digest=digest)
+        previous = {"download_size": digest.size, "hash": digest.hexdigest()}
+        self._mock_response(m_get, data)
+        out_paths = fetch(
+            "https://foo.bar/file.tsv.bz2", tmp_path, previous=previous
+        )
+
+        assert digest.size == len(data)
+        assert out_paths is None
+        assert len(list(tmp_path.joinpath("generations").iterdir())) == 1
+        assert not list(tmp_path.glob("*.part*"))
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_changed_file_of_same_size(self, m_get, tmp_path):
+        digest = Digest()
+        self._mock_response(m_get, self.rows)
+        fetch("https://foo.bar/file.csv", tmp_path, digest=digest)
+        previous = {"download_size": digest.size, "hash": digest.hexdigest()}
+        new_rows = self.rows.replace(b"foo", b"baz")
+        self._mock_response(m_get, new_rows)
+        out_paths = fetch(
+            "https://foo.bar/file.csv", tmp_path, previous=previous
+        )
+
+        assert out_paths[0].read_bytes() == new_rows
+        assert not list(tmp_path.glob("*.part*"))
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_with_truncated_file(self, m_get, tmp_path):
+        tmp_path.joinpath("file.tsv").write_bytes(b"old")
+        self._mock_response(m_get, bz2.compress(self.rows * 100)[:-20])
+
+        assert fetch("https://foo.bar/file.tsv.bz2", tmp_path) == []
+        assert resolve_path(tmp_path / "file.tsv").read_bytes() == b"old"
+        assert not list(tmp_path.joinpath("generations").iterdir())
+
+    @patch("tatoebatools.utils.default_session.get")
+    def test_with_failed_download(self, m_get, tmp_path):
+        m_get.side_effect = RequestException
 
-        assert fetch("any_url", "any_dir") == []
+        assert fetch("https://foo.bar/file.tsv.bz2", tmp_path) == []
+
+
+class TestResumableFetch:
+    rows = _get_rows()
+    path = "/exports/per_language/eng/eng_sentences.tsv.bz2"
+
+    def _fetch_interrupted(self, server, tmp_path, cut_after=100000):
+        server.cut_after = cut_after
+        assert fetch(server.url(self.path), tmp_path, verbose=False) == []
+        assert not tmp_path.joinpath("eng_sentences.tsv").exists()
+        part_path = tmp_path.joinpath("eng_sentences.tsv.bz2.part")
+        self.part_size = part_path.stat().st_size
+
+        return fetch(server.url(self.path), tmp_path, verbose=False)
+
+    def test_resume_with_range_request(self, tmp_path):
+        with FileServer({self.path: bz2.compress(self.rows)}) as server:
+            out_paths = self._fetch_interrupted(server, tmp_path)
+            last_headers = server.requests[-1][2]
+
+        assert self.part_size > 0
+        assert last_headers["Range"] == f"bytes={self.part_size}-"
+        assert out_paths == [resolve_path(tmp_path / "eng_sentences.tsv")]
+        assert out_paths[0].read_bytes() == self.rows
+        assert not list(tmp_path.glob("*.part*"))
+
+    def test_server_refusing_ranges(self, tmp_path):
+        files = {self.path: bz2.compress(self.rows)}
+        with FileServer(files, accept_ranges=False) as server:
+            out_paths = self._fetch_interrupted(server, tmp_path)
+
+        assert out_paths[0].read_bytes() == self.rows
+        assert not list(tmp_path.glob("*.part*"))
+
+    def test_file_changed_in_between(self, tmp_path):
+        new_rows = self.rows.replace(b"foo", b"baz")
+        with FileServer({self.path: bz2.compress(self.rows)}) as server:
+            server.cut_after = 100000
+            fetch(server.url(self.path), tmp_path, verbose=False)
+            server.set_file(self.path, bz2.compress(new_rows), mtime=10**9)
+            out_paths = fetch(server.url(self.path), tmp_path, verbose=False)
+
+        assert out_paths[0].read_bytes() == new_rows
+
+    def test_complete_partial_file(self, tmp_path):
+        data = bz2.compress(self.rows)
+        with FileServer({self.path: data}) as server:
+            server.cut_after = len(data)
+            # interrupted after the last byte, before its processing
+            with patch("tatoebatools.utils.write_stream") as m_write:
+                m_write.side_effect = requests.exceptions.ConnectionError
+                fetch(server.url(self.path), tmp_path, verbose=False)
+            part_path = tmp_path.joinpath("eng_sentences.tsv.bz2.part")
+            part_path.write_bytes(data)
+            out_paths = fetch(server.url(self.path), tmp_path, verbose=False)
+
+        assert out_paths[0].read_bytes() == self.rows
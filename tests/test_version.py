@@ -1,8 +1,10 @@
+import json
+import threading
 from datetime import datetime
 from unittest.mock import patch
 
 import pytest
-from tatoebatools.version import Version
+from tatoebatools.version import Version, _dump_atomically
 
 
 class TestVersion:
@@ -33,27 +35,22 @@ class TestVersion:
         assert version["foo"] == datetime(2020, 5, 22, 11, 51, 0)
         assert version["bar"] is None
 
-    @patch("tatoebatools.version.json.dump")
-    @patch("tatoebatools.version.json.load")
-    @patch("builtins.open")
-    def test_item_setter(self, m_open, m_load, m_dump):
-        m_load.return_value = {"foo": "2000-01-01 00:00:00"}
-        version = Version()
+    def test_item_setter(self, tmp_path):
+        tmp_path.joinpath("versions.json").write_text(
+            json.dumps({"foo": "2000-01-01 00:00:00"})
+        )
+        version = Version(tmp_path)
 
         # set version with a datetime instance
         version["foobar"] = datetime(2020, 5, 22, 23, 51, 0)
-        assert m_open.call_count == 2
-        assert m_dump.call_count == 1
-        assert m_dump.call_args[0][0] == {
+        assert json.loads(version.path.read_text()) == {
             "foobar": "2020-05-22 23:51:00",
             "foo": "2000-01-01 00:00:00",
         }
 
         # replace a version
         version["foo"] = datetime(2019, 11, 3, 0, 0, 0)
-        assert m_open.call_count == 3
-        assert m_dump.call_count == 2
-        assert m_dump.call_args[0][0] == {
+        assert json.loads(version.path.read_text()) == {
             "foobar": "2020-05-22 23:51:00",
             "foo": "2019-11-03 00:00:00",
         }
@@ -61,3 +58,119 @@ class TestVersion:
         # set version with string instead of datetime instance
         with pytest.raises(AttributeError):
             version["foobar"] = "foobar"
+
+    def test_item_setter_merges_other_processes(self, tmp_path):
+        version = Version(tmp_path)
+        other_version = Version(tmp_path)
+        version["foo"] = datetime(2020, 5, 22, 23, 51, 0)
+        other_version["bar"] = datetime(2020, 5, 23, 6, 25, 0)
+
+        assert json.loads(version.path.read_text()) == {
+            "foo": "2020-05-22 23:51:00",
+            "bar": "2020-05-23 06:25:00",
+        }
+        version.refresh()
+        assert version["bar"] == datetime(2020, 5, 23, 6, 25, 0)
+
+    def test_checked(self, tmp_path):
+        version = Version(tmp_path)
+        version["foo"] = datetime(2020, 5, 22, 11, 51, 0)
+        assert version.get_checked("foo") is None
+
+        version.set_checked("foo", datetime(2020, 5, 23, 8, 0, 0))
+        version["foo"] = datetime(2020, 5, 23, 6, 25, 0)
+        version.set_checked("bar", datetime(2020, 5, 23, 8, 0, 0))
+
+        version = Version(tmp_path)
+        assert version["foo"] == datetime(2020, 5, 23, 6, 25, 0)
+        assert version.get_checked("foo") == datetime(2020, 5, 23, 8, 0, 0)
+        assert version["bar"] is None
+        assert version.get_checked("bar") == datetime(2020, 5, 23, 8, 0, 0)
+
+    def test_transaction_single_write(self, tmp_path):
+        version = Version(tmp_path)
+        with patch(
+            "tatoebatools.version._dump_atomically",
+            wraps=_dump_atomically,
+        ) as m_dump:
+            with version.transaction():
+                for i in range(10):
+                    version[f"foo{i}"] = datetime(2020, 5, 22, 11, 51, 0)
+                    version.set_checked(f"foo{i}", datetime(2020, 5, 23))
+                with version.transaction():  # nested
+                    version["bar"] = datetime(2020, 5, 22, 11, 51, 0)
+                assert m_dump.call_count == 0
+                assert version["foo9"] == datetime(2020, 5, 22, 11, 51, 0)
+
+        assert m_dump.call_count == 1
+        assert len(Version(tmp_path)) == 11
+
+    def test_transaction_merges_other_processes(self, tmp_path):
+        version = Version(tmp_path)
+        with version.transaction():
+            version["foo"] = datetime(2020, 5, 22, 11, 51, 0)
+            Version(tmp_path)["bar"] = datetime(2020, 5, 23, 6, 25, 0)
+
+        assert version["bar"] == datetime(2020, 5, 23, 6, 25, 0)
+        assert len(Version(tmp_path)) == 2
+
+    def test_transaction_rolled_back(self, tmp_path):
+        version = Version(tmp_path)
+        version["foo"] = datetime(2020, 5, 22, 11, 51, 0)
+        with pytest.raises(ValueError):
+            with version.transaction():
+                version["foo"] = datetime(2020, 5, 23, 6, 25, 0)
+                version["bar"] = datetime(2020, 5, 23, 6, 25, 0)
+                raise ValueError
+
+        assert version["foo"] == datetime(2020, 5, 22, 11, 51, 0)
+        assert version["bar"] is None
+        assert len(Version(tmp_path)) == 1
+
+    def test_transactions_by_thread(self, tmp_path):
+        version = Version(tmp_path)
+        entered = threading.Event()
+        written = threading.Event()
+
+        def write():
+            entered.wait(5)
+            version["links"] = datetime(2020, 5, 23, 6, 25, 0)
+            written.set()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        with pytest.raises(ValueError):
+            with version.transaction():
+                version["foo"] = datetime(2020, 5, 23, 6, 25, 0)
+                entered.set()
+                assert written.wait(5)
+                # not committed with the transaction of another thread
+                assert "foo" not in json.loads(version.path.read_text())
+                raise ValueError
+        thread.join()
+
+        assert version["links"] == datetime(2020, 5, 23, 6, 25, 0)
+        assert version["foo"] is None
+        assert Version(tmp_path)["links"] == datetime(2020, 5, 23, 6, 25, 0)
+
+    def test_metadata(self, tmp_path):
+        version = Version(tmp_path)
+        version["foo"] = datetime(2020, 5, 22, 11, 51, 0)
+        version.set_metadata("foo", size=42, rows=3)
+        version.set_checked("foo", datetime(2020, 5, 23, 8, 0, 0))
+
+        version = Version(tmp_path)
+        assert version["foo"] == datetime(2020, 5, 22, 11, 51, 0)
+        assert version.get_metadata("foo") == {"size": 42, "rows": 3}
+        assert version.get_metadata("bar") == {}
+
+    def test_parsed_once(self, tmp_path):
+        version = Version(tmp_path)
+        version["foo"] = datetime(2020, 5, 22, 11, 51, 0)
+        version["foo"]
+        with patch("tatoebatools.version.datetime") as m_datetime:
+            m_datetime.strptime.side_effect = datetime.strptime
+            for _ in range(3):
+                version["foo"]
+
+        assert m_datetime.strptime.call_count == 0